@@ -0,0 +1,7 @@
+"""Statistics shared by the benchmark reports: vectorized bootstrap CIs and paired permutation tests."""
+
+from .bootstrap import (DEFAULT_RESAMPLES, bootstrap_cell_means, cell_layout, combine_cells, percentile_ci,
+                        permutation_p_values, sign_flip_cell_sums)
+
+__all__ = ['DEFAULT_RESAMPLES', 'bootstrap_cell_means', 'cell_layout', 'combine_cells', 'percentile_ci',
+           'permutation_p_values', 'sign_flip_cell_sums']
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Vectorized bootstrap confidence intervals and paired permutation tests.
+
+Observations are grouped into cells (e.g. category x API x complexity level) by an
+integer code. All cells are resampled together: a chunk of resamples is a single
+(resamples x observations) matrix, rows are sorted by cell, and per-cell sums are
+reduced with np.add.reduceat. Coarser groupings reuse the same resamples by
+combining cell statistics weighted by cell size, i.e. a bootstrap stratified by
+the finest cells, so every grouping of a table costs one pass over the data.
+
+Chunks are seeded independently from one SeedSequence, so results depend only on
+the seed (not on the number of threads). A chunk holds a few temporaries of its
+size (uniform draws, offsets, gathered values: ~24 bytes per element), so the
+number of chunks running at once is capped by MAX_IN_FLIGHT_ELEMENTS rather
+than by the core count alone.
+"""
+
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_RESAMPLES = 10000
+MAX_CHUNK_ELEMENTS = 1 << 22
+MAX_IN_FLIGHT_ELEMENTS = 1 << 24  # ~400 MB of chunk temporaries across all threads
+
+
+def cell_layout(codes):
+    """Sort order, distinct cell codes, start offsets and sizes of the cells in `codes`"""
+    codes = np.asarray(codes)
+    order = np.argsort(codes, kind='stable')
+    cells, starts, sizes = np.unique(codes[order], return_index=True, return_counts=True)
+    return order, cells, starts, sizes
+
+
+def _run_chunks(n_resamples, n_obs, seed, n_jobs, chunk_fn):
+    """Evaluate chunk_fn(rng, num_resamples) over chunks of resamples and stack the results"""
+    chunk = max(1, MAX_CHUNK_ELEMENTS // max(n_obs, 1))
+    chunk_elements = chunk * max(n_obs, 1)
+    chunk_sizes = [min(chunk, n_resamples - start) for start in range(0, n_resamples, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+
+    def run(i):
+        return chunk_fn(np.random.default_rng(seeds[i]), chunk_sizes[i])
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    n_jobs = min(n_jobs, max(1, MAX_IN_FLIGHT_ELEMENTS // chunk_elements))
+    if n_jobs == 1 or len(chunk_sizes) == 1:
+        results = [run(i) for i in range(len(chunk_sizes))]
+    else:
+        # NumPy releases the GIL for random generation, gathers and reductions
+        with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+            results = list(pool.map(run, range(len(chunk_sizes))))
+    return np.concatenate(results, axis=0)
+
+
+def bootstrap_cell_means(values, codes, n_resamples=DEFAULT_RESAMPLES, seed=0, n_jobs=None):
+    """
+    Bootstrap distribution of the mean of every cell.
+
+    Returns (cells, sizes, resampled) where resampled[b, k] is the mean of cell
+    cells[k] in resample b.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    order, cells, starts, sizes = cell_layout(codes)
+    sorted_values = values[order]
+
+    # Every row draws an index uniformly within its own cell
+    row_start = np.repeat(starts, sizes)
+    row_size = np.repeat(sizes, sizes)
+
+    def chunk_fn(rng, num):
+        offsets = (rng.random((num, len(sorted_values))) * row_size).astype(np.int64)
+        np.minimum(offsets, row_size - 1, out=offsets)
+        return np.add.reduceat(sorted_values[row_start + offsets], starts, axis=1) / sizes
+
+    resampled = _run_chunks(n_resamples, len(sorted_values), seed, n_jobs, chunk_fn)
+    return cells, sizes, resampled
+
+
+def sign_flip_cell_sums(differences, codes, n_resamples=DEFAULT_RESAMPLES, seed=0, n_jobs=None):
+    """
+    Null distribution of per-cell sums of paired differences under random sign flips.
+
+    Returns (cells, sizes, observed_sums, null_sums) where null_sums has shape
+    (n_resamples, len(cells)).
+    """
+    differences = np.asarray(differences, dtype=np.float64)
+    order, cells, starts, sizes = cell_layout(codes)
+    sorted_diffs = differences[order]
+    observed_sums = np.add.reduceat(sorted_diffs, starts)
+
+    def chunk_fn(rng, num):
+        # One random bit per pair: sum(sign * d) = 2 * sum(bit * d) - sum(d)
+        bits = np.unpackbits(rng.integers(0, 256, size=(num, (len(sorted_diffs) + 7) // 8), dtype=np.uint8),
+                             axis=1, count=len(sorted_diffs))
+        return 2 * np.add.reduceat(bits * sorted_diffs, starts, axis=1) - observed_sums
+
+    null_sums = _run_chunks(n_resamples, len(sorted_diffs), seed, n_jobs, chunk_fn)
+    return cells, sizes, observed_sums, null_sums
+
+
+def combine_cells(cell_values, sizes, cell_groups, weighted_mean=True):
+    """
+    Aggregate per-cell columns into groups of cells.
+
+    cell_values has shape (..., num_cells); cell_groups maps each cell to a group id
+    in [0, num_groups). With weighted_mean, cell means are combined weighted by cell
+    size; otherwise cell values (e.g. sums) are added.
+    """
+    cell_groups = np.asarray(cell_groups)
+    num_groups = int(cell_groups.max()) + 1 if len(cell_groups) else 0
+    weights = np.zeros((len(cell_groups), num_groups))
+    weights[np.arange(len(cell_groups)), cell_groups] = sizes if weighted_mean else 1.0
+    group_values = np.asarray(cell_values) @ weights
+    if weighted_mean:
+        group_values = group_values / weights.sum(axis=0)
+    return group_values
+
+
+def percentile_ci(resampled, confidence=0.95):
+    """Percentile confidence interval of each column of a resampled statistic"""
+    alpha = (1.0 - confidence) / 2.0
+    low, high = np.quantile(resampled, [alpha, 1.0 - alpha], axis=0)
+    return low, high
+
+
+def permutation_p_values(observed, null):
+    """Two-sided p-values of observed statistics against a (resamples x statistics) null"""
+    exceed = (np.abs(null) >= np.abs(observed) - 1e-12).sum(axis=0)
+    return (exceed + 1.0) / (null.shape[0] + 1.0)
@@ -0,0 +1,5 @@
+"""Small helpers shared by the benchmark packages and scripts."""
+
+from .hashing import file_sha256
+
+__all__ = ['file_sha256']
@@ -0,0 +1,12 @@
+"""Content hashes of files, used to key caches by what a file holds rather than where it is."""
+
+import hashlib
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
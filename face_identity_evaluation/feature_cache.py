@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Content-addressed on-disk feature cache for face identity metrics.
+
+Features are keyed by the SHA-256 of the image file contents plus the identity
+of the model that produced them (checkpoint hash, architecture, preprocessing).
+Each model identity gets its own store: a flat memory-mapped array of vectors
+(`vectors.bin`) and a JSON index mapping content hashes to rows.
+
+Layout:
+    cache_dir/
+        paths.json                  # path -> [size, mtime_ns, sha256] memo
+        stores/<store_id>/meta.json # model key, dim, dtype, rows, last access
+        stores/<store_id>/vectors.bin
+
+Usage:
+    python feature_cache.py --cache_dir ./feature_cache info
+    python feature_cache.py --cache_dir ./feature_cache prune --max_size_gb 5
+    python feature_cache.py --cache_dir ./feature_cache prune --older_than_days 30
+    python feature_cache.py --cache_dir ./feature_cache clear [--store STORE_ID]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmark_utils import file_sha256
+
+
+def _write_json_atomic(path, data):
+    """Write JSON to a temp file and rename it over the target"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def model_store_id(model_key):
+    """Stable identifier for a model identity dict"""
+    encoded = json.dumps(model_key, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class FeatureStore:
+    """
+    Feature vectors for a single model identity, backed by a memory-mapped array.
+
+    Vectors are appended to vectors.bin before meta.json records them, and the
+    index is saved every `flush_every` puts. Rows a crash left in vectors.bin
+    without an index entry are cut off when the store is opened, so a crash
+    only loses the vectors appended since the last save.
+    """
+
+    def __init__(self, store_dir, model_key, dtype='float16', flush_every=16):
+        self.store_dir = store_dir
+        self.meta_path = os.path.join(store_dir, 'meta.json')
+        self.vectors_path = os.path.join(store_dir, 'vectors.bin')
+        os.makedirs(store_dir, exist_ok=True)
+
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r') as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {
+                'model': model_key,
+                'dtype': dtype,
+                'dim': None,
+                'num_rows': 0,
+                'rows': {},  # content hash -> [row, last_used]
+                'created': time.time()
+            }
+        self.dtype = np.dtype(self.meta['dtype'])
+        self.flush_every = flush_every
+        self._puts_since_flush = 0
+        self._mmap = None
+        self._dirty = False
+        self._truncate_unindexed_rows()
+
+    def _truncate_unindexed_rows(self):
+        """Drop vectors appended after the last saved index (left by a crash before flush)"""
+        if not os.path.exists(self.vectors_path):
+            return
+        expected = self.num_rows * (self.meta['dim'] or 0) * self.dtype.itemsize
+        if os.path.getsize(self.vectors_path) > expected:
+            with open(self.vectors_path, 'r+b') as f:
+                f.truncate(expected)
+
+    @property
+    def num_rows(self):
+        return self.meta['num_rows']
+
+    def size_bytes(self):
+        if not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path)
+
+    def last_used(self):
+        if not self.meta['rows']:
+            return self.meta.get('created', 0)
+        return max(last for _, last in self.meta['rows'].values())
+
+    def _vectors(self):
+        """Memory-mapped view of all stored vectors"""
+        if self._mmap is None and self.num_rows > 0:
+            self._mmap = np.memmap(self.vectors_path, dtype=self.dtype, mode='r',
+                                   shape=(self.num_rows, self.meta['dim']))
+        return self._mmap
+
+    def get(self, content_hashes):
+        """Return {hash: float32 vector} for cached hashes"""
+        found = {}
+        vectors = self._vectors()
+        now = time.time()
+        for content_hash in content_hashes:
+            entry = self.meta['rows'].get(content_hash)
+            if entry is None:
+                continue
+            found[content_hash] = np.array(vectors[entry[0]], dtype=np.float32)
+            entry[1] = now
+            self._dirty = True
+        return found
+
+    def put(self, features):
+        """Append {hash: vector} to the store, skipping hashes already present"""
+        new_items = [(h, v) for h, v in features.items()
+                     if v is not None and h not in self.meta['rows']]
+        if not new_items:
+            return
+
+        matrix = np.stack([np.asarray(v).reshape(-1) for _, v in new_items]).astype(self.dtype)
+        if self.meta['dim'] is None:
+            self.meta['dim'] = int(matrix.shape[1])
+        elif matrix.shape[1] != self.meta['dim']:
+            raise ValueError(f"Feature dim {matrix.shape[1]} does not match store dim {self.meta['dim']}")
+
+        with open(self.vectors_path, 'ab') as f:
+            f.write(matrix.tobytes())
+
+        now = time.time()
+        for offset, (content_hash, _) in enumerate(new_items):
+            self.meta['rows'][content_hash] = [self.num_rows + offset, now]
+        self.meta['num_rows'] += len(new_items)
+
+        self._mmap = None  # Re-map on next read to include appended rows
+        self._dirty = True
+        self._puts_since_flush += 1
+        if self.flush_every and self._puts_since_flush >= self.flush_every:
+            self.flush()
+
+    def drop(self, content_hashes):
+        """Remove hashes from the store and compact the vector file"""
+        drop_set = set(content_hashes) & set(self.meta['rows'])
+        if not drop_set:
+            return 0
+
+        kept = sorted(((row, h, last) for h, (row, last) in self.meta['rows'].items()
+                       if h not in drop_set))
+        vectors = self._vectors()
+        tmp_path = f"{self.vectors_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            for row, _, _ in kept:
+                f.write(np.ascontiguousarray(vectors[row]).tobytes())
+        self._mmap = None
+        del vectors
+        os.replace(tmp_path, self.vectors_path)
+
+        self.meta['rows'] = {h: [new_row, last] for new_row, (_, h, last) in enumerate(kept)}
+        self.meta['num_rows'] = len(kept)
+        self._dirty = True
+        return len(drop_set)
+
+    def flush(self):
+        if self._dirty:
+            _write_json_atomic(self.meta_path, self.meta)
+            self._dirty = False
+        self._puts_since_flush = 0
+
+
+class FeatureCache:
+    """Content-addressed cache of per-image feature vectors for multiple models"""
+
+    def __init__(self, cache_dir, max_size_gb=None):
+        self.cache_dir = cache_dir
+        self.stores_dir = os.path.join(cache_dir, 'stores')
+        self.paths_file = os.path.join(cache_dir, 'paths.json')
+        self.max_size_bytes = int(max_size_gb * (1 << 30)) if max_size_gb else None
+        os.makedirs(self.stores_dir, exist_ok=True)
+
+        self._path_hashes = {}
+        if os.path.exists(self.paths_file):
+            with open(self.paths_file, 'r') as f:
+                self._path_hashes = json.load(f)
+        self._paths_dirty = False
+        self._stores = {}
+
+    def content_hash(self, path):
+        """SHA-256 of a file, memoized on (size, mtime) so unchanged files are not re-read"""
+        abs_path = os.path.abspath(path)
+        stat = os.stat(abs_path)
+        memo = self._path_hashes.get(abs_path)
+        if memo and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+            return memo[2]
+
+        digest = file_sha256(abs_path)
+        self._path_hashes[abs_path] = [stat.st_size, stat.st_mtime_ns, digest]
+        self._paths_dirty = True
+        return digest
+
+    def store(self, model_key, dtype='float16'):
+        """Get (or create) the store for a model identity"""
+        store_id = model_store_id(model_key)
+        if store_id not in self._stores:
+            self._stores[store_id] = FeatureStore(os.path.join(self.stores_dir, store_id), model_key, dtype)
+        return self._stores[store_id]
+
+    def lookup(self, store, image_paths):
+        """Return ({path: vector} for cache hits, [paths that need computing])"""
+        path_to_hash = {}
+        for path in image_paths:
+            try:
+                path_to_hash[path] = self.content_hash(path)
+            except OSError as e:
+                print(f"Error hashing {path}: {e}")
+
+        cached = store.get(set(path_to_hash.values()))
+        found = {path: cached[h] for path, h in path_to_hash.items() if h in cached}
+        missing = [path for path in image_paths if path in path_to_hash and path not in found]
+        return found, missing
+
+    def add(self, store, features):
+        """Store {path: vector} features computed for a model"""
+        hashed = {}
+        for path, vector in features.items():
+            if vector is None:
+                continue
+            hashed[self.content_hash(path)] = vector
+        store.put(hashed)
+
+    def list_stores(self):
+        """All stores on disk, loaded lazily"""
+        stores = []
+        for store_id in sorted(os.listdir(self.stores_dir)):
+            if store_id in self._stores:
+                stores.append((store_id, self._stores[store_id]))
+                continue
+            store_dir = os.path.join(self.stores_dir, store_id)
+            if not os.path.exists(os.path.join(store_dir, 'meta.json')):
+                continue
+            store = FeatureStore(store_dir, None)
+            self._stores[store_id] = store
+            stores.append((store_id, store))
+        return stores
+
+    def total_size_bytes(self):
+        return sum(store.size_bytes() for _, store in self.list_stores())
+
+    def evict(self, max_size_bytes=None, older_than_days=None):
+        """
+        Drop least-recently-used entries until the cache fits in max_size_bytes,
+        and/or drop entries not used for older_than_days.
+        """
+        max_size_bytes = max_size_bytes if max_size_bytes is not None else self.max_size_bytes
+        stores = dict(self.list_stores())
+
+        entries = []
+        for store_id, store in stores.items():
+            row_bytes = (store.meta['dim'] or 0) * store.dtype.itemsize
+            for content_hash, (_, last) in store.meta['rows'].items():
+                entries.append((last, store_id, content_hash, row_bytes))
+        entries.sort()
+
+        to_drop = {}
+        total = sum(store.size_bytes() for store in stores.values())
+        cutoff = time.time() - older_than_days * 86400 if older_than_days is not None else None
+
+        for last, store_id, content_hash, row_bytes in entries:
+            over_size = max_size_bytes is not None and total > max_size_bytes
+            too_old = cutoff is not None and last < cutoff
+            # Entries are sorted oldest first and total only shrinks, so stop at the first keeper
+            if not (over_size or too_old):
+                break
+            to_drop.setdefault(store_id, []).append(content_hash)
+            total -= row_bytes
+
+        dropped = 0
+        for store_id, hashes in to_drop.items():
+            store = stores[store_id]
+            dropped += store.drop(hashes)
+            if store.num_rows == 0:
+                self.remove_store(store_id)
+            else:
+                store.flush()
+        return dropped
+
+    def remove_store(self, store_id):
+        self._stores.pop(store_id, None)
+        shutil.rmtree(os.path.join(self.stores_dir, store_id), ignore_errors=True)
+
+    def flush(self):
+        """Persist indexes, then apply size-based eviction if configured"""
+        for store in self._stores.values():
+            store.flush()
+        if self._paths_dirty:
+            _write_json_atomic(self.paths_file, self._path_hashes)
+            self._paths_dirty = False
+        if self.max_size_bytes is not None and self.total_size_bytes() > self.max_size_bytes:
+            dropped = self.evict()
+            print(f"Feature cache over {self.max_size_bytes / (1 << 30):.2f} GB - evicted {dropped} entries")
+
+
+def print_cache_info(cache):
+    """Print a summary of every store in the cache"""
+    stores = cache.list_stores()
+    print(f"Feature cache: {cache.cache_dir}")
+    print(f"Stores: {len(stores)}, total size: {cache.total_size_bytes() / (1 << 20):.1f} MB")
+    for store_id, store in stores:
+        last_used = time.strftime('%Y-%m-%d %H:%M', time.localtime(store.last_used()))
+        print(f"\n  {store_id}")
+        print(f"    Model: {json.dumps(store.meta['model'], sort_keys=True)[:200]}")
+        print(f"    Entries: {store.num_rows}, dim: {store.meta['dim']}, dtype: {store.meta['dtype']}")
+        print(f"    Size: {store.size_bytes() / (1 << 20):.1f} MB, last used: {last_used}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect and prune the face metrics feature cache')
+    parser.add_argument('--cache_dir', type=str, default='./feature_cache',
+                        help='Feature cache directory')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('info', help='Show stores, entry counts and sizes')
+
+    prune_parser = subparsers.add_parser('prune', help='Evict least-recently-used entries')
+    prune_parser.add_argument('--max_size_gb', type=float,
+                              help='Evict until the cache is at most this size')
+    prune_parser.add_argument('--older_than_days', type=float,
+                              help='Evict entries not used in this many days')
+
+    clear_parser = subparsers.add_parser('clear', help='Delete one store or the whole cache')
+    clear_parser.add_argument('--store', type=str, help='Store ID to delete (default: all)')
+
+    args = parser.parse_args()
+
+    if not os.path.exists(args.cache_dir):
+        print(f"Error: Cache directory not found: {args.cache_dir}")
+        return
+
+    cache = FeatureCache(args.cache_dir)
+
+    if args.command == 'info':
+        print_cache_info(cache)
+    elif args.command == 'prune':
+        if args.max_size_gb is None and args.older_than_days is None:
+            print("Error: Specify --max_size_gb and/or --older_than_days")
+            return
+        max_size_bytes = int(args.max_size_gb * (1 << 30)) if args.max_size_gb is not None else None
+        dropped = cache.evict(max_size_bytes=max_size_bytes, older_than_days=args.older_than_days)
+        print(f"Evicted {dropped} entries, cache size now {cache.total_size_bytes() / (1 << 20):.1f} MB")
+    elif args.command == 'clear':
+        if args.store:
+            cache.remove_store(args.store)
+            print(f"Removed store {args.store}")
+        else:
+            for store_id, _ in cache.list_stores():
+                cache.remove_store(store_id)
+            if os.path.exists(cache.paths_file):
+                os.remove(cache.paths_file)
+            print("Cleared feature cache")
+
+
+if __name__ == "__main__":
+    main()
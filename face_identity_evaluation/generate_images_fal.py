@@ -1,190 +1,98 @@
 import asyncio
+import aiohttp
 import fal_client
+import httpx
 import json
 import os
+import sys
 import time
-import random
-from tqdm import tqdm
-import aiohttp
-
-# Global counters (no threading needed for async version)
-completed_count = 0
-failed_count = 0
 
-def increment_completed():
-    global completed_count
-    completed_count += 1
+# Shared orchestrator and rate limiter live in the FlyMy client package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flymy_client import (DownloadError, GenerationBackend, JobQueue, UploadCache, build_edit_jobs,
+                          load_prompts_from_json, queue_jobs, rate_limiter, run_jobs)
 
-def increment_failed():
-    global failed_count
-    failed_count += 1
+# Each source image is uploaded once per run and its URL reused by all its prompts
+upload_cache = UploadCache()
 
-def get_counts():
-    return completed_count, failed_count
+def error_status(error):
+    """HTTP status carried by a fal_client / httpx error, if any"""
+    response = getattr(error, 'response', None)
+    return getattr(response, 'status_code', None)
 
-def load_prompts_from_json(json_file):
-    """Load prompts from JSON configuration file and organize them"""
-    with open(json_file, 'r') as f:
-        config = json.load(f)
-    
-    # Extract prompts organized by category
-    organized_prompts = {}
-    
-    for category_name, category_data in config['categories'].items():
-        category_prompts = []
-        prompt_metadata = []
-        
-        # Collect prompts from all intensity levels
-        for intensity_level in ['intensity_1_subtle', 'intensity_2_moderate', 'intensity_3_intense']:
-            for prompt_data in category_data[intensity_level]:
-                category_prompts.append(prompt_data['prompt'])
-                prompt_metadata.append({
-                    'id': prompt_data['id'],
-                    'intensity': intensity_level,
-                    'expected_difficulty': prompt_data['expected_difficulty']
-                })
+def result_image_url(result):
+    """URL of the generated image in a bagel/edit result, or None"""
+    generated_image_url = None
+    
+    if isinstance(result, dict) and "image" in result:
+        # Handle single image response
+        if isinstance(result["image"], dict) and "url" in result["image"]:
+            generated_image_url = result["image"]["url"]
+        elif isinstance(result["image"], str):
+            generated_image_url = result["image"]
         
-        organized_prompts[category_name] = {
-            'prompts': category_prompts,
-            'metadata': prompt_metadata
-        }
-    
-    return organized_prompts, config
-
-async def upload_and_edit_image(input_image_path, prompt, output_path, max_retries=3):
-    """Upload image to fal.ai and edit it using bagel/edit model"""
-    
-    # Skip if output already exists
-    if os.path.exists(output_path):
-        print(f"Skipping {output_path} - already exists")
-        return True
-    
-    # Create output directory if it doesn't exist
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
-    for attempt in range(max_retries):
-        try:
-            # Upload image to fal.ai storage
-            print(f"Uploading {os.path.basename(input_image_path)}...")
-            image_url = await fal_client.upload_file_async(input_image_path)
-            print(f"Image uploaded: {image_url}")
-            
-            # Submit async request to bagel/edit
-            print(f"Submitting edit request with prompt: {prompt[:50]}...")
-            handler = await fal_client.submit_async(
-                "fal-ai/bagel/edit",
-                arguments={
-                    "prompt": prompt,
-                    "image_url": image_url
-                },
-            )
-            
-            # Optional: Listen to events (shows progress)
-            print("Processing...")
-            async for event in handler.iter_events(with_logs=False):
-                if hasattr(event, 'type'):
-                    print(f"Event: {event.type}")
-            
-            # Get the final result
-            result = await handler.get()
-            print(f"Result received")
-            
-            # Extract and download the generated image
-            generated_image_url = None
-            
-            if isinstance(result, dict) and "image" in result:
-                # Handle single image response
-                if isinstance(result["image"], dict) and "url" in result["image"]:
-                    generated_image_url = result["image"]["url"]
-                elif isinstance(result["image"], str):
-                    generated_image_url = result["image"]
-                    
-            elif isinstance(result, dict) and "images" in result and result["images"]:
-                # Handle multiple images response
-                first_image = result["images"][0]
-                if isinstance(first_image, dict) and "url" in first_image:
-                    generated_image_url = first_image["url"]
-                elif isinstance(first_image, str):
-                    generated_image_url = first_image
-            
-            if not generated_image_url:
-                print(f"No image URL found in result: {result}")
-                continue
-            
-            # Download the generated image
-            print(f"Downloading result...")
-            async with aiohttp.ClientSession() as session:
-                async with session.get(generated_image_url) as response:
-                    if response.status == 200:
-                        content = await response.read()
-                        with open(output_path, 'wb') as f:
-                            f.write(content)
-                        print(f"Successfully saved: {os.path.basename(output_path)}")
-                        return True
-                    else:
-                        print(f"Failed to download: HTTP {response.status}")
-                        continue
-                        
-        except Exception as e:
-            print(f"Error on attempt {attempt + 1}: {e}")
-            if attempt < max_retries - 1:
-                wait_time = 15  # Fixed 15s wait time
-                print(f"Retrying in {wait_time}s...")
-                await asyncio.sleep(wait_time)
-            else:
-                print(f"Failed after {max_retries} attempts")
-                return False
-    
-    return False
+    elif isinstance(result, dict) and "images" in result and result["images"]:
+        # Handle multiple images response
+        first_image = result["images"][0]
+        if isinstance(first_image, dict) and "url" in first_image:
+            generated_image_url = first_image["url"]
+        elif isinstance(first_image, str):
+            generated_image_url = first_image
+    
+    return generated_image_url
 
-async def process_single_task(task_info):
-    """Process a single task asynchronously"""
-    img_file, img_path, category, prompt_idx, prompt, output_path, prompt_id = task_info
-    
-    success = await upload_and_edit_image(
-        input_image_path=img_path,
-        prompt=prompt,
-        output_path=output_path,
-        max_retries=60
-    )
-    
-    if success:
-        increment_completed()
-    else:
-        increment_failed()
-        with open("failed_generations_fal_benchmark.log", "a") as f:
-            f.write(f"{img_file},{category},{prompt_idx},{prompt_id},{prompt}\n")
-    
-    # Add delay between requests
-    await asyncio.sleep(random.uniform(2.0, 4.0))
-    return success, img_file, category, prompt_idx
+class FalBackend(GenerationBackend):
+    """fal.ai bagel/edit: upload the source image, submit to the fal queue, poll, download"""
+    
+    name = 'fal'
+    application = "fal-ai/bagel/edit"
+    # API and transfer errors are retried; local ones (a missing input image, a full disk) fail the job
+    errors = (fal_client.FalClientError, httpx.HTTPError, DownloadError, aiohttp.ClientError, asyncio.TimeoutError,
+              KeyError, ValueError)
+    
+    async def submit(self, job):
+        # Upload image to fal.ai storage (reused across prompts and retries)
+        image_url = await upload_cache.get_or_upload('fal', job['input_path'], fal_client.upload_file_async)
+        print(f"Submitting edit request with prompt: {job['prompt'][:50]}...")
+        handler = await fal_client.submit_async(
+            self.application,
+            arguments={
+                "prompt": job['prompt'],
+                "image_url": image_url
+            },
+        )
+        return handler.request_id
+    
+    async def poll(self, handle, job, submitted_at=None, resumed=False):
+        # Waits on the fal queue; a request submitted before a restart is picked up by its id
+        result = await fal_client.result_async(self.application, handle)
+        generated_image_url = result_image_url(result)
+        if not generated_image_url:
+            raise ValueError(f"No image URL found in result: {result}")
+        return generated_image_url
+    
+    async def fetch(self, result, output_path):
+        # Streamed to a temp file, validated, then renamed into place
+        return await self.download(result, output_path)
+    
+    def retry_delay(self, error, attempt):
+        return 15  # Fixed 15s wait time
+    
+    async def attempt_failed(self, job, error):
+        status = error_status(error)
+        self.limiter.report_status(status)
+        if status is not None and 400 <= status < 500 and status != 429:
+            # The request was rejected; do not keep reusing the same uploaded URL
+            await upload_cache.invalidate('fal', job['input_path'])
 
-async def process_batch_with_semaphore(tasks, max_concurrent=2):
-    """Process tasks with concurrency control using semaphore"""
-    semaphore = asyncio.Semaphore(max_concurrent)
-    
-    async def process_with_semaphore(task):
-        async with semaphore:
-            return await process_single_task(task)
-    
-    # Create tasks with semaphore control
-    task_coroutines = [process_with_semaphore(task) for task in tasks]
-    
-    # Process with progress bar
-    results = []
-    with tqdm(total=len(tasks), desc="Processing images") as pbar:
-        for coro in asyncio.as_completed(task_coroutines):
-            result = await coro
-            results.append(result)
-            
-            # Update progress
-            completed, failed = get_counts()
-            success, img_name, cat, p_idx = result
-            pbar.set_description(f"Processed {img_name} - {cat} prompt {p_idx}")
-            pbar.set_postfix(completed=completed, failed=failed, concurrent=max_concurrent)
-            pbar.update(1)
-    
-    return results
+async def process_batch_with_rate_limit(queue, jobs, max_concurrent=2, requests_per_second=None, adaptive=False):
+    """Process queued jobs with the shared 'fal' limiter pacing and capping requests in flight"""
+    limiter = rate_limiter('fal', requests_per_second=requests_per_second,
+                           max_in_flight=max_concurrent, adaptive=adaptive)
+    
+    async with FalBackend(limiter=limiter) as backend:
+        return await run_jobs(backend, queue, jobs, concurrency=max_concurrent, max_retries=60,
+                              failed_log="failed_generations_fal_benchmark.log")
 
 async def main():
     """Main async function to generate benchmark images using JSON prompts"""
@@ -199,6 +107,14 @@ async def main():
                        help='Output directory for generated images')
     parser.add_argument('--max_concurrent', type=int, default=2,
                        help='Maximum concurrent requests')
+    parser.add_argument('--requests_per_second', type=float, default=None,
+                       help='Maximum requests started per second (default: no limit)')
+    parser.add_argument('--adaptive', action='store_true',
+                       help='Raise concurrency up to --max_concurrent until the API throttles, then back off (AIMD)')
+    parser.add_argument('--queue_db', type=str, default=None,
+                       help='SQLite job queue (default: <output_dir>/fal_generation_jobs.sqlite)')
+    parser.add_argument('--retry_failed', action='store_true',
+                       help='Put jobs that failed in earlier runs back in the queue before processing')
     parser.add_argument('--max_images', type=int, default=10,
                        help='Maximum number of images to process')
     
@@ -251,50 +167,25 @@ async def main():
     
     print(f"Found {len(image_files)} images to process")
     
-    # Create list of all tasks
-    tasks = []
-    for img_file in image_files:
-        img_path = os.path.join(base_path, img_file)
-        img_name = os.path.splitext(img_file)[0]
-        
-        for category, category_data in organized_prompts.items():
-            prompts = category_data['prompts']
-            metadata = category_data['metadata']
-            
-            for prompt_idx, (prompt, prompt_meta) in enumerate(zip(prompts, metadata)):
-                # Create output filename following benchmark naming convention:
-                # original_name_category_intensity_promptid.png
-                intensity_short = prompt_meta['intensity'].split('_')[1]  # Extract 'subtle', 'moderate', 'intense'
-                prompt_id = prompt_meta['id']
-                
-                output_filename = f"{img_name}_{category}_{intensity_short}_{prompt_id}.png"
-                output_path = os.path.join(results_base, output_filename)
-                
-                # Only add task if output doesn't exist
-                if not os.path.exists(output_path):
-                    tasks.append((
-                        img_file, 
-                        img_path, 
-                        category, 
-                        prompt_idx, 
-                        prompt, 
-                        output_path,
-                        prompt_id
-                    ))
+    # Create list of all jobs; their state lives in the job queue, so a restart resumes submitted requests
+    jobs = build_edit_jobs(image_files, base_path, organized_prompts, results_base)
+    queue = JobQueue(args.queue_db or os.path.join(results_base, "fal_generation_jobs.sqlite"))
+    tasks = queue_jobs(queue, jobs, results_base, retry_failed=args.retry_failed)
+    print(f"Job queue: {queue.counts()}")
     
     total_tasks = len(tasks)
     print(f"Total tasks to process: {total_tasks}")
     
     if total_tasks == 0:
         print("All images already processed!")
+        queue.close()
         return
     
     # Show some example tasks
     print("\nExample tasks:")
     for i, task in enumerate(tasks[:3]):
-        img_file, _, category, prompt_idx, prompt, output_path, prompt_id = task
-        print(f"  {i+1}. {img_file} -> {os.path.basename(output_path)}")
-        print(f"     Prompt {prompt_id}: {prompt[:80]}...")
+        print(f"  {i+1}. {task['metadata']['img_file']} -> {os.path.basename(task['output_path'])}")
+        print(f"     Prompt {task['metadata']['prompt_id']}: {task['prompt'][:80]}...")
     
     if total_tasks > 3:
         print(f"  ... and {total_tasks - 3} more tasks")
@@ -302,10 +193,11 @@ async def main():
     # Process tasks with controlled concurrency
     print(f"\nStarting processing with max {max_concurrent} concurrent requests...")
     
-    await process_batch_with_semaphore(tasks, max_concurrent)
+    completed, failed = await process_batch_with_rate_limit(queue, tasks, max_concurrent,
+                                                            args.requests_per_second, args.adaptive)
+    queue.close()
     
     # Final statistics
-    completed, failed = get_counts()
     print(f"\nProcessing complete!")
     print(f"Completed: {completed}")
     print(f"Failed: {failed}")
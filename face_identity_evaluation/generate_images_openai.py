@@ -1,242 +1,148 @@
 import asyncio
+import aiohttp
 import openai
 import os
+import sys
 import json
 import time
-import random
-from tqdm import tqdm
-import aiohttp
-import base64
 from PIL import Image
 
-# Global counters
-completed_count = 0
-failed_count = 0
-
-def increment_completed():
-    global completed_count
-    completed_count += 1
-
-def increment_failed():
-    global failed_count
-    failed_count += 1
-
-def get_counts():
-    return completed_count, failed_count
+# Shared orchestrator and rate limiter live in the FlyMy client package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flymy_client import (DownloadError, GenerationBackend, JobQueue, build_edit_jobs, load_prompts_from_json,
+                          queue_jobs, rate_limiter, run_jobs)
+from image_prep import ImagePreprocessor
 
-def load_prompts_from_json(json_file):
-    """Load prompts from JSON configuration file and organize them"""
-    with open(json_file, 'r') as f:
-        config = json.load(f)
-    
-    # Extract prompts organized by category
-    organized_prompts = {}
+class OpenAIBackend(GenerationBackend):
+    """Edit face while preserving identity using OpenAI GPT-4V + DALL-E"""
     
-    for category_name, category_data in config['categories'].items():
-        category_prompts = []
-        prompt_metadata = []
+    name = 'openai'
+    # API and transfer errors are retried; local ones (a missing input image, a full disk) fail the job
+    errors = (openai.APIError, DownloadError, aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError)
+    
+    def __init__(self, limiter=None, image_settings=None):
+        super().__init__(limiter=limiter)
+        self.client = None
+        # Input faces are downscaled to what GPT-4o sees and re-encoded as JPEG in a process pool
+        self.images = ImagePreprocessor(**(image_settings or {}))
+    
+    async def open(self):
+        if self.client is None:
+            self.client = openai.AsyncOpenAI()
+        return await super().open()
+    
+    async def close(self):
+        if self.client is not None:
+            await self.client.close()
+            self.client = None
+        self.images.close()
+        await super().close()
+    
+    async def submit(self, job):
+        """Describe the edited face with GPT-4o and render it with DALL-E 3; returns the image URL"""
+        await self.open()
+        prompt = job['prompt']
+        print(f"Analyzing image: {os.path.basename(job['input_path'])}...")
         
-        # Collect prompts from all intensity levels
-        for intensity_level in ['intensity_1_subtle', 'intensity_2_moderate', 'intensity_3_intense']:
-            for prompt_data in category_data[intensity_level]:
-                category_prompts.append(prompt_data['prompt'])
-                prompt_metadata.append({
-                    'id': prompt_data['id'],
-                    'intensity': intensity_level,
-                    'expected_difficulty': prompt_data['expected_difficulty']
-                })
+        # Downscale and encode image as a data URL with its real MIME type
+        image_url, _ = await self.images.adata_url(job['input_path'])
         
-        organized_prompts[category_name] = {
-            'prompts': category_prompts,
-            'metadata': prompt_metadata
-        }
-    
-    return organized_prompts, config
-
-def encode_image_to_base64(image_path):
-    """Encode image to base64 for OpenAI API"""
-    with open(image_path, "rb") as image_file:
-        encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-    return encoded_string
-
-async def preserve_identity_face_edit(input_image_path, prompt, output_path, max_retries=3):
-    """Edit face while preserving identity using OpenAI GPT-4V + DALL-E"""
-    
-    # Skip if output already exists
-    if os.path.exists(output_path):
-        print(f"Skipping {output_path} - already exists")
-        return True
-    
-    # Create output directory if it doesn't exist
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    
-    # Initialize OpenAI client
-    client = openai.AsyncOpenAI()
-    
-    for attempt in range(max_retries):
-        try:
-            print(f"Analyzing image: {os.path.basename(input_image_path)}...")
-            
-            # Encode image to base64
-            base64_image = encode_image_to_base64(input_image_path)
-            
-            # Step 1: Simple analysis and description with edit instruction
-            simple_prompt = f"""
+        # Step 1: Simple analysis and description with edit instruction
+        simple_prompt = f"""
             Describe this person's appearance focusing on general characteristics like hair color, approximate age, clothing style, and overall appearance. Then modify the description according to: {prompt}
             
             Create a description for image generation that applies the requested change while maintaining the person's general appearance. Focus on realistic, natural-looking results.
             """
-            
-            analysis_response = await client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text", 
-                                "text": simple_prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}",
-                                    "detail": "high"
-                                }
+        
+        analysis_response = await self.client.chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text", 
+                            "text": simple_prompt
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": image_url,
+                                "detail": "high"
                             }
-                        ]
-                    }
-                ],
-                max_tokens=400,
-                temperature=0.1
-            )
-            
-            description = analysis_response.choices[0].message.content
-            print(f"Generated description...")
-            
-            # Step 2: Generate image with DALL-E using safer prompt
-            print("Generating edited image...")
-            
-            # Create a safer prompt for DALL-E
-            safe_description = description.replace("this person", "a person")
-            safe_description = safe_description.replace("the person", "a person")
-            
-            dalle_response = await client.images.generate(
-                model="dall-e-3",
-                prompt=f"A portrait photograph of {safe_description}. Professional photo, natural lighting, realistic style.",
-                size="1024x1024",
-                quality="standard",
-                n=1,
-            )
-            
-            image_url = dalle_response.data[0].url
-            print(f"Image generated successfully")
-            
-            # Step 3: Download the generated image
-            print("Downloading result...")
-            async with aiohttp.ClientSession() as session:
-                async with session.get(image_url) as response:
-                    if response.status == 200:
-                        content = await response.read()
-                        with open(output_path, 'wb') as f:
-                            f.write(content)
-                        print(f"Successfully saved: {os.path.basename(output_path)}")
-                        return True
-                    else:
-                        print(f"Failed to download: HTTP {response.status}")
-                        continue
-                        
-        except openai.RateLimitError as e:
-            print(f"Rate limit error on attempt {attempt + 1}: {e}")
-            wait_time = (2 ** attempt) * 30  # 30s, 60s, 120s
-            print(f"Waiting {wait_time}s for rate limit...")
-            await asyncio.sleep(wait_time)
-            continue
-            
-        except openai.APIError as e:
-            print(f"API error on attempt {attempt + 1}: {e}")
-            error_str = str(e).lower()
-            
+                        }
+                    ]
+                }
+            ],
+            max_tokens=400,
+            temperature=0.1
+        )
+        
+        description = analysis_response.choices[0].message.content
+        print(f"Generated description...")
+        
+        # Step 2: Generate image with DALL-E using safer prompt
+        print("Generating edited image...")
+        
+        # Create a safer prompt for DALL-E
+        safe_description = description.replace("this person", "a person")
+        safe_description = safe_description.replace("the person", "a person")
+        
+        dalle_response = await self.client.images.generate(
+            model="dall-e-3",
+            prompt=f"A portrait photograph of {safe_description}. Professional photo, natural lighting, realistic style.",
+            size="1024x1024",
+            quality="standard",
+            n=1,
+        )
+        
+        print(f"Image generated successfully")
+        return dalle_response.data[0].url
+    
+    async def poll(self, handle, job, submitted_at=None, resumed=False):
+        # DALL-E answers synchronously; the handle already is the image URL
+        return handle
+    
+    async def fetch(self, result, output_path):
+        # Step 3: Download the generated image, streamed to a temp file, validated, then renamed into place
+        print("Downloading result...")
+        return await self.download(result, output_path)
+    
+    def retry_delay(self, error, attempt):
+        # attempt counts failures so far; waits grow as 30s, 60s, 120s ... for rate limits
+        if isinstance(error, openai.RateLimitError):
+            return min((2 ** (attempt - 1)) * 30, 600)
+        if isinstance(error, openai.APIError):
+            error_str = str(error).lower()
             if "content_policy_violation" in error_str:
                 print("Content policy violation - skipping this image")
-                return False
+                return None
             elif "image_generation_user_error" in error_str:
                 print("Image generation error - possibly content-related, skipping...")
-                return False
+                return None
             elif "billing" in error_str:
                 print("Billing issue - check your OpenAI account")
-                return False
+                return None
             elif "rate_limit" in error_str:
-                wait_time = (2 ** attempt) * 30
-                print(f"Rate limit hit, waiting {wait_time}s...")
-                await asyncio.sleep(wait_time)
-                continue
-            else:
-                wait_time = (2 ** attempt) * 10  # 10s, 20s, 40s
-                print(f"Unknown API error, retrying in {wait_time}s...")
-                await asyncio.sleep(wait_time)
-                continue
-            
-        except Exception as e:
-            print(f"Error on attempt {attempt + 1}: {e}")
-            if attempt < max_retries - 1:
-                wait_time = 15  # Fixed 15s wait like in your code
-                print(f"Retrying in {wait_time}s...")
-                await asyncio.sleep(wait_time)
-            else:
-                print(f"Failed after {max_retries} attempts")
-                return False
-    
-    return False
-
-async def process_single_task(task_info):
-    """Process a single task asynchronously"""
-    img_file, img_path, category, prompt_idx, prompt, output_path, prompt_id = task_info
-    
-    success = await preserve_identity_face_edit(
-        input_image_path=img_path,
-        prompt=prompt,
-        output_path=output_path,
-        max_retries=60  # High retry count like in your code
-    )
-    
-    if success:
-        increment_completed()
-    else:
-        increment_failed()
-        with open("failed_generations_openai_benchmark.log", "a") as f:
-            f.write(f"{img_file},{category},{prompt_idx},{prompt_id},{prompt}\n")
-    
-    # Add delay between requests to respect rate limits
-    await asyncio.sleep(random.uniform(3.0, 5.0))  # Similar timing to other scripts
-    return success, img_file, category, prompt_idx
+                return min((2 ** (attempt - 1)) * 30, 600)
+            return min((2 ** (attempt - 1)) * 10, 600)  # 10s, 20s, 40s
+        return 15  # Fixed 15s wait like in your code
+    
+    async def attempt_failed(self, job, error):
+        if isinstance(error, openai.RateLimitError):
+            self.limiter.report_throttle()
+        elif isinstance(error, openai.APIError):
+            self.limiter.report_status(getattr(error, 'status_code', None))
 
-async def process_batch_with_semaphore(tasks, max_concurrent=1):
-    """Process tasks with concurrency control using semaphore"""
-    semaphore = asyncio.Semaphore(max_concurrent)
-    
-    async def process_with_semaphore(task):
-        async with semaphore:
-            return await process_single_task(task)
-    
-    # Create tasks with semaphore control
-    task_coroutines = [process_with_semaphore(task) for task in tasks]
-    
-    # Process with progress bar
-    results = []
-    with tqdm(total=len(tasks), desc="Processing images") as pbar:
-        for coro in asyncio.as_completed(task_coroutines):
-            result = await coro
-            results.append(result)
-            
-            # Update progress
-            completed, failed = get_counts()
-            success, img_name, cat, p_idx = result
-            pbar.set_description(f"Processed {img_name} - {cat} prompt {p_idx}")
-            pbar.set_postfix(completed=completed, failed=failed, concurrent=max_concurrent)
-            pbar.update(1)
-    
-    return results
+async def process_batch_with_rate_limit(queue, jobs, max_concurrent=1, requests_per_second=None, adaptive=False):
+    """Process queued jobs with the shared 'openai' limiter pacing and capping requests in flight"""
+    limiter = rate_limiter('openai', requests_per_second=requests_per_second,
+                           max_in_flight=max_concurrent, adaptive=adaptive)
+    
+    async with OpenAIBackend(limiter=limiter) as backend:
+        return await run_jobs(backend, queue, jobs, concurrency=max_concurrent,
+                              max_retries=60,  # High retry count like in your code
+                              failed_log="failed_generations_openai_benchmark.log")
 
 async def main():
     """Main async function to generate benchmark images using JSON prompts"""
@@ -250,7 +156,15 @@ async def main():
     parser.add_argument('--output_dir', type=str,
                        help='Output directory for generated images')
     parser.add_argument('--max_concurrent', type=int, default=1,
-                       help='Maximum concurrent requests (keep at 1 for OpenAI)')
+                       help='Maximum concurrent requests (keep at 1 for OpenAI unless --adaptive)')
+    parser.add_argument('--requests_per_second', type=float, default=None,
+                       help='Maximum requests started per second (default: no limit)')
+    parser.add_argument('--adaptive', action='store_true',
+                       help='Raise concurrency up to --max_concurrent until the API throttles, then back off (AIMD)')
+    parser.add_argument('--queue_db', type=str, default=None,
+                       help='SQLite job queue (default: <output_dir>/openai_generation_jobs.sqlite)')
+    parser.add_argument('--retry_failed', action='store_true',
+                       help='Put jobs that failed in earlier runs back in the queue before processing')
     parser.add_argument('--max_images', type=int, default=10,
                        help='Maximum number of images to process')
     parser.add_argument('--confirm', action='store_true',
@@ -314,36 +228,11 @@ async def main():
     
     print(f"Found {len(image_files)} images to process")
     
-    # Create list of all tasks
-    tasks = []
-    for img_file in image_files:
-        img_path = os.path.join(base_path, img_file)
-        img_name = os.path.splitext(img_file)[0]
-        
-        for category, category_data in organized_prompts.items():
-            prompts = category_data['prompts']
-            metadata = category_data['metadata']
-            
-            for prompt_idx, (prompt, prompt_meta) in enumerate(zip(prompts, metadata)):
-                # Create output filename following benchmark naming convention:
-                # original_name_category_intensity_promptid.png
-                intensity_short = prompt_meta['intensity'].split('_')[1]  # Extract 'subtle', 'moderate', 'intense'
-                prompt_id = prompt_meta['id']
-                
-                output_filename = f"{img_name}_{category}_{intensity_short}_{prompt_id}.png"
-                output_path = os.path.join(results_base, output_filename)
-                
-                # Only add task if output doesn't exist
-                if not os.path.exists(output_path):
-                    tasks.append((
-                        img_file, 
-                        img_path, 
-                        category, 
-                        prompt_idx, 
-                        prompt, 
-                        output_path,
-                        prompt_id
-                    ))
+    # Create list of all jobs; their state lives in the job queue, so a restart resumes submitted requests
+    jobs = build_edit_jobs(image_files, base_path, organized_prompts, results_base)
+    queue = JobQueue(args.queue_db or os.path.join(results_base, "openai_generation_jobs.sqlite"))
+    tasks = queue_jobs(queue, jobs, results_base, retry_failed=args.retry_failed)
+    print(f"Job queue: {queue.counts()}")
     
     total_tasks = len(tasks)
     estimated_cost = total_tasks * 0.07  # Rough estimate: GPT-4V (~$0.02) + DALL-E 3 (~$0.04)
@@ -354,14 +243,14 @@ async def main():
     
     if total_tasks == 0:
         print("All images already processed!")
+        queue.close()
         return
     
     # Show some example tasks
     print("\nExample tasks:")
     for i, task in enumerate(tasks[:3]):
-        img_file, _, category, prompt_idx, prompt, output_path, prompt_id = task
-        print(f"  {i+1}. {img_file} -> {os.path.basename(output_path)}")
-        print(f"     Prompt {prompt_id}: {prompt[:80]}...")
+        print(f"  {i+1}. {task['metadata']['img_file']} -> {os.path.basename(task['output_path'])}")
+        print(f"     Prompt {task['metadata']['prompt_id']}: {task['prompt'][:80]}...")
     
     if total_tasks > 3:
         print(f"  ... and {total_tasks - 3} more tasks")
@@ -371,16 +260,18 @@ async def main():
         user_input = input(f"\nProceed with {total_tasks} tasks (estimated ${estimated_cost:.2f})? [y/N]: ")
         if user_input.lower() != 'y':
             print("Cancelled by user")
+            queue.close()
             return
     
     # Process tasks with controlled concurrency
     print(f"\nStarting processing with max {max_concurrent} concurrent requests...")
     print("Using GPT-4V + DALL-E 3 for maximum identity preservation")
     
-    await process_batch_with_semaphore(tasks, max_concurrent)
+    completed, failed = await process_batch_with_rate_limit(queue, tasks, max_concurrent,
+                                                            args.requests_per_second, args.adaptive)
+    queue.close()
     
     # Final statistics
-    completed, failed = get_counts()
     actual_cost = completed * 0.07
     
     print(f"\nProcessing complete!")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Run metrics_comparison.py as N shard processes on one machine, then merge.
+
+Each shard process loads its own model copies, evaluates every N-th pair and FID
+image, and gets an equal share of the CPU cores as its torch thread budget
+(optionally pinned to those cores). Once all shards succeed, metrics_comparison.py
+is run once more with --num_shards N to merge the shard results in shard order and
+write the usual CSVs and plots.
+
+Usage:
+    python launch_sharded_evaluation.py --num_shards 8 -- \
+        --original_dir ./ffhq --results_config results.json --output_dir ./three_level_results
+
+Arguments after `--` are passed to metrics_comparison.py unchanged. With
+--cache_dir, each shard keeps its feature cache in its own subdirectory
+(shard_<id>_of_<N>), since shards must not write to one store concurrently.
+"""
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics_comparison.py')
+
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def shard_cpus(cpus, num_shards, shard_id):
+    """Contiguous block of cores for one shard"""
+    per_shard = max(1, len(cpus) // num_shards)
+    start = (shard_id * per_shard) % len(cpus)
+    return cpus[start:start + per_shard]
+
+
+def output_dir_from(passthrough):
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--output_dir', type=str, default='./three_level_results')
+    known, _ = parser.parse_known_args(passthrough)
+    return known.output_dir
+
+
+def launch_shard(passthrough, num_shards, shard_id, threads, cpus, log_path):
+    env = os.environ.copy()
+    # Keep BLAS/OpenMP pools inside the shard's budget as well as torch
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        env[var] = str(threads)
+
+    preexec_fn = None
+    if cpus is not None:
+        def preexec_fn():
+            os.sched_setaffinity(0, cpus)
+
+    cmd = [sys.executable, SCRIPT_PATH] + passthrough + [
+        '--num_shards', str(num_shards), '--shard_id', str(shard_id), '--threads', str(threads)]
+    log_file = open(log_path, 'w')
+    process = subprocess.Popen(cmd, stdout=log_file, stderr=subprocess.STDOUT, env=env, preexec_fn=preexec_fn)
+    return process, log_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sharded multi-process face metrics evaluation')
+    parser.add_argument('--num_shards', type=int, default=max(1, (os.cpu_count() or 1) // 4),
+                        help='Number of shard processes (default: one per 4 cores)')
+    parser.add_argument('--threads_per_shard', type=int,
+                        help='Torch/BLAS threads per shard (default: available cores / num_shards)')
+    parser.add_argument('--pin_cpus', action='store_true',
+                        help='Pin each shard to its own block of cores (Linux only)')
+    parser.add_argument('--skip_merge', action='store_true',
+                        help='Only run the shards; merge later with metrics_comparison.py --num_shards N')
+    parser.add_argument('passthrough', nargs=argparse.REMAINDER,
+                        help='Arguments for metrics_comparison.py, after --')
+    args = parser.parse_args()
+
+    passthrough = args.passthrough[1:] if args.passthrough[:1] == ['--'] else args.passthrough
+    cpus = available_cpus()
+    threads = args.threads_per_shard or max(1, len(cpus) // args.num_shards)
+    pin = args.pin_cpus and hasattr(os, 'sched_setaffinity')
+
+    log_dir = os.path.join(output_dir_from(passthrough), 'shards')
+    os.makedirs(log_dir, exist_ok=True)
+
+    print(f"Launching {args.num_shards} shards with {threads} threads each ({len(cpus)} cores available)")
+    start_time = time.time()
+    running = []
+    for shard_id in range(args.num_shards):
+        log_path = os.path.join(log_dir, f"shard_{shard_id:03d}_of_{args.num_shards:03d}.log")
+        cpus_for_shard = shard_cpus(cpus, args.num_shards, shard_id) if pin else None
+        process, log_file = launch_shard(passthrough, args.num_shards, shard_id, threads, cpus_for_shard, log_path)
+        running.append((shard_id, process, log_file, log_path))
+
+    failed = []
+    for shard_id, process, log_file, log_path in running:
+        return_code = process.wait()
+        log_file.close()
+        status = 'done' if return_code == 0 else f"FAILED (exit code {return_code})"
+        print(f"  Shard {shard_id}: {status} - log: {log_path}")
+        if return_code != 0:
+            failed.append(shard_id)
+    print(f"Shards finished in {time.time() - start_time:.1f}s")
+
+    if failed:
+        print(f"Error: {len(failed)} shards failed: {failed}. Rerun to resume; finished pairs are kept.")
+        sys.exit(1)
+    if args.skip_merge:
+        return
+
+    print("Merging shard results...")
+    merge_cmd = [sys.executable, SCRIPT_PATH] + passthrough + ['--num_shards', str(args.num_shards)]
+    sys.exit(subprocess.call(merge_cmd))
+
+
+if __name__ == "__main__":
+    main()
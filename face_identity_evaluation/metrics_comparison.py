@@ -1,5 +1,6 @@
 import os
 import json
+import hashlib
 import numpy as np
 import pandas as pd
 from PIL import Image
@@ -9,20 +10,193 @@ from torchvision import transforms
 import matplotlib.pyplot as plt
 import seaborn as sns
 from pathlib import Path
+from collections import Counter
 from tqdm import tqdm
 import sys
 import clip
 from torchmetrics.image.fid import FrechetInceptionDistance
 from torchvision.models import inception_v3
+from scipy import linalg
+from feature_cache import FeatureCache
+from results_store import ResultsStore
+# Bootstrap statistics and file hashing are shared with the other benchmarks through packages at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmark_utils import file_sha256
+from benchmark_stats import (DEFAULT_RESAMPLES, bootstrap_cell_means, sign_flip_cell_sums, combine_cells,
+                             percentile_ci, permutation_p_values)
 import warnings
 warnings.filterwarnings("ignore")
 
+def frechet_distance(mu1, sigma1, mu2, sigma2, eps=1e-6):
+    """Frechet distance between two Gaussians fitted to Inception features"""
+    diff = mu1 - mu2
+    covmean = linalg.sqrtm(sigma1.dot(sigma2))
+    if not np.isfinite(covmean).all():
+        # Singular product - add a small offset to the diagonals
+        offset = np.eye(sigma1.shape[0]) * eps
+        covmean = linalg.sqrtm((sigma1 + offset).dot(sigma2 + offset))
+    if np.iscomplexobj(covmean):
+        covmean = covmean.real
+    return float(diff.dot(diff) + np.trace(sigma1) + np.trace(sigma2) - 2 * np.trace(covmean))
+
+class RunningGaussianStats:
+    """Streaming mean/covariance of feature vectors, accumulated in float64"""
+    
+    def __init__(self):
+        self.num_samples = 0.0
+        self.features_sum = None
+        self.outer_sum = None
+    
+    def update(self, features, weights=None):
+        """Add a batch of feature rows, optionally weighting each row (e.g. repeat counts)"""
+        features = np.asarray(features, dtype=np.float64)
+        if weights is None:
+            weights = np.ones(len(features), dtype=np.float64)
+        if self.features_sum is None:
+            dim = features.shape[1]
+            self.features_sum = np.zeros(dim, dtype=np.float64)
+            self.outer_sum = np.zeros((dim, dim), dtype=np.float64)
+        
+        self.num_samples += float(weights.sum())
+        self.features_sum += weights @ features
+        self.outer_sum += features.T @ (features * weights[:, None])
+    
+    def merge(self, other):
+        """Add the samples accumulated by another instance (e.g. from another shard)"""
+        if other.features_sum is None:
+            return
+        if self.features_sum is None:
+            self.features_sum = np.zeros_like(other.features_sum)
+            self.outer_sum = np.zeros_like(other.outer_sum)
+        self.num_samples += other.num_samples
+        self.features_sum += other.features_sum
+        self.outer_sum += other.outer_sum
+    
+    def mean_cov(self):
+        """Mean and unbiased covariance of everything seen so far"""
+        mean = self.features_sum / self.num_samples
+        cov = (self.outer_sum - self.num_samples * np.outer(mean, mean)) / (self.num_samples - 1)
+        return mean, cov
+    
+    def save_npz(self, path, **metadata):
+        """Save as mu/sigma (the usual FID statistics format) plus sample count and metadata"""
+        mean, cov = self.mean_cov()
+        np.savez(path, mu=mean, sigma=cov, num_samples=self.num_samples, **metadata)
+    
+    @classmethod
+    def load_npz(cls, path):
+        """Rebuild accumulators from saved mu/sigma statistics"""
+        data = np.load(path)
+        stats = cls()
+        stats.num_samples = float(data['num_samples'])
+        mean = data['mu'].astype(np.float64)
+        stats.features_sum = mean * stats.num_samples
+        stats.outer_sum = data['sigma'].astype(np.float64) * (stats.num_samples - 1) + stats.num_samples * np.outer(mean, mean)
+        return stats
+
+def save_partial_fid_stats(path, stats, labels):
+    """Save raw accumulator sums for several targets so shards can be merged exactly"""
+    arrays = {}
+    entries = []
+    for i, (target, target_stats) in enumerate(stats.items()):
+        entries.append({'label': list(labels[target]), 'num_samples': target_stats.num_samples})
+        if target_stats.features_sum is not None:
+            arrays[f"sum_{i}"] = target_stats.features_sum
+            arrays[f"outer_{i}"] = target_stats.outer_sum
+    np.savez(path, entries=json.dumps(entries), **arrays)
+
+def load_partial_fid_stats(path):
+    """Load {label: RunningGaussianStats} saved by save_partial_fid_stats"""
+    data = np.load(path)
+    partials = {}
+    for i, entry in enumerate(json.loads(str(data['entries']))):
+        stats = RunningGaussianStats()
+        if f"sum_{i}" in data:
+            stats.num_samples = entry['num_samples']
+            stats.features_sum = data[f"sum_{i}"]
+            stats.outer_sum = data[f"outer_{i}"]
+        partials[tuple(entry['label'])] = stats
+    return partials
+
+def fid_memberships(groups):
+    """Map each image path to the FID accumulators it feeds and how many times it is listed"""
+    memberships = {}
+    for target, paths in groups.items():
+        for path, count in Counter(paths).items():
+            memberships.setdefault(path, []).append((target, count))
+    return memberships
+
+def update_fid_stats(stats, memberships, paths, features):
+    """Route a batch of Inception features to every accumulator its images belong to"""
+    rows = {}
+    for row, path in enumerate(paths):
+        for target, count in memberships.get(path, ()):
+            target_rows, target_weights = rows.setdefault(target, ([], []))
+            target_rows.append(row)
+            target_weights.append(count)
+    
+    for target, (target_rows, target_weights) in rows.items():
+        stats[target].update(features[target_rows], np.array(target_weights, dtype=np.float64))
+
+def fid_from_stats(real_stats, fake_stats):
+    """FID between two accumulated feature distributions (None if too few images)"""
+    if real_stats.num_samples < 2 or fake_stats.num_samples < 2:
+        print(f"Not enough images for FID calculation: {int(real_stats.num_samples)} original, "
+              f"{int(fake_stats.num_samples)} generated")
+        return None
+    return frechet_distance(*real_stats.mean_cov(), *fake_stats.mean_cov())
+
+def dummy_feature_input(image):
+    """64x64 RGB array used by the dummy UNPG features"""
+    return torch.from_numpy(np.array(image.resize((64, 64))))
+
+class MetricImageDataset(torch.utils.data.Dataset):
+    """Decodes each image once and applies every metric model's transform to it"""
+    
+    def __init__(self, image_paths, model_transforms):
+        self.image_paths = image_paths
+        self.model_transforms = model_transforms
+    
+    def __len__(self):
+        return len(self.image_paths)
+    
+    def __getitem__(self, idx):
+        path = self.image_paths[idx]
+        try:
+            image = Image.open(path).convert('RGB')
+            sample = {name: transform(image) for name, transform in self.model_transforms.items()}
+        except Exception as e:
+            print(f"Error loading image {path}: {e}")
+            return idx, None
+        return idx, sample
+
+def collate_metric_images(samples):
+    """Stack per-model tensors, dropping images that failed to load"""
+    samples = [(idx, sample) for idx, sample in samples if sample is not None]
+    indices = [idx for idx, _ in samples]
+    if not samples:
+        return indices, {}
+    batch = {name: torch.stack([sample[name] for _, sample in samples]) for name in samples[0][1]}
+    return indices, batch
+
+# Bump when the way a metric is computed changes, so stored results are not reused
+PAIR_METRICS_VERSION = 1
+FID_METRICS_VERSION = 1
+
 class MultiMetricEvaluator:
-    def __init__(self, model_path=None, device='cuda' if torch.cuda.is_available() else 'cpu'):
+    def __init__(self, model_path=None, device='cuda' if torch.cuda.is_available() else 'cpu',
+                 cache_dir=None, cache_max_size_gb=None):
         self.device = torch.device(device)
         print(f"Using device: {self.device}")
         
+        # Optional content-addressed feature cache shared across runs
+        self.feature_cache = None
+        if cache_dir:
+            self.feature_cache = FeatureCache(cache_dir, max_size_gb=cache_max_size_gb)
+            print(f"Using feature cache: {cache_dir}")
+        
         # Initialize UNPG model
+        self.model_path = model_path
         self.unpg_model = self.load_unpg_model(model_path)
         self.unpg_transform = transforms.Compose([
             transforms.Resize((112, 112)),
@@ -32,7 +206,8 @@ class MultiMetricEvaluator:
         
         # Initialize CLIP model
         print("Loading CLIP model...")
-        self.clip_model, self.clip_preprocess = clip.load("ViT-B/32", device=self.device)
+        self.clip_arch = "ViT-B/32"
+        self.clip_model, self.clip_preprocess = clip.load(self.clip_arch, device=self.device)
         print("CLIP model loaded successfully")
         
         # Initialize FID calculator
@@ -113,10 +288,15 @@ class MultiMetricEvaluator:
         """Extract dummy features that simulate identity preservation patterns"""
         try:
             image = Image.open(image_path).convert('RGB')
+            return self._dummy_features_from_array(dummy_feature_input(image).numpy(), image_path)
             
-            # Extract more meaningful image features for better simulation
-            img_array = np.array(image.resize((64, 64)))
-            
+        except Exception as e:
+            print(f"Error extracting dummy features from {image_path}: {e}")
+            return None
+    
+    def _dummy_features_from_array(self, img_array, image_path):
+        """Dummy identity features from a 64x64 RGB array (see dummy_feature_input)"""
+        try:
             # Create features based on image content that would affect identity
             rgb_features = img_array.mean(axis=(0,1))  # Average RGB values
             texture_features = np.std(img_array, axis=(0,1))  # Texture variation
@@ -164,7 +344,215 @@ class MultiMetricEvaluator:
         if features1 is None or features2 is None:
             return None
         return float(np.dot(features1, features2))
-    
+
+    def _feature_store(self, model_name):
+        """Feature cache store for one of the metric models, or None when caching is off"""
+        if self.feature_cache is None:
+            return None
+
+        if model_name == 'unpg':
+            if self.unpg_model is None:
+                # Dummy features depend on the filename, not only on image content
+                return None
+            model_key = {
+                'model': 'unpg',
+                'checkpoint': self.feature_cache.content_hash(self.model_path),
+                'transform': repr(self.unpg_transform)
+            }
+            return self.feature_cache.store(model_key, dtype='float16')
+        if model_name == 'clip':
+            model_key = {'model': 'clip', 'arch': self.clip_arch, 'transform': repr(self.clip_preprocess)}
+            return self.feature_cache.store(model_key, dtype='float16')
+        if model_name == 'inception':
+            model_key = {'model': 'inception_v3_fid', 'feature': 2048, 'transform': repr(self.fid_transform)}
+            return self.feature_cache.store(model_key, dtype='float32')
+        raise ValueError(f"Unknown model: {model_name}")
+
+    def fid_reference_stats_path(self, reference_paths, stats_dir):
+        """Path of the .npz reference statistics for a set of original images and this Inception setup"""
+        digest = hashlib.sha256()
+        digest.update(json.dumps({'feature': 2048, 'transform': repr(self.fid_transform)}, sort_keys=True).encode('utf-8'))
+        for file_hash in sorted(file_sha256(path) for path in set(reference_paths)):
+            digest.update(file_hash.encode('utf-8'))
+        return os.path.join(stats_dir, f"fid_reference_{digest.hexdigest()[:16]}.npz")
+
+    def pair_metric_version(self):
+        """Identity of the UNPG/CLIP similarity computation; stored results are reused only under the same version"""
+        if self.unpg_model is not None:
+            unpg_id = file_sha256(self.model_path)[:16]
+        else:
+            unpg_id = 'dummy'
+        return f"v{PAIR_METRICS_VERSION}/unpg={unpg_id}/clip={self.clip_arch}"
+
+    def fid_metric_version(self):
+        """Identity of the FID computation (Inception features and preprocessing)"""
+        digest = hashlib.sha256(repr(self.fid_transform).encode('utf-8')).hexdigest()[:16]
+        return f"v{FID_METRICS_VERSION}/inception_v3_fid/transform={digest}"
+
+    def save_feature_cache(self):
+        """Persist newly computed features (no-op without a cache)"""
+        if self.feature_cache is not None:
+            self.feature_cache.flush()
+
+    def iter_features(self, image_paths, batch_size=32, num_workers=4,
+                      models=('unpg', 'clip', 'inception')):
+        """
+        Stream (model_name, paths, feature_matrix) batches for several metric models.
+
+        Cached features are read from the feature cache batch by batch; images missing
+        for at least one model are decoded once by the DataLoader, and newly computed
+        features are added to the cache as they are produced.
+        """
+        image_paths = list(dict.fromkeys(image_paths))
+        stores = {name: self._feature_store(name) for name in models}
+        missing = {name: set() for name in models}
+        hits = {name: 0 for name in models}
+
+        for i in range(0, len(image_paths), batch_size):
+            batch_paths = image_paths[i:i+batch_size]
+            for name, store in stores.items():
+                if store is None:
+                    missing[name].update(batch_paths)
+                    continue
+                found, to_compute = self.feature_cache.lookup(store, batch_paths)
+                missing[name].update(to_compute)
+                if found:
+                    hits[name] += len(found)
+                    found_paths = list(found)
+                    yield name, found_paths, np.stack([found[path] for path in found_paths])
+
+        for name, store in stores.items():
+            if store is not None:
+                print(f"{name.upper()} feature cache: {hits[name]} hits, {len(missing[name])} to compute")
+
+        active_models = [name for name in models if missing[name]]
+        to_decode = [path for path in image_paths if any(path in missing[name] for name in active_models)]
+        if not to_decode:
+            return
+
+        model_transforms = {}
+        if 'unpg' in active_models:
+            model_transforms['unpg'] = self.unpg_transform if self.unpg_model is not None else dummy_feature_input
+        if 'clip' in active_models:
+            model_transforms['clip'] = self.clip_preprocess
+        if 'inception' in active_models:
+            model_transforms['inception'] = self.fid_transform
+
+        loader = self.make_image_loader(to_decode, model_transforms, batch_size, num_workers)
+        desc = f"Extracting {'/'.join(name.upper() for name in active_models)} features"
+
+        for indices, batch in tqdm(loader, desc=desc, leave=False):
+            batch_paths = [to_decode[i] for i in indices]
+            for name, tensor in batch.items():
+                try:
+                    batch_features = self._forward_model(name, tensor, batch_paths)
+                except Exception as e:
+                    print(f"Error extracting {name.upper()} features for batch starting at {batch_paths[0]}: {e}")
+                    continue
+
+                rows = [(path, feature) for path, feature in zip(batch_paths, batch_features)
+                        if feature is not None and path in missing[name]]
+                if not rows:
+                    continue
+                if stores[name] is not None:
+                    self.feature_cache.add(stores[name], dict(rows))
+                yield name, [path for path, _ in rows], np.stack([feature for _, feature in rows])
+
+    def extract_all_features(self, image_paths, batch_size=32, num_workers=4,
+                             models=('unpg', 'clip', 'inception')):
+        """Extract features for several metric models. Returns {model_name: {path: vector}}"""
+        features = {name: {} for name in models}
+        for name, paths, matrix in self.iter_features(image_paths, batch_size, num_workers, models):
+            features[name].update(zip(paths, matrix))
+        return features
+
+    def extract_unpg_features_batch(self, image_paths, batch_size=32, num_workers=4):
+        """Extract UNPG features for a list of images in batches"""
+        return self.extract_all_features(image_paths, batch_size, num_workers, models=('unpg',))['unpg']
+
+    def extract_clip_features_batch(self, image_paths, batch_size=32, num_workers=4):
+        """Extract normalized CLIP image embeddings for a list of images in batches"""
+        return self.extract_all_features(image_paths, batch_size, num_workers, models=('clip',))['clip']
+
+    def extract_inception_features_batch(self, image_paths, batch_size=32, num_workers=4):
+        """Extract Inception pool features used for FID for a list of images in batches"""
+        return self.extract_all_features(image_paths, batch_size, num_workers, models=('inception',))['inception']
+
+    def make_image_loader(self, image_paths, model_transforms, batch_size=32, num_workers=4):
+        """DataLoader that decodes each image once and applies every model transform to it"""
+        loader_kwargs = {}
+        if num_workers > 0:
+            loader_kwargs['prefetch_factor'] = 4
+        return torch.utils.data.DataLoader(
+            MetricImageDataset(image_paths, model_transforms),
+            batch_size=batch_size,
+            shuffle=False,
+            num_workers=num_workers,
+            pin_memory=self.device.type == 'cuda',
+            collate_fn=collate_metric_images,
+            **loader_kwargs
+        )
+
+    def _forward_model(self, model_name, tensor, batch_paths):
+        """Features for one preprocessed batch; returns a sequence aligned with batch_paths"""
+        if model_name == 'unpg' and self.unpg_model is None:
+            return [self._dummy_features_from_array(array.numpy(), path) for array, path in zip(tensor, batch_paths)]
+
+        tensor = tensor.to(self.device, non_blocking=True)
+        with torch.no_grad():
+            if model_name == 'unpg':
+                return F.normalize(self.unpg_model(tensor).float(), p=2, dim=1).cpu().numpy()
+            if model_name == 'clip':
+                return F.normalize(self.clip_model.encode_image(tensor).float(), p=2, dim=1).cpu().numpy()
+            if model_name == 'inception':
+                # Same input conversion FrechetInceptionDistance.update applies with normalize=True
+                return self.fid_calculator.inception((tensor * 255).byte()).double().cpu().numpy()
+        raise ValueError(f"Unknown model: {model_name}")
+
+    def compute_pair_similarities_batch(self, pairs, batch_size=32, num_workers=4, features=None):
+        """
+        Compute UNPG and CLIP similarities for all pairs at once.
+
+        Every unique image is embedded exactly once, then the similarities of all
+        pairs are computed as a single row-wise dot product over the embedding matrix.
+        Pass `features` from extract_all_features to reuse an earlier extraction.
+        Returns two lists aligned with `pairs`; entries are None where an image failed.
+        """
+        if features is None:
+            unique_paths = sorted({p['original_path'] for p in pairs} | {p['transformed_path'] for p in pairs})
+            print(f"Embedding {len(unique_paths)} unique images for {len(pairs)} pairs (batch size {batch_size})")
+            features = self.extract_all_features(unique_paths, batch_size, num_workers, models=('unpg', 'clip'))
+        unpg_features = features['unpg']
+        clip_features = features['clip']
+
+        return (
+            self._pairwise_cosine(pairs, unpg_features),
+            self._pairwise_cosine(pairs, clip_features)
+        )
+
+    @staticmethod
+    def _pairwise_cosine(pairs, features):
+        """Row-wise dot product of normalized embeddings for every (original, transformed) pair"""
+        similarities = [None] * len(pairs)
+        valid = [i for i, p in enumerate(pairs)
+                 if features.get(p['original_path']) is not None
+                 and features.get(p['transformed_path']) is not None]
+        if not valid:
+            return similarities
+
+        # Build the embedding matrix once and gather pair rows by index
+        paths = [path for path, feature in features.items() if feature is not None]
+        path_index = {path: i for i, path in enumerate(paths)}
+        matrix = np.stack([features[path] for path in paths]).astype(np.float32)
+
+        orig_idx = np.array([path_index[pairs[i]['original_path']] for i in valid])
+        trans_idx = np.array([path_index[pairs[i]['transformed_path']] for i in valid])
+        scores = np.einsum('ij,ij->i', matrix[orig_idx], matrix[trans_idx])
+
+        for i, score in zip(valid, scores):
+            similarities[i] = float(score)
+        return similarities
+
     def compute_clip_similarity(self, image1_path, image2_path):
         """Compute CLIP similarity between two images"""
         try:
@@ -207,78 +595,111 @@ class MultiMetricEvaluator:
         
         return torch.stack(images).to(self.device)
     
-    def compute_fid_score(self, original_images, generated_images, batch_size=32):
-        """Compute FID score between sets of images with batch processing"""
+    def compute_fid_score(self, original_images, generated_images, batch_size=32, num_workers=4, max_images=None,
+                          reference_stats=None):
+        """
+        Compute FID score between sets of images.
+
+        Inception features are streamed batch by batch into running mean/covariance
+        accumulators, so memory stays constant regardless of how many images are used.
+        Set max_images to cap each set (the old default was 200). Pass precomputed
+        reference_stats to skip encoding the original images.
+        """
         try:
-            # Limit number of images for FID calculation to save memory
-            max_images = 200  # Reduced from 1000 to manage memory
-            if len(original_images) > max_images:
+            if max_images is not None:
                 original_images = original_images[:max_images]
-            if len(generated_images) > max_images:
                 generated_images = generated_images[:max_images]
             
-            print(f"Computing FID with {len(original_images)} original and {len(generated_images)} generated images")
-            
-            # Process images in batches to save memory
-            def process_batch(image_paths, batch_size):
-                all_tensors = []
-                num_batches = (len(image_paths) + batch_size - 1) // batch_size
-                
-                for i in tqdm(range(0, len(image_paths), batch_size), 
-                            desc="Processing FID batches", total=num_batches, leave=False):
-                    batch_paths = image_paths[i:i+batch_size]
-                    batch_tensors = self.prepare_fid_images(batch_paths)
-                    if batch_tensors is not None:
-                        all_tensors.append(batch_tensors.cpu())  # Move to CPU to save GPU memory
-                    # Clear GPU cache
-                    if torch.cuda.is_available():
-                        torch.cuda.empty_cache()
-                
-                if len(all_tensors) == 0:
-                    return None
-                return torch.cat(all_tensors, dim=0)
-            
-            # Process in batches
-            orig_tensors = process_batch(original_images, batch_size)
-            gen_tensors = process_batch(generated_images, batch_size)
-            
-            if orig_tensors is None or gen_tensors is None:
-                return None
-            
-            # Ensure we have enough images for FID (minimum 2)
-            if len(orig_tensors) < 2 or len(gen_tensors) < 2:
-                print(f"Not enough images for FID calculation: {len(orig_tensors)} original, {len(gen_tensors)} generated")
-                return None
-            
-            # Move tensors to GPU only when needed for FID calculation
-            orig_tensors = orig_tensors.to(self.device)
-            gen_tensors = gen_tensors.to(self.device)
-            
-            # Update FID calculator with image sets
-            self.fid_calculator.update(orig_tensors, real=True)
-            self.fid_calculator.update(gen_tensors, real=False)
-            
-            # Compute FID score
-            fid_score = self.fid_calculator.compute()
-            
-            # Reset for next calculation
-            self.fid_calculator.reset()
+            groups = {'fake': generated_images}
+            stats = {'fake': RunningGaussianStats()}
+            if reference_stats is None:
+                groups['real'] = original_images
+                stats['real'] = RunningGaussianStats()
+                print(f"Computing FID with {len(original_images)} original and {len(generated_images)} generated images")
+            else:
+                stats['real'] = reference_stats
+                print(f"Computing FID with reference statistics and {len(generated_images)} generated images")
             
-            # Clear GPU memory
-            del orig_tensors, gen_tensors
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
+            memberships = fid_memberships(groups)
+            image_paths = [path for paths in groups.values() for path in paths]
+            for _, paths, features in self.iter_features(image_paths, batch_size, num_workers, models=('inception',)):
+                update_fid_stats(stats, memberships, paths, features)
             
-            return float(fid_score.cpu().item())
+            return fid_from_stats(stats['real'], stats['fake'])
             
         except Exception as e:
             print(f"Error computing FID score: {e}")
-            # Clear GPU memory on error
+            return None
+        finally:
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
-            return None
 
-def find_three_level_image_pairs(original_dir, results_dirs):
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+def scan_image_files(directory, manifest=None):
+    """
+    List image files in a directory with a single os.scandir pass.
+    If a manifest dict is given, the listing is reused while the directory mtime is unchanged.
+    """
+    key = os.path.abspath(directory)
+    mtime_ns = os.stat(directory).st_mtime_ns
+    if manifest is not None:
+        cached = manifest.get(key)
+        if cached is not None and cached['mtime_ns'] == mtime_ns:
+            return cached['files']
+    
+    with os.scandir(directory) as entries:
+        files = [entry.name for entry in entries
+                 if entry.name.lower().endswith(IMAGE_EXTENSIONS)]
+    
+    if manifest is not None:
+        manifest[key] = {'mtime_ns': mtime_ns, 'files': files}
+    return files
+
+def index_results_dir(files, original_names):
+    """
+    Group result filenames by original image in one pass.
+    Expected naming: original_name_category_intensity_promptid.png
+    Returns {original_name: [(filename, category, intensity, prompt_id), ...]}
+    """
+    index = {}
+    for file in files:
+        file_base = os.path.splitext(file)[0]
+        # Every '_' is a possible end of the original name (names may contain '_' themselves)
+        sep = file_base.find('_')
+        while sep != -1:
+            original_name = file_base[:sep]
+            if original_name in original_names:
+                parts = file_base[sep + 1:].split('_')
+                if len(parts) >= 3:
+                    try:
+                        entry = (file, parts[0], parts[1], int(parts[2]))
+                    except ValueError:
+                        # Skip files that don't match expected naming convention
+                        entry = None
+                    if entry is not None:
+                        index.setdefault(original_name, []).append(entry)
+            sep = file_base.find('_', sep + 1)
+    return index
+
+def load_pair_manifest(manifest_path):
+    """Load the directory listing manifest (empty if missing or unreadable)"""
+    if manifest_path and os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            print(f"Warning: Ignoring unreadable pair manifest: {manifest_path}")
+    return {}
+
+def save_pair_manifest(manifest_path, manifest):
+    """Write the directory listing manifest atomically"""
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+def find_three_level_image_pairs(original_dir, results_dirs, manifest_path=None):
     """
     Find image pairs for three-level prompt complexity evaluation
     Expected structure:
@@ -287,100 +708,365 @@ def find_three_level_image_pairs(original_dir, results_dirs):
                       "openai_simple": path, "openai_mid": path, "openai_maximal": path}
     
     Expected naming: original_name_category_intensity_promptid.png
+    
+    Each directory is listed once and indexed by original name. With manifest_path,
+    listings of directories whose mtime has not changed are read from the manifest.
     """
     pairs = []
+    manifest = load_pair_manifest(manifest_path) if manifest_path else None
     
     # Get original images
-    original_files = [f for f in os.listdir(original_dir) 
-                     if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    original_files = scan_image_files(original_dir, manifest)
+    original_names = {os.path.splitext(f)[0] for f in original_files}
     
     print(f"Found {len(original_files)} original images")
     
+    # Index every results directory once
+    indexed_dirs = []
+    for api_level_key, results_dir in results_dirs.items():
+        if not os.path.exists(results_dir):
+            print(f"Warning: Results directory not found: {results_dir}")
+            continue
+        
+        # Parse API and level from key (e.g., "flymy_simple" -> "flymy", "simple")
+        if '_' in api_level_key:
+            api_name, complexity_level = api_level_key.split('_', 1)
+        else:
+            api_name = api_level_key
+            complexity_level = "unknown"
+        
+        index = index_results_dir(scan_image_files(results_dir, manifest), original_names)
+        indexed_dirs.append((api_name, complexity_level, results_dir, index))
+    
+    if manifest is not None:
+        save_pair_manifest(manifest_path, manifest)
+    
     for original_file in original_files:
         original_path = os.path.join(original_dir, original_file)
         original_name = os.path.splitext(original_file)[0]
         
-        for api_level_key, results_dir in results_dirs.items():
-            if not os.path.exists(results_dir):
-                print(f"Warning: Results directory not found: {results_dir}")
-                continue
-            
-            # Parse API and level from key (e.g., "flymy_simple" -> "flymy", "simple")
-            if '_' in api_level_key:
-                api_name, complexity_level = api_level_key.split('_', 1)
-            else:
-                api_name = api_level_key
-                complexity_level = "unknown"
-            
-            # Look for transformed images following naming convention
-            for file in os.listdir(results_dir):
-                if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    # Parse filename: original_name_category_intensity_promptid.png
-                    file_base = os.path.splitext(file)[0]
-                    
-                    # Check if this file belongs to our original image
-                    if file_base.startswith(original_name + '_'):
-                        try:
-                            # Extract parts after original name
-                            remaining = file_base[len(original_name + '_'):]
-                            parts = remaining.split('_')
-                            
-                            if len(parts) >= 3:
-                                # Extract category, intensity, and prompt_id
-                                category = parts[0]
-                                intensity = parts[1]
-                                prompt_id = int(parts[2])
-                                
-                                pairs.append({
-                                    'original_path': original_path,
-                                    'original_name': original_name,
-                                    'transformed_path': os.path.join(results_dir, file),
-                                    'api': api_name,
-                                    'complexity_level': complexity_level,
-                                    'category': category,
-                                    'intensity': intensity,
-                                    'prompt_id': prompt_id,
-                                    'filename': file
-                                })
-                        except (ValueError, IndexError):
-                            # Skip files that don't match expected naming convention
-                            continue
+        for api_name, complexity_level, results_dir, index in indexed_dirs:
+            for file, category, intensity, prompt_id in index.get(original_name, ()):
+                pairs.append({
+                    'original_path': original_path,
+                    'original_name': original_name,
+                    'transformed_path': os.path.join(results_dir, file),
+                    'api': api_name,
+                    'complexity_level': complexity_level,
+                    'category': category,
+                    'intensity': intensity,
+                    'prompt_id': prompt_id,
+                    'filename': file
+                })
     
     return pairs
 
-def evaluate_three_level_identity_preservation(evaluator, pairs, output_dir):
-    """Evaluate identity preservation using multiple metrics across three complexity levels"""
+PAIR_RESULT_KEY = ('original_name', 'api', 'complexity_level', 'filename', 'metric_version')
+FID_RESULT_KEY = ('group', 'signature')
+
+def fid_group_signature(real_paths, fake_paths, metric_version, reference=None):
+    """Identify the exact image sets (and order) a group's FID score was computed from"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps({'version': metric_version, 'reference': reference}, sort_keys=True).encode('utf-8'))
+    for paths in (real_paths or [], fake_paths):
+        digest.update(json.dumps(list(paths)).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def shard_output_dir(output_dir, num_shards, shard_id):
+    """Directory holding the per-shard result files"""
+    return os.path.join(output_dir, 'shards', f"shard_{shard_id:03d}_of_{num_shards:03d}")
+
+class FIDPlan:
+    """FID image sets per API-complexity group and the signatures their scores are stored under"""
+    
+    def __init__(self, evaluator, pairs, output_dir, fid_max_images=None, fid_shared_reference=False,
+                 fid_stats_dir=None):
+        self.shared_reference = fid_shared_reference
+        self.version = evaluator.fid_metric_version()
+        
+        # Group pairs by API-complexity for FID calculation
+        self.groups = {}
+        for pair in pairs:
+            key = f"{pair['api']}_{pair['complexity_level']}"
+            if key not in self.groups:
+                self.groups[key] = {'original': [], 'transformed': []}
+            self.groups[key]['original'].append(pair['original_path'])
+            self.groups[key]['transformed'].append(pair['transformed_path'])
+        
+        # In shared-reference mode every group is compared against one set of statistics
+        # over the unique originals, computed once and persisted as .npz; otherwise each
+        # group uses its originals repeated per pair.
+        self.reference_paths = None
+        self.reference_stats_path = None
+        reference = None
+        if fid_shared_reference:
+            self.reference_paths = sorted({p['original_path'] for p in pairs})
+            self.reference_stats_path = evaluator.fid_reference_stats_path(self.reference_paths, fid_stats_dir or output_dir)
+            reference = os.path.basename(self.reference_stats_path)
+        
+        self.image_sets = {}
+        self.signatures = {}
+        for group_key, paths in self.groups.items():
+            if not fid_shared_reference:
+                self.image_sets[(group_key, 'real')] = paths['original'][:fid_max_images]
+            self.image_sets[(group_key, 'fake')] = paths['transformed'][:fid_max_images]
+            self.signatures[group_key] = fid_group_signature(
+                self.image_sets.get((group_key, 'real')), self.image_sets[(group_key, 'fake')], self.version, reference)
+    
+    def label(self, target):
+        """Stable identity of an accumulator target across processes"""
+        group_key, role = target
+        if group_key == 'reference':
+            return (group_key, role, os.path.basename(self.reference_stats_path))
+        return (group_key, role, self.signatures[group_key])
+    
+    def stored_scores(self, fid_store):
+        """FID scores already stored for groups whose image sets have not changed"""
+        scores = {}
+        for group_key, signature in self.signatures.items():
+            stored = fid_store.get((group_key, signature))
+            if stored is not None:
+                scores[group_key] = stored['fid_score']
+        return scores
+    
+    def targets(self, group_keys, need_reference, shard=None):
+        """Image sets to accumulate for the given groups, optionally only one shard's slice of each"""
+        image_sets = {}
+        if need_reference:
+            image_sets[('reference', 'real')] = self.reference_paths
+        for group_key in group_keys:
+            for role in ('real', 'fake'):
+                if (group_key, role) in self.image_sets:
+                    image_sets[(group_key, role)] = self.image_sets[(group_key, role)]
+        if shard is not None:
+            num_shards, shard_id = shard
+            image_sets = {target: paths[shard_id::num_shards] for target, paths in image_sets.items()}
+        return image_sets
+    
+    def save_reference(self, reference_stats):
+        if reference_stats.num_samples >= 2:
+            os.makedirs(os.path.dirname(self.reference_stats_path), exist_ok=True)
+            reference_stats.save_npz(self.reference_stats_path, image_paths=np.array(self.reference_paths))
+            print(f"Saved FID reference statistics for {int(reference_stats.num_samples)} originals: {self.reference_stats_path}")
+
+def merge_shard_results(evaluator, pairs, output_dir, num_shards, fid_max_images=None, fid_shared_reference=False,
+                        fid_stats_dir=None):
+    """
+    Fold per-shard results into the main results store.
+    
+    Shard pair records are appended in shard order, and partial FID accumulators are
+    summed in shard order, so the merge is deterministic. Groups missing a shard's
+    partial statistics are left for the main evaluation pass to compute.
+    """
+    pair_store = ResultsStore(os.path.join(output_dir, 'pair_results.jsonl'), PAIR_RESULT_KEY)
+    fid_store = ResultsStore(os.path.join(output_dir, 'fid_results.jsonl'), FID_RESULT_KEY)
+    plan = FIDPlan(evaluator, pairs, output_dir, fid_max_images, fid_shared_reference, fid_stats_dir)
+    
+    merged_partials = {}
+    shards_seen = {}
+    num_records = 0
+    for shard_id in range(num_shards):
+        shard_dir = shard_output_dir(output_dir, num_shards, shard_id)
+        shard_store = ResultsStore(os.path.join(shard_dir, 'pair_results.jsonl'), PAIR_RESULT_KEY)
+        new_records = [record for key, record in shard_store.records.items() if key not in pair_store]
+        pair_store.append(new_records)
+        num_records += len(new_records)
+        
+        partial_path = os.path.join(shard_dir, 'fid_partial_stats.npz')
+        if not os.path.exists(partial_path):
+            print(f"Warning: No FID statistics from shard {shard_id}: {partial_path}")
+            continue
+        for label, stats in load_partial_fid_stats(partial_path).items():
+            merged_partials.setdefault(label, RunningGaussianStats()).merge(stats)
+            shards_seen[label] = shards_seen.get(label, 0) + 1
+    print(f"Merged {num_records} pair results from {num_shards} shards")
+    
+    def complete(target):
+        return shards_seen.get(plan.label(target), 0) == num_shards
+    
+    reference_stats = None
+    if fid_shared_reference:
+        if os.path.exists(plan.reference_stats_path):
+            reference_stats = RunningGaussianStats.load_npz(plan.reference_stats_path)
+        elif complete(('reference', 'real')):
+            reference_stats = merged_partials[plan.label(('reference', 'real'))]
+            plan.save_reference(reference_stats)
+    
+    stored_scores = plan.stored_scores(fid_store)
+    for group_key in plan.groups:
+        if group_key in stored_scores:
+            continue
+        targets = [(group_key, 'fake')] + ([] if fid_shared_reference else [(group_key, 'real')])
+        if not all(complete(target) for target in targets) or (fid_shared_reference and reference_stats is None):
+            continue
+        real_stats = reference_stats if fid_shared_reference else merged_partials[plan.label((group_key, 'real'))]
+        fake_stats = merged_partials[plan.label((group_key, 'fake'))]
+        try:
+            fid_score = fid_from_stats(real_stats, fake_stats)
+        except Exception as e:
+            print(f"Error computing FID score: {e}")
+            fid_score = None
+        print(f"  FID for {group_key} (merged): {fid_score}")
+        if fid_score is not None:
+            fid_store.append([{'group': group_key, 'signature': plan.signatures[group_key],
+                               'fid_score': fid_score, 'metric_version': plan.version}])
+
+def evaluate_three_level_identity_preservation(evaluator, pairs, output_dir, batch_size=32, num_workers=4,
+                                               fid_max_images=None, fid_shared_reference=False, fid_stats_dir=None,
+                                               resume=True, num_shards=1, shard_id=None):
+    """
+    Evaluate identity preservation using multiple metrics across three complexity levels
+    
+    Pair similarities are appended to output_dir/pair_results.jsonl as soon as both images
+    of a pair are embedded, and group FID scores to output_dir/fid_results.jsonl. With
+    resume=True, pairs and FID groups already stored under the current metric versions
+    are not recomputed.
+    
+    With shard_id set, only every num_shards-th pair (and FID image) is processed: pair
+    results and partial FID statistics are written to the shard's directory and None is
+    returned. A later call with num_shards > 1 and no shard_id merges the shards first.
+    """
     results = []
+    sharded = shard_id is not None
+    if num_shards > 1 and not sharded:
+        merge_shard_results(evaluator, pairs, output_dir, num_shards, fid_max_images, fid_shared_reference, fid_stats_dir)
+    
+    pair_store = ResultsStore(os.path.join(output_dir, 'pair_results.jsonl'), PAIR_RESULT_KEY)
+    fid_store = ResultsStore(os.path.join(output_dir, 'fid_results.jsonl'), FID_RESULT_KEY)
+    pair_version = evaluator.pair_metric_version()
+    
+    def pair_key(pair):
+        return (pair['original_name'], pair['api'], pair['complexity_level'], pair['filename'], pair_version)
+    
+    if sharded:
+        shard_dir = shard_output_dir(output_dir, num_shards, shard_id)
+        shard_store = ResultsStore(os.path.join(shard_dir, 'pair_results.jsonl'), PAIR_RESULT_KEY)
+        shard_pairs = pairs[shard_id::num_shards]
+        print(f"Shard {shard_id + 1}/{num_shards}: evaluating {len(shard_pairs)} of {len(pairs)} image pairs...")
+        pending_pairs = [p for p in shard_pairs
+                         if not (resume and (pair_key(p) in pair_store or pair_key(p) in shard_store))]
+        print(f"{len(shard_pairs) - len(pending_pairs)} pairs already scored, {len(pending_pairs)} to compute")
+        pair_store = shard_store
+    else:
+        print(f"Evaluating {len(pairs)} image pairs with multiple metrics...")
+        pending_pairs = [p for p in pairs if not (resume and pair_key(p) in pair_store)]
+        print(f"{len(pairs) - len(pending_pairs)} pairs already scored, {len(pending_pairs)} to compute")
+    
+    # Reuse stored FID scores for groups whose image sets have not changed
+    plan = FIDPlan(evaluator, pairs, output_dir, fid_max_images, fid_shared_reference, fid_stats_dir)
+    fid_scores = plan.stored_scores(fid_store) if resume else {}
+    fid_pending = [group_key for group_key in plan.groups if group_key not in fid_scores]
+    if fid_scores:
+        print(f"Reusing stored FID scores for {len(fid_scores)} groups, {len(fid_pending)} to compute")
     
-    print(f"Evaluating {len(pairs)} image pairs with multiple metrics...")
+    # Running Inception statistics per target image set
+    reference_stats = None
+    if fid_shared_reference and fid_pending and os.path.exists(plan.reference_stats_path):
+        reference_stats = RunningGaussianStats.load_npz(plan.reference_stats_path)
+        print(f"Loaded FID reference statistics for {int(reference_stats.num_samples)} originals: {plan.reference_stats_path}")
+    need_reference = fid_shared_reference and bool(fid_pending) and reference_stats is None
+    fid_image_sets = plan.targets(fid_pending, need_reference, shard=(num_shards, shard_id) if sharded else None)
+    fid_stats = {target: RunningGaussianStats() for target in fid_image_sets}
+    fid_targets = fid_memberships(fid_image_sets)
     
-    # Group pairs by API-complexity for FID calculation
-    fid_groups = {}
-    for pair in pairs:
-        key = f"{pair['api']}_{pair['complexity_level']}"
-        if key not in fid_groups:
-            fid_groups[key] = {'original': [], 'transformed': []}
-        fid_groups[key]['original'].append(pair['original_path'])
-        fid_groups[key]['transformed'].append(pair['transformed_path'])
+    # Pending pairs waiting on the UNPG/CLIP features of each image
+    waiting = {}
+    for i, pair in enumerate(pending_pairs):
+        waiting.setdefault(pair['original_path'], []).append(i)
+        waiting.setdefault(pair['transformed_path'], []).append(i)
+    scored = {}
+    
+    def score_ready(paths):
+        """Score pending pairs whose images now have both UNPG and CLIP features, and persist them"""
+        ready = sorted({i for path in paths for i in waiting.get(path, ())
+                        if i not in scored
+                        and all(pending_pairs[i][side] in features[name]
+                                for name in ('unpg', 'clip')
+                                for side in ('original_path', 'transformed_path'))})
+        if not ready:
+            return
+        ready_pairs = [pending_pairs[i] for i in ready]
+        ready_paths = {p[side] for p in ready_pairs for side in ('original_path', 'transformed_path')}
+        ready_features = {name: {path: features[name][path] for path in ready_paths} for name in ('unpg', 'clip')}
+        unpg_similarities, clip_similarities = evaluator.compute_pair_similarities_batch(ready_pairs, features=ready_features)
+        records = []
+        for i, pair, unpg_similarity, clip_similarity in zip(ready, ready_pairs, unpg_similarities, clip_similarities):
+            scored[i] = (unpg_similarity, clip_similarity)
+            records.append({
+                'original_name': pair['original_name'],
+                'api': pair['api'],
+                'complexity_level': pair['complexity_level'],
+                'category': pair['category'],
+                'intensity': pair['intensity'],
+                'prompt_id': pair['prompt_id'],
+                'filename': pair['filename'],
+                'unpg_similarity': unpg_similarity,
+                'clip_similarity': clip_similarity,
+                'metric_version': pair_version
+            })
+        pair_store.append(records)
+    
+    # Decode every unique image once and run the metric models it is still needed for
+    pair_paths = set(waiting)
+    fid_paths = set(fid_targets)
+    unique_paths = sorted(pair_paths | fid_paths)
+    models = (('unpg', 'clip') if pair_paths else ()) + (('inception',) if fid_paths else ())
+    features = {'unpg': {}, 'clip': {}}
+    if unique_paths:
+        print(f"Extracting {'/'.join(name.upper() for name in models)} features for {len(unique_paths)} unique images "
+              f"(batch size {batch_size}, {num_workers} loader workers)")
+        for model_name, paths, batch_features in evaluator.iter_features(unique_paths, batch_size, num_workers, models=models):
+            if model_name == 'inception':
+                # Inception features only feed the FID accumulators and are not kept in memory
+                update_fid_stats(fid_stats, fid_targets, paths, batch_features)
+            else:
+                features[model_name].update(zip(paths, batch_features))
+                score_ready(paths)
+        evaluator.save_feature_cache()
+    
+    if sharded:
+        # FID needs every shard's images; leave the sums for the merge step
+        os.makedirs(shard_dir, exist_ok=True)
+        save_partial_fid_stats(os.path.join(shard_dir, 'fid_partial_stats.npz'), fid_stats,
+                               {target: plan.label(target) for target in fid_stats})
+        print(f"Shard {shard_id + 1}/{num_shards} done: {len(scored)} pairs scored, results in {shard_dir}")
+        return None
+    
+    if need_reference:
+        reference_stats = fid_stats[('reference', 'real')]
+        plan.save_reference(reference_stats)
     
     # Calculate FID scores for each group
-    fid_scores = {}
     print("Computing FID scores...")
-    for group_key, paths in tqdm(fid_groups.items(), desc="Computing FID scores"):
-        print(f"  FID for {group_key}: {len(paths['original'])} image pairs")
-        fid_score = evaluator.compute_fid_score(paths['original'], paths['transformed'])
+    for group_key in tqdm(fid_pending, desc="Computing FID scores"):
+        real_stats = reference_stats if fid_shared_reference else fid_stats[(group_key, 'real')]
+        fake_stats = fid_stats[(group_key, 'fake')]
+        print(f"  FID for {group_key}: {int(real_stats.num_samples)} original, {int(fake_stats.num_samples)} generated images")
+        try:
+            fid_score = fid_from_stats(real_stats, fake_stats)
+        except Exception as e:
+            print(f"Error computing FID score: {e}")
+            fid_score = None
         fid_scores[group_key] = fid_score
         print(f"  FID score: {fid_score}")
+        if fid_score is not None:
+            fid_store.append([{'group': group_key, 'signature': plan.signatures[group_key],
+                               'fid_score': fid_score, 'metric_version': plan.version}])
     
-    # Evaluate individual pairs
+    # Pairs with a failed image are reported with missing similarities but not stored,
+    # so they are retried on the next run
+    for i in range(len(pending_pairs)):
+        scored.setdefault(i, (None, None))
+    pending_index = {pair_key(pair): i for i, pair in enumerate(pending_pairs)}
+
+    # Assemble results for all pairs from this run and the results store
     for pair in tqdm(pairs, desc="Evaluating pairs"):
-        # UNPG similarity
-        original_features = evaluator.extract_unpg_features(pair['original_path'])
-        transformed_features = evaluator.extract_unpg_features(pair['transformed_path'])
-        unpg_similarity = evaluator.compute_unpg_similarity(original_features, transformed_features)
-        
-        # CLIP similarity
-        clip_similarity = evaluator.compute_clip_similarity(pair['original_path'], pair['transformed_path'])
+        key = pair_key(pair)
+        if key in pending_index:
+            unpg_similarity, clip_similarity = scored[pending_index[key]]
+        else:
+            stored = pair_store.get(key)
+            unpg_similarity, clip_similarity = stored['unpg_similarity'], stored['clip_similarity']
         
         # Get FID score for this group
         group_key = f"{pair['api']}_{pair['complexity_level']}"
@@ -407,8 +1093,163 @@ def evaluate_three_level_identity_preservation(evaluator, pairs, output_dir):
     
     return df
 
-def analyze_three_level_results(df, output_dir):
-    """Analyze and visualize three-level benchmark results with multiple metrics"""
+METRIC_COLUMNS = {'UNPG': 'unpg_similarity', 'CLIP': 'clip_similarity', 'FID': 'fid_score'}
+
+# Metrics with one value per pair; FID is a single score per API-complexity group
+BOOTSTRAP_METRICS = ['UNPG', 'CLIP']
+
+# Every grouping the analysis reports; per-category tables are the category-prefixed ones
+STAT_GROUPINGS = [
+    ('api', 'complexity_level'),
+    ('category', 'complexity_level'),
+    ('api',),
+    ('complexity_level',),
+    ('category', 'api', 'complexity_level'),
+    ('category', 'api'),
+]
+
+# Cells within which APIs are compared against each other
+PAIRED_TEST_GROUPINGS = [(), ('complexity_level',), ('category',), ('category', 'complexity_level')]
+
+def compute_metric_stats(df, n_resamples=DEFAULT_RESAMPLES, confidence=0.95, seed=0):
+    """
+    Tidy table of count/mean/std/median for every metric under every grouping in STAT_GROUPINGS.
+    
+    All metrics are stacked into one long frame, so each grouping is a single groupby
+    over all metrics. Columns: metric, grouping, category, api, complexity_level,
+    count, mean, std, median, ci_low, ci_high (dimensions not in the grouping are NaN).
+    Bootstrap CIs of the mean are filled for the per-pair metrics (UNPG/CLIP) unless
+    n_resamples is 0.
+    """
+    value_cols = {col: name for name, col in METRIC_COLUMNS.items() if col in df.columns}
+    long_df = df.melt(id_vars=['category', 'api', 'complexity_level'], value_vars=list(value_cols),
+                      var_name='metric', value_name='value')
+    long_df['value'] = pd.to_numeric(long_df['value'])
+    long_df = long_df.dropna(subset=['value'])
+    long_df['metric'] = long_df['metric'].map(value_cols)
+    
+    tables = []
+    for dims in STAT_GROUPINGS:
+        stats = long_df.groupby(['metric', *dims])['value'].agg(['count', 'mean', 'std', 'median']).reset_index()
+        stats.insert(1, 'grouping', '+'.join(dims))
+        tables.append(stats)
+    columns = ['metric', 'grouping', 'category', 'api', 'complexity_level', 'count', 'mean', 'std', 'median',
+               'ci_low', 'ci_high']
+    stats = pd.concat(tables, ignore_index=True).reindex(columns=columns[:-2])
+    
+    if n_resamples:
+        # FID is one score per API-complexity group, so only per-pair metrics are resampled
+        pair_metrics = long_df[long_df['metric'].isin(BOOTSTRAP_METRICS)]
+        cis = bootstrap_metric_cis(pair_metrics, n_resamples, confidence, seed)
+        if not cis.empty:
+            stats = stats.merge(cis, on=columns[:5], how='left')
+    return stats.reindex(columns=columns)
+
+def bootstrap_metric_cis(long_df, n_resamples=DEFAULT_RESAMPLES, confidence=0.95, seed=0):
+    """
+    Bootstrap CIs of the mean for every metric and grouping in STAT_GROUPINGS.
+    
+    Each metric is resampled once within its finest (category, api, complexity_level)
+    cells; every coarser grouping combines the same resampled cell means.
+    """
+    tables = []
+    finest = ['category', 'api', 'complexity_level']
+    for metric_name, metric_df in long_df.groupby('metric'):
+        cell_codes = metric_df.groupby(finest, sort=True).ngroup().to_numpy()
+        _, sizes, resampled = bootstrap_cell_means(metric_df['value'].to_numpy(), cell_codes, n_resamples, seed)
+        cells = metric_df[finest].drop_duplicates().sort_values(finest).reset_index(drop=True)
+        for dims in STAT_GROUPINGS:
+            group_codes = cells.groupby(list(dims), sort=True).ngroup().to_numpy()
+            ci_low, ci_high = percentile_ci(combine_cells(resampled, sizes, group_codes), confidence)
+            table = cells[list(dims)].drop_duplicates().sort_values(list(dims)).reset_index(drop=True)
+            table.insert(0, 'metric', metric_name)
+            table.insert(1, 'grouping', '+'.join(dims))
+            table['ci_low'] = ci_low
+            table['ci_high'] = ci_high
+            tables.append(table)
+    if not tables:
+        return pd.DataFrame()
+    return pd.concat(tables, ignore_index=True).reindex(
+        columns=['metric', 'grouping', 'category', 'api', 'complexity_level', 'ci_low', 'ci_high'])
+
+def compute_paired_api_tests(df, n_resamples=DEFAULT_RESAMPLES, seed=0):
+    """
+    Paired sign-flip permutation tests of the mean difference between every two APIs.
+    
+    Pairs are matched on (original, category, intensity, prompt, complexity level), so
+    each API is compared on exactly the same edits. Tests are reported overall and per
+    complexity level, category and category x complexity level.
+    """
+    match_keys = ['original_name', 'category', 'intensity', 'prompt_id', 'complexity_level']
+    rows = []
+    for metric_name in BOOTSTRAP_METRICS:
+        metric_col = METRIC_COLUMNS[metric_name]
+        if metric_col not in df.columns:
+            continue
+        wide = df.pivot_table(index=match_keys, columns='api', values=metric_col, aggfunc='mean').reset_index()
+        apis = sorted(api for api in wide.columns if api not in match_keys)
+        for i, api_a in enumerate(apis):
+            for api_b in apis[i+1:]:
+                matched = wide.dropna(subset=[api_a, api_b])
+                if matched.empty:
+                    continue
+                differences = (matched[api_a] - matched[api_b]).to_numpy()
+                cell_keys = ['category', 'complexity_level']
+                cell_codes = matched.groupby(cell_keys, sort=True).ngroup().to_numpy()
+                _, sizes, observed, null = sign_flip_cell_sums(differences, cell_codes, n_resamples, seed)
+                cells = matched[cell_keys].drop_duplicates().sort_values(cell_keys).reset_index(drop=True)
+                for dims in PAIRED_TEST_GROUPINGS:
+                    if dims:
+                        group_codes = cells.groupby(list(dims), sort=True).ngroup().to_numpy()
+                        groups = cells[list(dims)].drop_duplicates().sort_values(list(dims)).reset_index(drop=True)
+                    else:
+                        group_codes = np.zeros(len(cells), dtype=int)
+                        groups = pd.DataFrame(index=[0])
+                    group_sizes = combine_cells(sizes, sizes, group_codes, weighted_mean=False)
+                    group_sums = combine_cells(observed, sizes, group_codes, weighted_mean=False)
+                    null_sums = combine_cells(null, sizes, group_codes, weighted_mean=False)
+                    p_values = permutation_p_values(group_sums, null_sums)
+                    for g, group in groups.iterrows():
+                        rows.append({
+                            'metric': metric_name,
+                            'api_a': api_a,
+                            'api_b': api_b,
+                            'grouping': '+'.join(dims) or 'overall',
+                            'category': group.get('category'),
+                            'complexity_level': group.get('complexity_level'),
+                            'n_pairs': int(group_sizes[g]),
+                            'mean_diff': group_sums[g] / group_sizes[g],
+                            'p_value': p_values[g]
+                        })
+    return pd.DataFrame(rows)
+
+def metric_stats_view(stats, metric_name, dims):
+    """Rows of the tidy table for one metric and grouping, indexed like the equivalent groupby().agg()"""
+    view = stats[(stats['metric'] == metric_name) & (stats['grouping'] == '+'.join(dims))]
+    return view.set_index(list(dims))[['count', 'mean', 'std', 'median']]
+
+def per_category_views(stats, metric_name, dims):
+    """Split a category-prefixed grouping into {category: table without the category level}"""
+    view = metric_stats_view(stats, metric_name, ('category',) + dims)
+    return {category: table.droplevel('category') for category, table in view.groupby(level='category', sort=False)}
+
+def save_metric_stats(stats, output_dir):
+    """Write the tidy stats table as Parquet (CSV if no Parquet engine is installed)"""
+    try:
+        path = os.path.join(output_dir, 'metric_stats.parquet')
+        stats.to_parquet(path, index=False)
+    except ImportError:
+        path = os.path.join(output_dir, 'metric_stats.csv')
+        stats.to_csv(path, index=False)
+    print(f"Saved tidy metric statistics: {path}")
+
+def analyze_three_level_results(df, output_dir, n_resamples=DEFAULT_RESAMPLES, seed=0):
+    """
+    Analyze and visualize three-level benchmark results with multiple metrics
+    
+    n_resamples sets the bootstrap/permutation resamples for confidence intervals and
+    paired API tests (0 disables both).
+    """
     print("\n" + "="*80)
     print("MULTI-METRIC THREE-LEVEL PROMPT COMPLEXITY BENCHMARK RESULTS")
     print("="*80)
@@ -433,6 +1274,11 @@ def analyze_three_level_results(df, output_dir):
     
     print(f"Available metrics: {', '.join(metrics_available)}")
     
+    # All grouped statistics for all metrics in one tidy table
+    metric_stats = compute_metric_stats(df, n_resamples=n_resamples, seed=seed)
+    os.makedirs(output_dir, exist_ok=True)
+    save_metric_stats(metric_stats, output_dir)
+    
     # Create analysis for each available metric
     all_stats = {}
     
@@ -449,16 +1295,16 @@ def analyze_three_level_results(df, output_dir):
         print("="*40)
         
         # API comparison across complexity levels
-        api_complexity_stats = metric_df.groupby(['api', 'complexity_level'])[metric_col].agg(['count', 'mean', 'std', 'median']).round(6)
+        api_complexity_stats = metric_stats_view(metric_stats, metric_name, ('api', 'complexity_level')).round(6)
         
         # Category comparison across complexity levels
-        category_complexity_stats = metric_df.groupby(['category', 'complexity_level'])[metric_col].agg(['count', 'mean', 'std', 'median']).round(6)
+        category_complexity_stats = metric_stats_view(metric_stats, metric_name, ('category', 'complexity_level')).round(6)
         
         # Overall API performance
-        api_overall_stats = metric_df.groupby('api')[metric_col].agg(['count', 'mean', 'std', 'median']).round(6)
+        api_overall_stats = metric_stats_view(metric_stats, metric_name, ('api',)).round(6)
         
         # Complexity level impact
-        complexity_overall_stats = metric_df.groupby('complexity_level')[metric_col].agg(['count', 'mean', 'std', 'median']).round(6)
+        complexity_overall_stats = metric_stats_view(metric_stats, metric_name, ('complexity_level',)).round(6)
         
         # Store stats
         all_stats[metric_name] = {
@@ -468,14 +1314,16 @@ def analyze_three_level_results(df, output_dir):
             'complexity_overall': complexity_overall_stats
         }
         
-        # Per-category detailed analysis
+        # Per-category detailed analysis, split out of the category-level groupings
+        category_tables = {
+            'api_complexity': per_category_views(metric_stats, metric_name, ('api', 'complexity_level')),
+            'api_overall': per_category_views(metric_stats, metric_name, ('api',)),
+            'complexity_overall': per_category_views(metric_stats, metric_name, ('complexity_level',))
+        }
         per_category_detailed = {}
         for category in metric_df['category'].unique():
-            category_data = metric_df[metric_df['category'] == category]
             per_category_detailed[category] = {
-                'api_complexity': category_data.groupby(['api', 'complexity_level'])[metric_col].agg(['count', 'mean', 'std', 'median']).round(6),
-                'api_overall': category_data.groupby('api')[metric_col].agg(['count', 'mean', 'std', 'median']).round(6),
-                'complexity_overall': category_data.groupby('complexity_level')[metric_col].agg(['count', 'mean', 'std', 'median']).round(6)
+                name: tables[category].round(6) for name, tables in category_tables.items()
             }
         
         all_stats[metric_name]['per_category'] = per_category_detailed
@@ -502,6 +1350,12 @@ def analyze_three_level_results(df, output_dir):
         else:  # Higher is better for UNPG/CLIP
             print(api_overall_stats.sort_values('mean', ascending=False))
         
+        if n_resamples and metric_name in BOOTSTRAP_METRICS:
+            api_cis = metric_stats[(metric_stats['metric'] == metric_name) & (metric_stats['grouping'] == 'api')]
+            print(f"\n{metric_name} - Mean with 95% bootstrap CI ({n_resamples} resamples):")
+            for _, row in api_cis.iterrows():
+                print(f"  {row['api'].upper()}: {row['mean']:.4f} [{row['ci_low']:.4f}, {row['ci_high']:.4f}]")
+        
         print(f"\n{metric_name} - Complexity Level Impact:")
         if metric_name == 'FID':
             print(complexity_overall_stats.sort_values('mean', ascending=True))
@@ -512,14 +1366,12 @@ def analyze_three_level_results(df, output_dir):
         print(f"\n{metric_name} - PER-CATEGORY ANALYSIS:")
         print("="*50)
         
-        for category in sorted(metric_df['category'].unique()):
+        for category in sorted(per_category_detailed):
             print(f"\n{category.upper()} Category - {metric_name}:")
             print("-" * 40)
             
-            category_data = metric_df[metric_df['category'] == category]
-            
             # API performance within this category
-            category_api_stats = category_data.groupby('api')[metric_col].agg(['count', 'mean', 'std']).round(4)
+            category_api_stats = category_tables['api_overall'][category][['count', 'mean', 'std']].round(4)
             print("API Performance:")
             if metric_name == 'FID':
                 print(category_api_stats.sort_values('mean', ascending=True))
@@ -527,7 +1379,7 @@ def analyze_three_level_results(df, output_dir):
                 print(category_api_stats.sort_values('mean', ascending=False))
             
             # Complexity impact within this category
-            category_complexity_stats = category_data.groupby('complexity_level')[metric_col].agg(['count', 'mean', 'std']).round(4)
+            category_complexity_stats = category_tables['complexity_overall'][category][['count', 'mean', 'std']].round(4)
             print("\nComplexity Impact:")
             if metric_name == 'FID':
                 print(category_complexity_stats.sort_values('mean', ascending=True))
@@ -535,7 +1387,7 @@ def analyze_three_level_results(df, output_dir):
                 print(category_complexity_stats.sort_values('mean', ascending=False))
             
             # API × Complexity within this category
-            category_api_complexity = category_data.groupby(['api', 'complexity_level'])[metric_col].agg(['count', 'mean']).round(4)
+            category_api_complexity = category_tables['api_complexity'][category][['count', 'mean']].round(4)
             print("\nBest API-Complexity Combinations:")
             if metric_name == 'FID':
                 top_combinations = category_api_complexity.sort_values('mean', ascending=True).head(3)
@@ -547,6 +1399,16 @@ def analyze_three_level_results(df, output_dir):
             
             print()  # Extra spacing between categories
     
+    # Paired permutation tests between APIs on the same edits
+    if n_resamples:
+        paired_tests = compute_paired_api_tests(df, n_resamples=n_resamples, seed=seed)
+        if not paired_tests.empty:
+            paired_tests.to_csv(os.path.join(output_dir, 'paired_api_tests.csv'), index=False)
+            print(f"\nPAIRED API COMPARISON (sign-flip permutation test, {n_resamples} resamples):")
+            for _, row in paired_tests[paired_tests['grouping'] == 'overall'].iterrows():
+                print(f"  {row['metric']}: {row['api_a'].upper()} - {row['api_b'].upper()} = {row['mean_diff']:+.4f} "
+                      f"(p={row['p_value']:.4f}, {row['n_pairs']} matched pairs)")
+    
     # Create comprehensive visualizations
     create_multi_metric_plots(df, output_dir, metrics_available)
     
@@ -913,8 +1775,38 @@ def main():
                        help='Output directory for results')
     parser.add_argument('--model_path', type=str,
                        help='Path to UNPG model weights')
-    
+    parser.add_argument('--batch_size', type=int, default=32,
+                       help='Batch size for UNPG/CLIP/Inception embedding')
+    parser.add_argument('--num_workers', type=int, default=4,
+                       help='DataLoader worker processes for image decoding')
+    parser.add_argument('--fid_max_images', type=int,
+                       help='Cap images per FID set (default: use all images)')
+    parser.add_argument('--fid_shared_reference', action='store_true',
+                       help='Compare every group against one set of statistics over the unique originals')
+    parser.add_argument('--fid_stats_dir', type=str,
+                       help='Where shared FID reference statistics (.npz) are stored (default: output_dir)')
+    parser.add_argument('--cache_dir', type=str,
+                       help='Directory for the persistent feature cache (disabled if not set)')
+    parser.add_argument('--cache_max_size_gb', type=float,
+                       help='Evict least-recently-used cached features above this size')
+    parser.add_argument('--pair_manifest', type=str,
+                       help='JSON manifest caching directory listings by mtime for faster pair discovery')
+    parser.add_argument('--rescore', action='store_true',
+                       help='Recompute all pairs and FID groups instead of reusing stored results')
+    parser.add_argument('--bootstrap_resamples', type=int, default=DEFAULT_RESAMPLES,
+                       help='Resamples for bootstrap CIs and paired permutation tests (0 disables)')
+    parser.add_argument('--num_shards', type=int, default=1,
+                       help='Number of shards the pairs are split across (see launch_sharded_evaluation.py)')
+    parser.add_argument('--shard_id', type=int,
+                       help='Evaluate only this shard (0-based); without it, shard results are merged')
+    parser.add_argument('--threads', type=int,
+                       help='Torch intra-op threads for this process (default: torch default)')
+
     args = parser.parse_args()
+    if args.shard_id is not None and not 0 <= args.shard_id < args.num_shards:
+        parser.error(f"--shard_id must be in [0, {args.num_shards})")
+    if args.threads:
+        torch.set_num_threads(args.threads)
     
     # If no arguments provided, use default configuration
     if len(sys.argv) == 1:
@@ -962,11 +1854,18 @@ def main():
         print(f"  {api_level}: {path}")
     print()
     
+    # Shard processes run concurrently and the feature store has no cross-process locking,
+    # so each shard keeps its own cache under --cache_dir (its pairs are the same on every rerun)
+    cache_dir = args.cache_dir
+    if cache_dir and args.shard_id is not None:
+        cache_dir = os.path.join(cache_dir, f"shard_{args.shard_id:03d}_of_{args.num_shards:03d}")
+    
     # Initialize evaluator
-    evaluator = MultiMetricEvaluator(model_path=model_path)
+    evaluator = MultiMetricEvaluator(model_path=model_path, cache_dir=cache_dir,
+                                     cache_max_size_gb=args.cache_max_size_gb)
     
     # Find image pairs
-    pairs = find_three_level_image_pairs(original_dir, results_dirs)
+    pairs = find_three_level_image_pairs(original_dir, results_dirs, manifest_path=args.pair_manifest)
     print(f"Found {len(pairs)} image pairs")
     
     if len(pairs) == 0:
@@ -982,10 +1881,20 @@ def main():
         print(f"  {api} ({complexity}): {count} pairs")
     
     # Evaluate identity preservation
-    df = evaluate_three_level_identity_preservation(evaluator, pairs, output_dir)
+    df = evaluate_three_level_identity_preservation(evaluator, pairs, output_dir, batch_size=args.batch_size,
+                                                    num_workers=args.num_workers,
+                                                    fid_max_images=args.fid_max_images,
+                                                    fid_shared_reference=args.fid_shared_reference,
+                                                    fid_stats_dir=args.fid_stats_dir,
+                                                    resume=not args.rescore,
+                                                    num_shards=args.num_shards,
+                                                    shard_id=args.shard_id)
+    if df is None:
+        # Shard run - analysis happens after the merge
+        return
     
     # Analyze results
-    stats = analyze_three_level_results(df, output_dir)
+    stats = analyze_three_level_results(df, output_dir, n_resamples=args.bootstrap_resamples)
     
     print(f"\nThree-level multi-metric benchmark evaluation complete! Results saved to: {output_dir}")
     print(f"- multi_metric_benchmark_results.csv: Raw results with all metrics")
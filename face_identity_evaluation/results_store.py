@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Append-only JSONL results store for resumable face metric evaluation.
+
+Every scored record is appended as one JSON line and fsynced in batches, so a
+crash loses at most the batch in flight. On open, existing lines are indexed
+by a key built from selected fields; when a key appears more than once the
+last line wins. A truncated trailing line (from a crash mid-write) is ignored.
+"""
+
+import os
+import json
+
+
+class ResultsStore:
+    """Append-only JSONL file of result records indexed by a tuple of key fields"""
+
+    def __init__(self, path, key_fields):
+        self.path = path
+        self.key_fields = tuple(key_fields)
+        self.records = {}
+        self._needs_newline = False
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        skipped = 0
+        with open(self.path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    skipped += 1
+                    continue
+                self.records[self.key(record)] = record
+        # A crash mid-write leaves a partial last line; start the next append on a fresh line
+        with open(self.path, 'rb') as f:
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                self._needs_newline = f.read(1) != b'\n'
+        if skipped:
+            print(f"Warning: Skipped {skipped} unreadable lines in {self.path}")
+
+    def key(self, record):
+        return tuple(record.get(field) for field in self.key_fields)
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def get(self, key, default=None):
+        return self.records.get(key, default)
+
+    def append(self, records):
+        """Append records to the file and index them"""
+        records = list(records)
+        if not records:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'a') as f:
+            if self._needs_newline:
+                f.write('\n')
+                self._needs_newline = False
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        for record in records:
+            self.records[self.key(record)] = record
@@ -0,0 +1,20 @@
+"""Shared asyncio client for the FlyMy image API, used by all benchmark generators."""
+
+from .backends import GenerationBackend, FlyMyBackend
+from .client import FlyMyClient, DEFAULT_BASE_URL
+from .downloads import DownloadError, atomic_output, read_response, save_response, validate_image
+from .errors import FlyMyError, FlyMyTimeoutError
+from .polling import PollScheduler, parse_retry_after
+from .jobqueue import JobQueue
+from .orchestrator import build_edit_jobs, load_prompts_from_json, queue_jobs, run_job, run_jobs
+from .ratelimit import RateLimiter, TokenBucket, rate_limiter, is_throttle_status
+from .transport import PooledTransport, configure_transport, shared_transport
+from .uploads import UploadCache
+
+__all__ = ['FlyMyClient', 'FlyMyError', 'FlyMyTimeoutError', 'DownloadError', 'DEFAULT_BASE_URL',
+           'atomic_output', 'read_response', 'save_response', 'validate_image', 'PollScheduler', 'parse_retry_after',
+           'JobQueue', 'GenerationBackend', 'FlyMyBackend',
+           'build_edit_jobs', 'load_prompts_from_json', 'queue_jobs', 'run_job', 'run_jobs',
+           'RateLimiter', 'TokenBucket', 'rate_limiter', 'is_throttle_status',
+           'PooledTransport', 'configure_transport', 'shared_transport',
+           'UploadCache']
@@ -0,0 +1,129 @@
+"""
+Provider-agnostic generation backends.
+
+A backend runs one generation job in three stages; the orchestrator (see
+orchestrator.py) drives them with retries, rate limiting and the job queue:
+
+    handle = await backend.submit(job)                 # start it; the str handle is stored for resume
+    result = await backend.poll(handle, job)           # wait until the provider has an image
+    await backend.fetch(result, job['output_path'])    # streamed, validated, atomic
+
+`job` is a job-queue row (job_id, prompt, input_path, output_path, metadata).
+Subclasses implement the three stages and may override the error hooks.
+"""
+
+import random
+import asyncio
+import aiohttp
+
+from .downloads import DownloadError, save_response
+from .errors import FlyMyError
+from .ratelimit import RateLimiter
+
+
+class GenerationBackend:
+    """Base class for one image provider: submit, poll and fetch plus error handling"""
+
+    name = 'backend'
+    # Exceptions that count as a failed attempt; anything else is a bug and propagates. Subclasses list
+    # their provider's transient errors: with Exception, local OSErrors are retried instead of failing the job
+    errors = (Exception,)
+
+    def __init__(self, limiter=None):
+        self.limiter = limiter or RateLimiter(self.name)
+        self._session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def submit(self, job):
+        """Start a generation and return a handle to poll it with"""
+        raise NotImplementedError
+
+    async def poll(self, handle, job, submitted_at=None, resumed=False):
+        """
+        Wait for the generation to finish and return what fetch() needs.
+        submitted_at is the loop time of submission; resumed is True when the
+        handle comes from an earlier run.
+        """
+        raise NotImplementedError
+
+    async def fetch(self, result, output_path):
+        """Save the finished image to output_path"""
+        raise NotImplementedError
+
+    async def download(self, url, output_path):
+        """Stream a result URL to output_path, reporting throttling statuses to the limiter"""
+        session = await self.open()
+        async with session.get(url) as response:
+            self.limiter.report_status(response.status)
+            await save_response(response, output_path)
+        return output_path
+
+    def retry_delay(self, error, attempt):
+        """Seconds to wait before the next attempt after `attempt` failures, or None to give up"""
+        return min(2 ** attempt, 60) + random.uniform(0, 1)
+
+    def keep_handle(self, error):
+        """Whether the submitted request may still finish, so it is polled again instead of resubmitted"""
+        return False
+
+    async def attempt_failed(self, job, error):
+        """Called after each failed attempt, e.g. to report throttling or drop a rejected upload"""
+
+
+class FlyMyBackend(GenerationBackend):
+    """FlyMy chat image API through a FlyMyClient"""
+
+    name = 'flymy'
+    errors = (FlyMyError, aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError)
+
+    def __init__(self, client, max_wait_time=None):
+        super().__init__(limiter=client.limiter)
+        self.client = client
+        self.max_wait_time = max_wait_time or client.max_wait_time
+
+    async def open(self):
+        return await self.client.open()
+
+    async def close(self):
+        await self.client.close()
+
+    async def submit(self, job):
+        image_url = None
+        if job.get('input_path'):
+            image_url = await self.client.upload_image(job['input_path'])
+        request_id = await self.client.submit(job['prompt'], image_url=image_url)
+        self.client._log(f"Request ID: {request_id}")
+        return request_id
+
+    async def poll(self, handle, job, submitted_at=None, resumed=False):
+        if resumed and submitted_at is not None:
+            # Poll right away, but leave the resumed job at least half the usual wait
+            submitted_at = max(submitted_at, asyncio.get_running_loop().time() - self.max_wait_time / 2)
+        return await self.client.poll(handle, max_wait_time=self.max_wait_time, submitted_at=submitted_at,
+                                      learn_latency=not resumed)
+
+    async def fetch(self, result, output_path):
+        return await self.client.download(result['file_url'], output_path)
+
+    def keep_handle(self, error):
+        # A failed or timed-out server job is submitted afresh; transport errors are polled again
+        return not isinstance(error, FlyMyError) or isinstance(error, DownloadError)
+
+    async def attempt_failed(self, job, error):
+        await self.client.forget_upload(job.get('input_path'), error)
@@ -0,0 +1,96 @@
+"""
+Offline throughput benchmark of the orchestrator against the mock FlyMy server.
+
+    python -m flymy_client.benchmark --jobs 10000 --concurrency 500 --latency 2 --error_rate 0.05
+
+Starts a MockFlyMyServer in-process, runs --jobs generations through
+FlyMyBackend and run_jobs with a real JobQueue and real downloads into a
+temporary directory, and reports throughput next to the ideal of
+concurrency / median latency. Use it to catch orchestrator regressions
+(polling, pooling, queue overhead) without spending API credits.
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+from .backends import FlyMyBackend
+from .client import FlyMyClient
+from .jobqueue import JobQueue
+from .mock_server import MockFlyMyServer, add_server_arguments
+from .orchestrator import queue_jobs, run_jobs
+from .ratelimit import RateLimiter
+
+
+async def run_benchmark(num_jobs=1000, concurrency=100, max_retries=3, adaptive=False, edit=False,
+                        output_dir=None, **server_settings):
+    """Run num_jobs mock generations and return a dict of timings and server stats"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_dir = output_dir or tmp_dir
+        os.makedirs(output_dir, exist_ok=True)
+        input_path = None
+        if edit:
+            input_path = os.path.join(tmp_dir, 'input.png')
+            with open(input_path, 'wb') as f:
+                f.write(MockFlyMyServer().png)
+
+        jobs = [{'job_id': f"job_{i:06d}", 'prompt': f"benchmark prompt {i}", 'input_path': input_path,
+                 'output_path': os.path.join(output_dir, f"job_{i:06d}.png")} for i in range(num_jobs)]
+
+        async with MockFlyMyServer(**server_settings) as server:
+            latency = server.latency
+            limiter = RateLimiter('benchmark', max_in_flight=concurrency, adaptive=adaptive)
+            client = FlyMyClient(api_key='mock', base_url=server.url, max_connections=concurrency,
+                                 first_poll_delay=latency, min_poll_interval=min(2.0, latency / 4),
+                                 max_poll_interval=max(latency / 2, 0.5), max_wait_time=max(60.0, latency * 20),
+                                 limiter=limiter)
+            with JobQueue(os.path.join(tmp_dir, 'benchmark_jobs.sqlite')) as queue:
+                pending = queue_jobs(queue, jobs, output_dir)
+                start = time.perf_counter()
+                async with FlyMyBackend(client) as backend:
+                    completed, failed = await run_jobs(backend, queue, pending, concurrency=concurrency,
+                                                       max_retries=max_retries, progress=False, verbose=False)
+                elapsed = time.perf_counter() - start
+
+        stats = server.summary()
+    return {
+        'jobs': num_jobs,
+        'completed': completed,
+        'failed': failed,
+        'elapsed_s': elapsed,
+        'jobs_per_s': num_jobs / elapsed if elapsed else 0.0,
+        'ideal_jobs_per_s': concurrency / latency,
+        'polls_per_job': stats['polls'] / max(1, stats['submitted']),
+        'server': stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the generation orchestrator against a mock FlyMy API')
+    parser.add_argument('--jobs', type=int, default=1000, help='Number of generations to run')
+    parser.add_argument('--concurrency', type=int, default=100, help='Generations in flight')
+    parser.add_argument('--max_retries', type=int, default=3)
+    parser.add_argument('--adaptive', action='store_true', help='Use an AIMD concurrency limit up to --concurrency')
+    parser.add_argument('--edit', action='store_true', help='Upload an input image with every job')
+    add_server_arguments(parser)
+    parser.set_defaults(latency=2.0)
+    args = parser.parse_args()
+
+    server_settings = dict(latency=args.latency, latency_sigma=args.latency_sigma, error_rate=args.error_rate,
+                           fail_rate=args.fail_rate, max_active=args.max_active, retry_after=args.retry_after,
+                           seed=args.seed)
+    result = asyncio.run(run_benchmark(args.jobs, args.concurrency, args.max_retries, args.adaptive, args.edit,
+                                       **server_settings))
+
+    print(f"Jobs: {result['jobs']} (completed {result['completed']}, failed {result['failed']})")
+    print(f"Elapsed: {result['elapsed_s']:.1f}s")
+    print(f"Throughput: {result['jobs_per_s']:.1f} jobs/s (ideal {result['ideal_jobs_per_s']:.1f} jobs/s, "
+          f"{result['jobs_per_s'] / result['ideal_jobs_per_s'] * 100:.0f}%)")
+    print(f"Polls per job: {result['polls_per_job']:.2f}")
+    print(f"Server: {result['server']}")
+
+
+if __name__ == '__main__':
+    main()
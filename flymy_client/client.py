@@ -0,0 +1,242 @@
+"""
+Asyncio client for the FlyMy chat image API.
+
+All clients on an event loop share one pooled keep-alive session (see transport.py),
+so any number of generations can be in flight on a single event loop. Each stage of a generation is its own coroutine:
+
+    async with FlyMyClient() as client:
+        image_url = await client.upload_image("face.png")           # optional, for edits
+        request_id = await client.submit(prompt, image_url=image_url)
+        result = await client.poll(request_id)                      # adaptive, non-blocking wait
+        await client.download(result['file_url'], "out.png")      # streamed, atomic
+
+`generate()` runs the whole pipeline with retries and returns True/False, which is
+what the benchmark generators use. Pass a `limiter` (see ratelimit.py) to cap and
+pace generations in flight; it is told about throttling responses and completions.
+"""
+
+import os
+import random
+import asyncio
+import aiohttp
+
+from .downloads import read_response, save_response
+from .errors import FlyMyError, FlyMyTimeoutError
+from .polling import PollScheduler, parse_retry_after
+from .ratelimit import RateLimiter
+from .transport import shared_transport
+from .uploads import UploadCache
+
+DEFAULT_BASE_URL = "https://api.chat.flymy.ai"
+
+
+class FlyMyClient:
+    """Pooled asyncio client for submit / poll / download against the FlyMy API"""
+
+    def __init__(self, api_key=None, base_url=DEFAULT_BASE_URL, max_connections=100, request_timeout=30,
+                 first_poll_delay=15, min_poll_interval=2, max_poll_interval=30, max_wait_time=600,
+                 poll_scheduler=None, transport=None, limiter=None, poll_limiter=None, upload_cache=None,
+                 verbose=False):
+        self.api_key = api_key or os.getenv("FLYMY_API_KEY") or os.getenv("API_KEY")
+        if not self.api_key:
+            raise ValueError("API key not provided. Please set FLYMY_API_KEY environment variable or pass api_key parameter.")
+        self.base_url = base_url.rstrip('/')
+        self.max_connections = max_connections
+        self.request_timeout = request_timeout
+        self._timeout = aiohttp.ClientTimeout(total=request_timeout)
+        # first_poll_delay is only used until the scheduler has seen enough completions
+        self.poll_scheduler = poll_scheduler or PollScheduler(
+            initial_delay=first_poll_delay, min_interval=min_poll_interval, max_interval=max_poll_interval)
+        self.max_wait_time = max_wait_time
+        # Both default to no limits: `limiter` gates generation attempts, `poll_limiter` result polls
+        self.limiter = limiter or RateLimiter('flymy')
+        self.poll_limiter = poll_limiter or RateLimiter('flymy/chat-result')
+        # Each source image is uploaded once and its URL reused by every edit of it
+        self.upload_cache = upload_cache or UploadCache()
+        self.verbose = verbose
+        self.transport = transport
+        self._use_shared_transport = transport is None
+        self._session = None
+
+    @property
+    def headers(self):
+        return {
+            "X-API-KEY": self.api_key,
+            "Accept": "application/json"
+        }
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        """Attach to the pooled transport (the shared one of this event loop by default)"""
+        if self._session is None:
+            if self.transport is None:
+                self.transport = shared_transport(pool_size=self.max_connections)
+            self._session = self.transport.acquire()
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            self._session = None
+            await self.transport.release()
+            if self._use_shared_transport:
+                # The shared transport belongs to this event loop; reopen on whichever loop is running next
+                self.transport = None
+
+    def _request(self, session, method, url, **kwargs):
+        return session.request(method, url, headers=self.headers, timeout=self._timeout, **kwargs)
+
+    def _log(self, message):
+        if self.verbose:
+            print(message)
+
+    def absolute_url(self, url):
+        """Result and upload URLs are returned relative to the API host"""
+        return url if url.startswith('http') else self.base_url + url
+
+    async def upload_image(self, image_path):
+        """URL of an input image for an edit request, uploading it unless already uploaded"""
+        return await self.upload_cache.get_or_upload('flymy', image_path, self._upload_image)
+
+    async def forget_upload(self, image_path, error):
+        """Drop the cached upload if the API rejected the request that used it (HTTP 4xx)"""
+        status = getattr(error, 'status', None)
+        if image_path is not None and status is not None and 400 <= status < 500 and status != 429:
+            await self.upload_cache.invalidate('flymy', image_path)
+
+    async def _upload_image(self, image_path):
+        session = await self.open()
+        data = aiohttp.FormData()
+        with open(image_path, 'rb') as f:
+            data.add_field('file', f.read(), filename=os.path.basename(image_path))
+        async with self._request(session, 'POST', self.base_url + "/upload-image", data=data) as response:
+            self.limiter.report_status(response.status)
+            response.raise_for_status()
+            payload = await response.json()
+        return self.absolute_url(payload['url'])
+
+    async def submit(self, prompt, image_url=None):
+        """Start a generation (or an edit when image_url is given) and return its request_id"""
+        session = await self.open()
+        if image_url is not None:
+            request_body = {
+                "chat_history": [{"role": "user", "content": f"Edit image with prompt: {prompt}"}],
+                "image_url": image_url
+            }
+        else:
+            request_body = {
+                "chat_history": [{"role": "user", "content": f"Generate image with prompt: {prompt}"}]
+            }
+        async with self._request(session, 'POST', self.base_url + "/chat", json=request_body) as response:
+            self.limiter.report_status(response.status)
+            response.raise_for_status()
+            payload = await response.json()
+        return payload['request_id']
+
+    async def poll(self, request_id, max_wait_time=None, submitted_at=None, learn_latency=True):
+        """
+        Wait for a generation to finish and return its result data (with 'file_url').
+
+        The first poll is scheduled near the median latency of earlier requests,
+        later polls back off exponentially, and a Retry-After header overrides the
+        next delay. Transient HTTP errors (including 500 while the server is still
+        working) are retried until the deadline. Pass learn_latency=False when the
+        submission time is not known precisely (e.g. a job resumed after a restart).
+        """
+        session = await self.open()
+        max_wait_time = max_wait_time or self.max_wait_time
+        result_url = f"{self.base_url}/chat-result/{request_id}"
+        loop = asyncio.get_running_loop()
+        submitted_at = loop.time() if submitted_at is None else submitted_at
+        deadline = submitted_at + max_wait_time
+        last_pending = None
+        pending_polls = 0
+
+        delay = self.poll_scheduler.first_delay() - (loop.time() - submitted_at)
+        while True:
+            await asyncio.sleep(max(0.0, min(delay, deadline - loop.time())))
+            if loop.time() >= deadline:
+                break
+            poll_time = loop.time() - submitted_at
+            retry_after = None
+            try:
+                async with self.poll_limiter, self._request(session, 'GET', result_url) as response:
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    if response.status in (429, 503):
+                        # Plain 500s are normal while a job runs; only these mean overload
+                        self.limiter.report_throttle()
+                    if response.status >= 500 or response.status == 429:
+                        self._log(f"[{request_id}] HTTP {response.status} - server may still be processing")
+                        result = None
+                    else:
+                        response.raise_for_status()
+                        result = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._log(f"[{request_id}] Error checking result: {e}")
+                result = None
+
+            if result is not None and result.get('error') != 'Still processing':
+                data = result.get('data') or {}
+                if data.get('file_url'):
+                    if learn_latency:
+                        self.poll_scheduler.record(poll_time, last_pending)
+                    return data
+                raise FlyMyError(f"Error in result for {request_id}: {result}")
+
+            if result is not None:
+                last_pending = poll_time
+            pending_polls += 1
+            delay = retry_after if retry_after is not None else self.poll_scheduler.next_interval(pending_polls)
+
+        raise FlyMyTimeoutError(f"Timeout waiting for {request_id} after {max_wait_time}s")
+
+    async def download_bytes(self, file_url):
+        """A result image's bytes, checked like download() so a corrupt body is retried by generate_bytes()"""
+        session = await self.open()
+        async with self._request(session, 'GET', self.absolute_url(file_url)) as response:
+            return await read_response(response)
+
+    async def download(self, file_url, output_path):
+        """Stream a result image to output_path through a validated temp file and an atomic rename"""
+        session = await self.open()
+        async with self._request(session, 'GET', self.absolute_url(file_url)) as response:
+            await save_response(response, output_path)
+        return output_path
+
+    async def _generate(self, prompt, input_image_path, max_retries, max_wait_time, fetch):
+        """Upload (optional), submit, poll and `await fetch(file_url)` with retries; None on failure"""
+        for attempt in range(max_retries):
+            try:
+                async with self.limiter:
+                    image_url = None
+                    if input_image_path is not None:
+                        image_url = await self.upload_image(input_image_path)
+                    submitted_at = asyncio.get_running_loop().time()
+                    request_id = await self.submit(prompt, image_url=image_url)
+                    self._log(f"Request ID: {request_id}")
+                    result = await self.poll(request_id, max_wait_time=max_wait_time, submitted_at=submitted_at)
+                    fetched = await fetch(result['file_url'])
+                    self.limiter.report_success()
+                    return fetched
+            except (FlyMyError, aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError) as e:
+                print(f"Error on attempt {attempt + 1}/{max_retries}: {e}")
+                await self.forget_upload(input_image_path, e)
+                if attempt < max_retries - 1:
+                    await asyncio.sleep(min(2 ** attempt, 60) + random.uniform(0, 1))
+        return None
+
+    async def generate_bytes(self, prompt, input_image_path=None, max_retries=3, max_wait_time=None):
+        """Generate (or edit) an image and return its bytes, or None on failure"""
+        return await self._generate(prompt, input_image_path, max_retries, max_wait_time, self.download_bytes)
+
+    async def generate(self, prompt, output_path, input_image_path=None, max_retries=3, max_wait_time=None):
+        """Generate (or edit) an image and save it to output_path; returns True on success"""
+        async def fetch(file_url):
+            return await self.download(file_url, output_path)
+        saved = await self._generate(prompt, input_image_path, max_retries, max_wait_time, fetch)
+        return saved is not None
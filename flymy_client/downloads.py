@@ -0,0 +1,102 @@
+"""
+Crash-safe downloads of generated images.
+
+A response body is streamed in chunks to a temporary file next to the output,
+checked (Content-Length, Content-MD5 when the server sends one, and a full image
+decode check), and only then renamed onto the output path. A crash mid-download
+leaves at most a stray `*.part` file, never a truncated image under the final name.
+"""
+
+import io
+import os
+import base64
+import hashlib
+import asyncio
+import tempfile
+from contextlib import contextmanager
+
+from PIL import Image
+
+from .errors import FlyMyError
+
+CHUNK_SIZE = 1 << 16
+
+
+class DownloadError(FlyMyError):
+    """A downloaded file was incomplete or not a valid image"""
+
+
+def validate_image(path):
+    """Raise DownloadError unless path (or a file object) holds a complete, decodable image"""
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception as e:
+        raise DownloadError(f"Invalid image data in download: {e}")
+
+
+@contextmanager
+def atomic_output(output_path):
+    """
+    Yield a temporary path in the output's directory; on success it is renamed to
+    output_path, on error it is removed.
+    """
+    directory = os.path.dirname(output_path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(output_path) + '.', suffix='.part')
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _expected_size(response):
+    # Content-Length is the encoded size; only compare it when the body is not compressed
+    encoding = response.headers.get('Content-Encoding', 'identity')
+    return response.content_length if encoding == 'identity' else None
+
+
+async def read_response(response, validate=validate_image):
+    """Read an aiohttp response body into memory with the same checks as save_response(); returns the bytes"""
+    response.raise_for_status()
+    expected_size = _expected_size(response)
+    expected_md5 = response.headers.get('Content-MD5')
+    data = await response.read()
+    if not data or (expected_size is not None and len(data) != expected_size):
+        raise DownloadError(f"Incomplete download: got {len(data)} bytes, expected {expected_size}")
+    if expected_md5 and base64.b64encode(hashlib.md5(data).digest()).decode() != expected_md5.strip():
+        raise DownloadError("Downloaded content does not match Content-MD5")
+    if validate is not None:
+        await asyncio.to_thread(validate, io.BytesIO(data))
+    return data
+
+
+async def save_response(response, output_path, validate=validate_image, chunk_size=CHUNK_SIZE):
+    """Stream an aiohttp response body to output_path atomically; returns the number of bytes"""
+    response.raise_for_status()
+    expected_size = _expected_size(response)
+    expected_md5 = response.headers.get('Content-MD5')
+    digest = hashlib.md5() if expected_md5 else None
+
+    with atomic_output(output_path) as tmp_path:
+        size = 0
+        with open(tmp_path, 'wb') as f:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                f.write(chunk)
+                size += len(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+
+        if size == 0 or (expected_size is not None and size != expected_size):
+            raise DownloadError(f"Incomplete download: got {size} bytes, expected {expected_size}")
+        if digest is not None and base64.b64encode(digest.digest()).decode() != expected_md5.strip():
+            raise DownloadError("Downloaded content does not match Content-MD5")
+        if validate is not None:
+            await asyncio.to_thread(validate, tmp_path)
+    return size
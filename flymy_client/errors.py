@@ -0,0 +1,9 @@
+"""Exceptions raised by the FlyMy client."""
+
+
+class FlyMyError(Exception):
+    """The API reported a failed generation or returned an unexpected response"""
+
+
+class FlyMyTimeoutError(FlyMyError):
+    """A generation did not finish within the polling deadline"""
@@ -0,0 +1,142 @@
+"""
+Durable SQLite job queue for generation runs.
+
+Each job is one output image with its prompt, optional input image and state:
+
+    pending -> submitted (request_id stored) -> downloaded
+                                             -> failed (after max_retries)
+
+State changes are committed as they happen, so after a crash a restarted run
+resumes polling jobs that were already submitted instead of paying for them
+again. `retry_failed()` puts failed jobs back in the queue. Jobs are run by
+`run_job` in orchestrator.py.
+"""
+
+import os
+import json
+import time
+import sqlite3
+
+
+PENDING = 'pending'
+SUBMITTED = 'submitted'
+DOWNLOADED = 'downloaded'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    prompt TEXT NOT NULL,
+    input_path TEXT,
+    output_path TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    request_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    submitted_at REAL,
+    updated_at REAL,
+    metadata TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+"""
+
+
+class JobQueue:
+    """SQLite-backed table of generation jobs and their states"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _job(self, row):
+        job = dict(row)
+        job['metadata'] = json.loads(job['metadata']) if job['metadata'] else {}
+        return job
+
+    def add(self, jobs, done_outputs=()):
+        """
+        Add jobs (dicts with job_id, prompt, output_path and optional input_path /
+        metadata); jobs already in the queue keep their state. New jobs whose
+        output path is in done_outputs are recorded as downloaded.
+        """
+        done_outputs = set(done_outputs)
+        now = time.time()
+        with self.conn:
+            cursor = self.conn.executemany(
+                "INSERT OR IGNORE INTO jobs (job_id, prompt, input_path, output_path, state, updated_at, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(job['job_id'], job['prompt'], job.get('input_path'), job['output_path'],
+                  DOWNLOADED if job['output_path'] in done_outputs else PENDING, now,
+                  json.dumps(job.get('metadata') or {})) for job in jobs])
+        return cursor.rowcount
+
+    def get(self, job_id):
+        row = self.conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return None if row is None else self._job(row)
+
+    def jobs(self, states=None):
+        if states is None:
+            rows = self.conn.execute("SELECT * FROM jobs ORDER BY rowid")
+        else:
+            placeholders = ','.join('?' * len(states))
+            rows = self.conn.execute(f"SELECT * FROM jobs WHERE state IN ({placeholders}) ORDER BY rowid", tuple(states))
+        return [self._job(row) for row in rows]
+
+    def counts(self):
+        return dict(self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self.conn:
+            self.conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", tuple(fields.values()) + (job_id,))
+
+    def mark_submitted(self, job_id, request_id):
+        self._update(job_id, state=SUBMITTED, request_id=request_id, submitted_at=time.time(), error=None)
+
+    def mark_downloaded(self, job_id):
+        self._update(job_id, state=DOWNLOADED, error=None)
+
+    def mark_attempt_failed(self, job_id, attempts, error, final=False, request_id=None):
+        """
+        Record a failed attempt. Unless final, the job is polled again under
+        request_id if one is given, or resubmitted otherwise.
+        """
+        if final:
+            state = FAILED
+        else:
+            state = SUBMITTED if request_id is not None else PENDING
+        self._update(job_id, state=state, request_id=request_id, attempts=attempts, error=str(error))
+
+    def reset(self, job_ids):
+        """Return jobs to pending with a fresh attempt count; returns how many"""
+        now = time.time()
+        with self.conn:
+            cursor = self.conn.executemany(
+                "UPDATE jobs SET state = ?, request_id = NULL, attempts = 0, updated_at = ? WHERE job_id = ?",
+                [(PENDING, now, job_id) for job_id in job_ids])
+        return cursor.rowcount
+
+    def retry_failed(self):
+        """Return failed jobs to the queue with a fresh attempt count; returns how many"""
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET state = ?, attempts = 0, updated_at = ? WHERE state = ?", (PENDING, time.time(), FAILED))
+        return cursor.rowcount
+
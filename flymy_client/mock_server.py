@@ -0,0 +1,185 @@
+"""
+Local stand-in for the FlyMy API, for benchmarking and regression-testing the
+orchestrator offline.
+
+    python -m flymy_client.mock_server --port 8765 --latency 40 --error_rate 0.05
+
+It serves the endpoints FlyMyClient uses (/upload-image, /chat, /chat-result/<id>
+and result files). Each job finishes after a log-normal latency with median
+--latency seconds. Until then result polls answer "Still processing", or HTTP
+500 with probability --error_rate, as the real API sometimes does while a job
+runs. --fail_rate makes jobs end in an error, and --max_active makes /chat
+answer 429 while that many jobs are running.
+"""
+
+import io
+import math
+import heapq
+import time
+import random
+import asyncio
+import argparse
+import itertools
+
+from aiohttp import web
+from PIL import Image
+
+
+def _result_png(size=64):
+    buffer = io.BytesIO()
+    Image.new('RGB', (size, size), (200, 120, 40)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class MockFlyMyServer:
+    """aiohttp app simulating FlyMy job latency, errors and throttling"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=40.0, latency_sigma=0.3, error_rate=0.0,
+                 fail_rate=0.0, max_active=None, retry_after=None, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.fail_rate = fail_rate
+        self.max_active = max_active
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.png = _result_png()
+        self.jobs = {}
+        self._running = []
+        self.stats = {'uploads': 0, 'submitted': 0, 'throttled': 0, 'polls': 0, 'pending_polls': 0,
+                      'errors': 0, 'completed': 0, 'failed': 0, 'downloads': 0}
+        self._ids = itertools.count()
+        self._connections = set()
+        self._runner = None
+
+        self.app = web.Application(middlewares=[self._track_connections])
+        self.app.add_routes([
+            web.post('/upload-image', self.upload_image),
+            web.post('/chat', self.chat),
+            web.get('/chat-result/{request_id}', self.chat_result),
+            web.get('/files/{name}', self.file),
+            web.get('/stats', self.get_stats),
+        ])
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def active(self):
+        now = time.monotonic()
+        while self._running and self._running[0] <= now:
+            heapq.heappop(self._running)
+        return len(self._running)
+
+    @web.middleware
+    async def _track_connections(self, request, handler):
+        self._connections.add(id(request.transport))
+        return await handler(request)
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if not self.port:
+            self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+    def summary(self):
+        return dict(self.stats, connections=len(self._connections))
+
+    def _latency(self):
+        return self.latency * math.exp(self.random.gauss(0.0, self.latency_sigma))
+
+    async def upload_image(self, request):
+        await request.post()
+        self.stats['uploads'] += 1
+        return web.json_response({'url': '/files/upload.png'})
+
+    async def chat(self, request):
+        await request.json()
+        if self.max_active is not None and self.active >= self.max_active:
+            self.stats['throttled'] += 1
+            return web.json_response({'error': 'Too many requests'}, status=429)
+        request_id = f"mock-{next(self._ids)}"
+        failed = self.random.random() < self.fail_rate
+        done_at = time.monotonic() + self._latency()
+        self.jobs[request_id] = (done_at, failed)
+        heapq.heappush(self._running, done_at)
+        self.stats['submitted'] += 1
+        return web.json_response({'request_id': request_id})
+
+    async def chat_result(self, request):
+        self.stats['polls'] += 1
+        request_id = request.match_info['request_id']
+        if request_id not in self.jobs:
+            return web.json_response({'error': 'Unknown request'}, status=404)
+        done_at, failed = self.jobs[request_id]
+        if time.monotonic() < done_at:
+            headers = {'Retry-After': str(self.retry_after)} if self.retry_after else {}
+            if self.random.random() < self.error_rate:
+                self.stats['errors'] += 1
+                return web.json_response({'error': 'Internal Server Error'}, status=500, headers=headers)
+            self.stats['pending_polls'] += 1
+            return web.json_response({'error': 'Still processing'}, headers=headers)
+        if failed:
+            self.stats['failed'] += 1
+            return web.json_response({'error': 'Generation failed'})
+        self.stats['completed'] += 1
+        return web.json_response({'data': {'file_url': f'/files/{request_id}.png'}})
+
+    async def file(self, request):
+        self.stats['downloads'] += 1
+        return web.Response(body=self.png, content_type='image/png')
+
+    async def get_stats(self, request):
+        return web.json_response(self.summary())
+
+
+async def serve(args):
+    server = MockFlyMyServer(host=args.host, port=args.port, latency=args.latency, latency_sigma=args.latency_sigma,
+                             error_rate=args.error_rate, fail_rate=args.fail_rate, max_active=args.max_active,
+                             retry_after=args.retry_after, seed=args.seed)
+    async with server:
+        print(f"Mock FlyMy API listening on {server.url} (stats at {server.url}/stats)")
+        while True:
+            await asyncio.sleep(3600)
+
+
+def add_server_arguments(parser):
+    parser.add_argument('--latency', type=float, default=40.0, help='Median job latency in seconds')
+    parser.add_argument('--latency_sigma', type=float, default=0.3, help='Log-normal spread of job latency')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Probability of HTTP 500 on a pending poll')
+    parser.add_argument('--fail_rate', type=float, default=0.0, help='Probability that a job ends in an error')
+    parser.add_argument('--max_active', type=int, default=None, help='Answer 429 on /chat while this many jobs run')
+    parser.add_argument('--retry_after', type=float, default=None, help='Retry-After seconds sent with pending polls')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for latencies and errors')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the FlyMy API')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_server_arguments(parser)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""
+One orchestrator for every generation backend.
+
+The face-identity generators (FlyMy, FAL, OpenAI) share the same flow: build one
+job per (input image, prompt), record them in a JobQueue, and run the pending
+ones through a backend with retries:
+
+    organized_prompts, config = load_prompts_from_json("prompts_simple.json")
+    jobs = build_edit_jobs(image_files, input_dir, organized_prompts, output_dir)
+    with JobQueue(os.path.join(output_dir, "generation_jobs.sqlite")) as queue:
+        pending = queue_jobs(queue, jobs, output_dir)
+        async with backend:
+            completed, failed = await run_jobs(backend, queue, pending, concurrency=8)
+
+Only the backend (see backends.py) knows the provider's API.
+"""
+
+import os
+import json
+import time
+import asyncio
+
+from .jobqueue import SUBMITTED, DOWNLOADED, PENDING
+
+INTENSITY_LEVELS = ('intensity_1_subtle', 'intensity_2_moderate', 'intensity_3_intense')
+
+
+def load_prompts_from_json(json_file):
+    """Load prompts from JSON configuration file and organize them"""
+    with open(json_file, 'r') as f:
+        config = json.load(f)
+
+    # Extract prompts organized by category
+    organized_prompts = {}
+
+    for category_name, category_data in config['categories'].items():
+        category_prompts = []
+        prompt_metadata = []
+
+        # Collect prompts from all intensity levels
+        for intensity_level in INTENSITY_LEVELS:
+            for prompt_data in category_data[intensity_level]:
+                category_prompts.append(prompt_data['prompt'])
+                prompt_metadata.append({
+                    'id': prompt_data['id'],
+                    'intensity': intensity_level,
+                    'expected_difficulty': prompt_data['expected_difficulty']
+                })
+
+        organized_prompts[category_name] = {
+            'prompts': category_prompts,
+            'metadata': prompt_metadata
+        }
+
+    return organized_prompts, config
+
+
+def build_edit_jobs(image_files, input_dir, organized_prompts, output_dir):
+    """One job per (input image, prompt), named original_name_category_intensity_promptid.png"""
+    jobs = []
+    for img_file in image_files:
+        img_path = os.path.join(input_dir, img_file)
+        img_name = os.path.splitext(img_file)[0]
+
+        for category, category_data in organized_prompts.items():
+            for prompt_idx, (prompt, prompt_meta) in enumerate(zip(category_data['prompts'], category_data['metadata'])):
+                intensity_short = prompt_meta['intensity'].split('_')[1]  # Extract 'subtle', 'moderate', 'intense'
+                prompt_id = prompt_meta['id']
+                output_filename = f"{img_name}_{category}_{intensity_short}_{prompt_id}.png"
+
+                jobs.append({
+                    'job_id': output_filename,
+                    'prompt': prompt,
+                    'input_path': img_path,
+                    'output_path': os.path.join(output_dir, output_filename),
+                    'metadata': {
+                        'img_file': img_file,
+                        'category': category,
+                        'prompt_idx': prompt_idx,
+                        'prompt_id': prompt_id
+                    }
+                })
+    return jobs
+
+
+def queue_jobs(queue, jobs, output_dir, retry_failed=False):
+    """
+    Add jobs to the queue and return those still to run (pending, or submitted
+    in an earlier run). Outputs already on disk count as done; downloaded jobs
+    whose output was removed run again.
+    """
+    existing_outputs = {os.path.join(output_dir, f) for f in os.listdir(output_dir)}
+    queue.add(jobs, done_outputs=existing_outputs)
+    missing = [job['job_id'] for job in queue.jobs(states=(DOWNLOADED,)) if job['output_path'] not in existing_outputs]
+    if missing:
+        print(f"Re-queued {queue.reset(missing)} jobs whose output files were removed")
+    if retry_failed:
+        print(f"Re-queued {queue.retry_failed()} failed jobs")
+
+    job_ids = {job['job_id'] for job in jobs}
+    return [job for job in queue.jobs(states=(SUBMITTED, PENDING)) if job['job_id'] in job_ids]
+
+
+async def run_job(backend, queue, job, max_retries=3):
+    """
+    Run one queued job to completion through a backend; returns True once the
+    image is downloaded. A job that was submitted before a restart is polled
+    under its stored handle rather than resubmitted. Errors in backend.errors
+    are retried; other OS errors (a missing input image, a full disk) fail the
+    job for good without disturbing the other jobs.
+    """
+    job_id = job['job_id']
+    handle = job['request_id'] if job['state'] == SUBMITTED else None
+    submitted_wall_time = job['submitted_at']
+    attempts = job['attempts']
+
+    while attempts < max_retries:
+        try:
+            async with backend.limiter:
+                loop = asyncio.get_running_loop()
+                resumed = handle is not None
+                if resumed:
+                    submitted_at = loop.time() - (time.time() - (submitted_wall_time or time.time()))
+                else:
+                    submitted_at = loop.time()
+                    handle = await backend.submit(job)
+                    queue.mark_submitted(job_id, handle)
+                    submitted_wall_time = time.time()
+                result = await backend.poll(handle, job, submitted_at=submitted_at, resumed=resumed)
+                await backend.fetch(result, job['output_path'])
+                backend.limiter.report_success()
+            queue.mark_downloaded(job_id)
+            return True
+        except backend.errors as e:
+            attempts += 1
+            print(f"Error on attempt {attempts}/{max_retries} for {job_id}: {e}")
+            await backend.attempt_failed(job, e)
+            delay = backend.retry_delay(e, attempts) if attempts < max_retries else None
+            if not backend.keep_handle(e):
+                handle = None
+            queue.mark_attempt_failed(job_id, attempts, e, final=delay is None, request_id=handle)
+            if delay is None:
+                return False
+            await asyncio.sleep(delay)
+        except OSError as e:
+            attempts += 1
+            print(f"Error on attempt {attempts}/{max_retries} for {job_id}, not retrying: {e}")
+            queue.mark_attempt_failed(job_id, attempts, e, final=True)
+            return False
+    return False
+
+
+async def run_jobs(backend, queue, jobs, concurrency=4, max_retries=3, failed_log=None, progress=True, verbose=True):
+    """
+    Run jobs with `concurrency` workers pulling from one shared list, so a worker
+    that finishes early takes the next job instead of idling behind a slow one.
+    The backend's limiter paces and caps the work on top of that. Jobs that fail
+    for good are appended to failed_log; verbose=False drops the per-job lines.
+    Returns (completed, failed).
+    """
+    pending = asyncio.Queue()
+    for job in jobs:
+        pending.put_nowait(job)
+    counts = {'completed': 0, 'failed': 0}
+
+    pbar = None
+    if progress:
+        from tqdm import tqdm
+        pbar = tqdm(total=len(jobs), desc="Processing images")
+
+    async def worker():
+        while not pending.empty():
+            job = pending.get_nowait()
+            if verbose and job['request_id'] and job['state'] == SUBMITTED:
+                print(f"Resuming {job['job_id']} (request {job['request_id']})")
+            if await run_job(backend, queue, job, max_retries=max_retries):
+                counts['completed'] += 1
+                if verbose:
+                    print(f"Successfully saved: {os.path.basename(job['output_path'])}")
+            else:
+                counts['failed'] += 1
+                print(f"Failed to generate: {os.path.basename(job['output_path'])}")
+                if failed_log:
+                    meta = job['metadata']
+                    with open(failed_log, "a") as f:
+                        f.write(f"{meta.get('img_file')},{meta.get('category')},{meta.get('prompt_idx')},"
+                                f"{meta.get('prompt_id')},{job['prompt']}\n")
+            if pbar is not None:
+                meta = job['metadata']
+                pbar.set_description(f"Processed {meta.get('img_file')} - {meta.get('category')} prompt {meta.get('prompt_idx')}")
+                pbar.set_postfix(completed=counts['completed'], failed=counts['failed'],
+                                 concurrent=backend.limiter.current_limit)
+                pbar.update(1)
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, min(concurrency, len(jobs))))]
+    try:
+        await asyncio.gather(*workers)
+    finally:
+        # A worker that raised must not leave the others running against a backend about to close
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if pbar is not None:
+            pbar.close()
+    return counts['completed'], counts['failed']
@@ -0,0 +1,81 @@
+"""
+Adaptive scheduling of `/chat-result` polls.
+
+Generation latency is fairly stable for a given prompt mix, so a client learns it
+from its own completed requests: the first poll is scheduled near the observed
+median, and polls after that back off exponentially from a short interval up to a
+cap. Until enough requests have completed, the configured initial delay is used.
+
+A poll only tells us that a job finished somewhere between the previous poll and
+this one, so each completion is recorded at the midpoint of that window. A job
+that is already done on the first poll is recorded slightly earlier than the
+poll, which lets the median drift down when jobs speed up.
+"""
+
+import random
+from collections import deque
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class PollScheduler:
+    """Learns generation latency and decides when to poll for a result"""
+
+    def __init__(self, initial_delay=15, min_interval=2, max_interval=30, backoff_factor=1.5,
+                 quantile=0.5, window=100, min_samples=5, early_hit_factor=0.8, jitter=0.1):
+        self.initial_delay = initial_delay
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.early_hit_factor = early_hit_factor
+        self.jitter = jitter
+        self.latencies = deque(maxlen=window)
+
+    def _jittered(self, delay):
+        return delay * (1.0 + random.uniform(-self.jitter, self.jitter))
+
+    def latency_estimate(self):
+        """Observed latency quantile, or None before min_samples completions"""
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+
+    def first_delay(self):
+        estimate = self.latency_estimate()
+        return self._jittered(self.initial_delay if estimate is None else estimate)
+
+    def next_interval(self, num_pending_polls):
+        """Delay after the n-th poll that found the job still processing (n >= 1)"""
+        interval = self.min_interval * self.backoff_factor ** (num_pending_polls - 1)
+        return self._jittered(min(interval, self.max_interval))
+
+    def record(self, elapsed, last_pending=None):
+        """
+        Record a completed job seen `elapsed` seconds after submission, where
+        `last_pending` is when it was last seen still processing (None if never).
+        """
+        if last_pending is None:
+            self.latencies.append(elapsed * self.early_hit_factor)
+        else:
+            self.latencies.append((last_pending + elapsed) / 2.0)
@@ -0,0 +1,150 @@
+"""
+Rate limiting and concurrency control for generation runs.
+
+A RateLimiter combines a token bucket (requests per second, with bursts) and a
+cap on requests in flight. Limiters are shared per process by name, e.g. one for
+a provider ('flymy', 'fal', 'openai') that gates whole generation jobs and one per
+endpoint ('flymy/chat-result') that gates individual requests:
+
+    limiter = rate_limiter('fal', requests_per_second=1, max_in_flight=16, adaptive=True)
+    async with limiter:
+        ...                          # one job
+    limiter.report_success()         # or report_throttle() on HTTP 429 / 5xx
+
+With adaptive=True the in-flight cap follows AIMD: it doubles its way up (one slot
+per success) until the first throttle, then grows by about one slot per round of
+completions, and halves on a throttle. Throttles within `cooldown` seconds of a
+decrease come from requests that were already in flight and are ignored.
+"""
+
+import asyncio
+
+ADAPTIVE_DEFAULT_MAX_IN_FLIGHT = 64
+
+
+def is_throttle_status(status):
+    """HTTP statuses that mean the provider is overloaded or rate limiting us"""
+    return status is not None and (status == 429 or status >= 500)
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average and up to `burst` at once"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            if self.updated is not None:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1.0:
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+                self.tokens = 1.0
+                self.updated = loop.time()
+            self.tokens -= 1.0
+
+
+class RateLimiter:
+    """Token-bucket rate limit plus a (fixed or AIMD) cap on work in flight"""
+
+    def __init__(self, name, requests_per_second=None, burst=None, max_in_flight=None, adaptive=False,
+                 min_in_flight=1, start_in_flight=None, decrease_factor=0.5, cooldown=10.0):
+        self.name = name
+        self.bucket = TokenBucket(requests_per_second, burst) if requests_per_second else None
+        if adaptive and max_in_flight is None:
+            max_in_flight = ADAPTIVE_DEFAULT_MAX_IN_FLIGHT
+        self.max_in_flight = max_in_flight
+        self.adaptive = adaptive
+        self.min_in_flight = min_in_flight
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        if max_in_flight is None:
+            self.limit = None
+        elif adaptive:
+            self.limit = float(min(max_in_flight, start_in_flight or min_in_flight))
+        else:
+            self.limit = float(max_in_flight)
+        self.slow_start_threshold = float('inf')
+        self.in_flight = 0
+        self.successes = 0
+        self.throttles = 0
+        self._last_decrease = None
+        self._condition = asyncio.Condition()
+
+    @property
+    def current_limit(self):
+        return None if self.limit is None else max(1, int(self.limit))
+
+    def _has_slot(self):
+        return self.limit is None or self.in_flight < self.current_limit
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(self._has_slot)
+            self.in_flight += 1
+        if self.bucket is not None:
+            try:
+                await self.bucket.acquire()
+            except BaseException:
+                await self._release()
+                raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._release()
+
+    async def _release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            if self.limit is not None:
+                self._condition.notify(max(1, self.current_limit - self.in_flight))
+
+    def report_success(self):
+        """A job finished; in adaptive mode, open up more slots"""
+        self.successes += 1
+        if not self.adaptive:
+            return
+        if self.limit < self.slow_start_threshold:
+            self.limit += 1.0
+        else:
+            self.limit += 1.0 / self.limit
+        self.limit = min(self.limit, float(self.max_in_flight))
+
+    def report_throttle(self):
+        """The provider answered 429 / 5xx; in adaptive mode, back off"""
+        self.throttles += 1
+        if not self.adaptive:
+            return
+        now = asyncio.get_running_loop().time()
+        if self._last_decrease is not None and now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.min_in_flight), self.limit * self.decrease_factor)
+        self.slow_start_threshold = self.limit
+
+    def report_status(self, status):
+        if is_throttle_status(status):
+            self.report_throttle()
+
+    def __repr__(self):
+        limit = 'unlimited' if self.limit is None else self.current_limit
+        return f"RateLimiter({self.name!r}, in_flight={self.in_flight}, limit={limit})"
+
+
+_limiters = {}
+
+
+def rate_limiter(name, **settings):
+    """The process-wide limiter called `name`, created with `settings` on first use"""
+    limiter = _limiters.get(name)
+    if limiter is None:
+        limiter = _limiters[name] = RateLimiter(name, **settings)
+    return limiter
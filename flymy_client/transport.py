@@ -0,0 +1,83 @@
+"""
+Process-wide pooled HTTP transport for FlyMy API clients.
+
+Every FlyMyClient on an event loop shares one aiohttp session, so upload, submit,
+poll and download requests reuse the same keep-alive connections instead of
+paying a TLS handshake per request. The pool is created by the first client on a
+loop and closed when the last client using it closes.
+
+Pool settings come from the first client (its max_connections), from
+`configure_transport()` called before any client opens, or from the
+FLYMY_POOL_SIZE / FLYMY_KEEPALIVE_TIMEOUT environment variables.
+"""
+
+import os
+import asyncio
+import weakref
+import aiohttp
+
+DEFAULT_POOL_SIZE = 100
+DEFAULT_KEEPALIVE_TIMEOUT = 60
+DNS_CACHE_TTL = 300
+
+_settings = {}
+_shared_transports = weakref.WeakKeyDictionary()
+
+
+def configure_transport(pool_size=None, keepalive_timeout=None):
+    """Set pool settings for transports created after this call"""
+    if pool_size is not None:
+        _settings['pool_size'] = pool_size
+    if keepalive_timeout is not None:
+        _settings['keepalive_timeout'] = keepalive_timeout
+
+
+class PooledTransport:
+    """One keep-alive aiohttp session shared by reference-counted users"""
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, keepalive_timeout=DEFAULT_KEEPALIVE_TIMEOUT):
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self._session = None
+        self._users = 0
+
+    @property
+    def closed(self):
+        return self._session is None or self._session.closed
+
+    @property
+    def session(self):
+        if self.closed:
+            # limit_per_host matters: every request goes to the same API host
+            connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size,
+                                             keepalive_timeout=self.keepalive_timeout,
+                                             ttl_dns_cache=DNS_CACHE_TTL)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def acquire(self):
+        self._users += 1
+        return self.session
+
+    async def release(self):
+        self._users = max(0, self._users - 1)
+        if self._users == 0:
+            await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+def shared_transport(pool_size=None, keepalive_timeout=None):
+    """The pooled transport of the running event loop, created on first use"""
+    loop = asyncio.get_running_loop()
+    transport = _shared_transports.get(loop)
+    if transport is None or (transport.closed and transport._users == 0):
+        pool_size = _settings.get('pool_size') or int(os.getenv('FLYMY_POOL_SIZE', 0)) or pool_size or DEFAULT_POOL_SIZE
+        keepalive_timeout = (_settings.get('keepalive_timeout') or int(os.getenv('FLYMY_KEEPALIVE_TIMEOUT', 0))
+                             or keepalive_timeout or DEFAULT_KEEPALIVE_TIMEOUT)
+        transport = PooledTransport(pool_size=pool_size, keepalive_timeout=keepalive_timeout)
+        _shared_transports[loop] = transport
+    return transport
@@ -0,0 +1,76 @@
+"""
+Upload deduplication for image-edit benchmarks.
+
+Every prompt for a source image edits the same file, so its upload URL is cached
+by (provider, content hash) and reused until the provider may have dropped the
+file. Concurrent requests for the same file share one upload.
+"""
+
+import os
+import time
+import asyncio
+
+from benchmark_utils import file_sha256
+
+# Conservative guesses at how long uploaded inputs stay retrievable; override per run if known
+PROVIDER_UPLOAD_TTLS = {
+    'flymy': 3600,
+    'fal': 6 * 3600,
+}
+DEFAULT_UPLOAD_TTL = 3600
+
+
+class UploadCache:
+    """Uploaded-file URLs keyed by provider and file content, expiring after a TTL"""
+
+    def __init__(self, ttls=None):
+        self.ttls = dict(PROVIDER_UPLOAD_TTLS)
+        self.ttls.update(ttls or {})
+        self._entries = {}
+        self._hashes = {}
+        self.uploads = 0
+        self.hits = 0
+
+    def ttl(self, provider):
+        return self.ttls.get(provider, DEFAULT_UPLOAD_TTL)
+
+    async def _file_hash(self, path):
+        stat = os.stat(path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        cached = self._hashes.get(path)
+        if cached is None or cached[0] != signature:
+            cached = (signature, await asyncio.to_thread(file_sha256, path))
+            self._hashes[path] = cached
+        return cached[1]
+
+    async def get_or_upload(self, provider, path, upload):
+        """URL of `path` on `provider`, calling `await upload(path)` only when not cached"""
+        key = (provider, await self._file_hash(path))
+        entry = self._entries.get(key)
+        if entry is not None:
+            future, expires_at = entry
+            if expires_at is None or time.time() < expires_at:
+                self.hits += 1
+                return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = (future, None)
+        try:
+            url = await upload(path)
+        except BaseException as e:
+            # Let waiters see the error, but do not cache it
+            self._entries.pop(key, None)
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()
+            raise
+        self.uploads += 1
+        self._entries[key] = (future, time.time() + self.ttl(provider))
+        future.set_result(url)
+        return url
+
+    async def invalidate(self, provider, path):
+        """Forget the upload of `path`, e.g. after the provider rejected its URL"""
+        self._entries.pop((provider, await self._file_hash(path)), None)
@@ -3,146 +3,134 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import os
+import sys
 import json
+import asyncio
 import argparse
-import requests
-import time
 from pathlib import Path
-import multiprocessing as mp
 from PIL import Image
 import io
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from flymy_client import FlyMyClient, atomic_output, rate_limiter
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def encode_sample(content):
+    """PNG bytes of a generated image cropped to its content (Image.getbbox)"""
+    is_png = content.startswith(PNG_SIGNATURE)
+    with Image.open(io.BytesIO(content)) as image:
+        bbox = image.getbbox()
+        if is_png and bbox in (None, (0, 0) + image.size):
+            # Nothing to crop: keep the provider's PNG as is; re-encoding costs far more than decoding
+            return content
+        if bbox:
+            image = image.crop(bbox)
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+
 
 class FlymyImageGenerator:
-    def __init__(self, api_key=None):
-        self.base_url = "https://api.chat.flymy.ai"
-        self.api_key = api_key or os.getenv("FLYMY_API_KEY")
-        if not self.api_key:
-            raise ValueError("API key not provided. Please set FLYMY_API_KEY environment variable or pass api_key parameter.")
-        self.headers = {
-            "X-API-KEY": self.api_key,
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
-
-    def generate_image(self, prompt, max_retries=3):
-        """Generate a single image using flymy API"""
-        endpoint = "/chat"
-        url = self.base_url + endpoint
-        
-        request_body = {
-            "chat_history": [
-                {
-                    "role": "user",
-                    "content": f"Generate image with prompt: {prompt}"
-                }
-            ]
-        }
-        
-        for attempt in range(max_retries):
-            try:
-                # Add delay to avoid overwhelming the API
-                time.sleep(2)  # 2 second delay before each request
-                
-                # Submit generation request
-                response = requests.post(url, headers=self.headers, json=request_body, timeout=30)
-                response.raise_for_status()
-                request_id = response.json()['request_id']
-                
-                # Poll for results with longer intervals
-                api_url_result = f"{self.base_url}/chat-result/{request_id}"
-                max_poll_attempts = 30  # Reduce polling attempts
-                
-                for poll_attempt in range(max_poll_attempts):
-                    try:
-                        response_image = requests.get(api_url_result, headers=self.headers, timeout=30)
-                        response_image.raise_for_status()
-                        result = response_image.json()
-                        
-                        if result.get('error') != 'Still processing':
-                            if 'data' in result and 'file_url' in result['data']:
-                                # Download the image
-                                img_url = self.base_url + result['data']['file_url']
-                                img_response = requests.get(img_url, timeout=30)
-                                img_response.raise_for_status()
-                                
-                                # Convert to PIL Image
-                                image = Image.open(io.BytesIO(img_response.content))
-                                return image
-                            else:
-                                print(f"Error in result: {result}")
-                                break
-                        
-                        time.sleep(20)  # Wait 20 seconds between polls (instead of 10)
-                        
-                    except Exception as e:
-                        print(f"Error polling for result (attempt {poll_attempt + 1}): {e}")
-                        time.sleep(10)  # Longer delay on errors
-                
-                print(f"Timeout waiting for image generation (attempt {attempt + 1})")
-                
-            except Exception as e:
-                print(f"Error generating image (attempt {attempt + 1}): {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(10)  # Longer delay between retries
-        
-        return None
+    def __init__(self, api_key=None, max_connections=100, limiter=None):
+        # Polls adapt to observed latency, never more than 20 seconds apart, for up to 10 minutes
+        self.client = FlyMyClient(api_key=api_key, max_connections=max_connections,
+                                  first_poll_delay=20, max_poll_interval=20, max_wait_time=600, limiter=limiter)
 
+    async def __aenter__(self):
+        await self.client.open()
+        return self
 
-def generate_images_for_prompt(args):
-    """Generate images for a single prompt with multiple samples"""
-    prompt_data, output_dir, num_images, rank = args
-    
-    generator = FlymyImageGenerator()
-    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.client.close()
+
+    async def generate_image_bytes(self, prompt, max_retries=3):
+        """Generate a single image using flymy API and return the encoded bytes"""
+        return await self.client.generate_bytes(prompt, max_retries=max_retries)
+
+
+def prepare_prompt(prompt_data, output_dir, num_images):
+    """Create a prompt's output folder and return its missing samples as (prompt_data, sample_idx, path) jobs"""
     idx = prompt_data['idx']
     metadata = prompt_data['metadata']
-    prompt = metadata['prompt']
     
     outpath = Path(output_dir) / f"{idx:0>5}"
-    outpath.mkdir(parents=True, exist_ok=True)
-    
     sample_path = outpath / "samples"
     sample_path.mkdir(parents=True, exist_ok=True)
     
-    print(f"Worker {rank}: Processing prompt {idx}: '{prompt}'")
+    # Check which images already exist
+    existing = set(os.listdir(sample_path))
+    jobs = [(prompt_data, i, sample_path / f"{i:05}.png")
+            for i in range(num_images) if f"{i:05}.png" not in existing]
     
-    # Check if images already exist
-    existing_images = 0
-    for i in range(num_images):
-        if (sample_path / f"{i:05}.png").exists():
-            existing_images += 1
-    
-    if existing_images == num_images:
-        print(f"Worker {rank}: Skipping prompt {idx} - all images already exist")
-        return
+    if not jobs:
+        print(f"Skipping prompt {idx} - all images already exist")
+        return jobs
     
     # Save metadata
     with open(outpath / "metadata.jsonl", "w", encoding="utf-8") as fp:
         json.dump(metadata, fp)
-    
-    # Generate missing images
-    for i in range(existing_images, num_images):
-        image_path = sample_path / f"{i:05}.png"
-        print(f"Worker {rank}: Generating image {i+1}/{num_images} for prompt {idx}")
-        
-        image = generator.generate_image(prompt)
-        if image is not None:
-            # Crop to content if needed
-            if hasattr(image, 'getbbox') and image.getbbox():
-                image = image.crop(image.getbbox())
-            image.save(image_path)
-            print(f"Worker {rank}: Saved {image_path}")
-        else:
-            print(f"Worker {rank}: Failed to generate image {i+1} for prompt {idx}")
-
-
-def main():
+    return jobs
+
+
+async def generate_sample(generator, job):
+    """Generate and save one (prompt, sample_idx) job; returns True on success"""
+    prompt_data, i, image_path = job
+    idx = prompt_data['idx']
+    prompt = prompt_data['metadata']['prompt']
+    print(f"Generating image {i+1} for prompt {idx}: '{prompt}'")
+    content = await generator.generate_image_bytes(prompt)
+    if content is None:
+        print(f"Failed to generate image {i+1} for prompt {idx}")
+        return False
+    # Crop to content if needed, off the event loop so other samples keep downloading
+    content = await asyncio.to_thread(encode_sample, content)
+    # Write to a temp file and rename, so an interrupted save never looks like a finished sample
+    with atomic_output(str(image_path)) as tmp_path:
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+    print(f"Saved {image_path}")
+    return True
+
+
+async def run_jobs(generator, jobs, num_workers):
+    """
+    Run sample jobs with num_workers workers pulling from one shared queue, so a
+    worker that finishes early takes the next job instead of idling behind a
+    slow one. Returns the number of failed jobs.
+    """
+    queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+    failures = 0
+    
+    async def worker():
+        nonlocal failures
+        while not queue.empty():
+            job = queue.get_nowait()
+            try:
+                ok = await generate_sample(generator, job)
+            except Exception as e:
+                # One bad sample (e.g. an undecodable image) must not stop the other workers
+                prompt_data, i, _ = job
+                print(f"Failed to generate image {i+1} for prompt {prompt_data['idx']}: {e}")
+                ok = False
+            if not ok:
+                failures += 1
+    
+    await asyncio.gather(*(worker() for _ in range(max(1, min(num_workers, len(jobs))))))
+    return failures
+
+
+async def main():
     parser = argparse.ArgumentParser(description="Generate images using Flymy API for GenEval.")
     parser.add_argument("--output_dir", type=str, required=True, help="Directory to save the generated images.")
     parser.add_argument("--metadata_file", type=str, required=True, help="JSONL file containing lines of metadata for each prompt.")
     parser.add_argument("--num_images", type=int, default=4, help="Number of images to generate per prompt")
-    parser.add_argument("--num_workers", type=int, default=4, help="Number of parallel workers")
+    parser.add_argument("--num_workers", type=int, default=4, help="Maximum number of generations in flight")
+    parser.add_argument("--requests_per_second", type=float, default=None, help="Maximum generations started per second (default: no limit)")
+    parser.add_argument("--adaptive", action="store_true", help="Raise concurrency up to --num_workers until the API throttles, then back off (AIMD)")
     parser.add_argument("--start_idx", type=int, default=0, help="Start index for prompts")
     parser.add_argument("--end_idx", type=int, default=None, help="End index for prompts")
     
@@ -172,17 +160,22 @@ def main():
             'metadata': metadata
         })
     
-    # Prepare arguments for multiprocessing
-    worker_args = []
-    for i, prompt_data in enumerate(prompt_data_list):
-        worker_args.append((prompt_data, str(output_dir), args.num_images, i % args.num_workers))
+    # Every missing (prompt, sample_idx) pair is an independent job, in prompt order
+    jobs = []
+    for prompt_data in prompt_data_list:
+        jobs.extend(prepare_prompt(prompt_data, str(output_dir), args.num_images))
+    print(f"{len(jobs)} images to generate")
     
-    # Process using multiprocessing
-    with mp.Pool(processes=args.num_workers) as pool:
-        pool.map(generate_images_for_prompt, worker_args)
+    # One pooled client; the shared 'flymy' limiter bounds generations in flight across all jobs
+    limiter = rate_limiter('flymy', requests_per_second=args.requests_per_second,
+                           max_in_flight=args.num_workers, adaptive=args.adaptive)
+    async with FlymyImageGenerator(max_connections=max(args.num_workers, 1), limiter=limiter) as generator:
+        failures = await run_jobs(generator, jobs, args.num_workers)
     
+    if failures:
+        print(f"{failures} images failed to generate; rerun to retry them")
     print("All image generation tasks completed!")
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,5 @@
+"""Image downscaling and re-encoding for vision-model requests (GPT-4o judging and editing)."""
+
+from .prepare import DEFAULT_SETTINGS, ImagePreprocessor, image_data_url, prepare_image, target_size
+
+__all__ = ['DEFAULT_SETTINGS', 'ImagePreprocessor', 'image_data_url', 'prepare_image', 'target_size']
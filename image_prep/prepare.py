@@ -0,0 +1,117 @@
+"""
+Downscale and recompress images before sending them to a vision model.
+
+GPT-4o scales every image to fit 2048x2048 and then so its shortest side is at
+most 768px, and bills it by 512px tile, so a multi-MB 1024px+ PNG costs upload
+time and payload for pixels the model never sees. prepare_image() resizes to
+that effective resolution (or a smaller one) and re-encodes to high-quality
+JPEG or WebP, returning the bytes with the MIME type they actually have.
+Decoding and encoding are CPU-bound, so ImagePreprocessor runs them in a
+process pool, for threads and asyncio alike:
+
+    with ImagePreprocessor(format='JPEG', quality=90) as images:
+        data_url, size = images.data_url(path)
+        data_url, size = await images.adata_url(path)
+"""
+
+import io
+import base64
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+DEFAULT_SETTINGS = {
+    'format': 'JPEG',       # 'JPEG', 'WEBP', 'PNG', or None to send the original bytes
+    'quality': 90,
+    'max_short_side': 768,  # GPT-4o's effective resolution in high detail
+    'max_long_side': 2048,
+}
+MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp', 'PNG': 'image/png', 'GIF': 'image/gif'}
+
+
+def target_size(width, height, max_short_side=768, max_long_side=2048):
+    """Size after fitting inside max_long_side and capping the shortest side; never upscales"""
+    scale = min(1.0, max_long_side / max(width, height))
+    scale = min(scale, max_short_side / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _flatten(image):
+    """RGB copy of an image, with any transparency composited onto white (JPEG has no alpha)"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def prepare_image(path, format='JPEG', quality=90, max_short_side=768, max_long_side=2048):
+    """
+    Image bytes ready to send: (data, mime_type, (width, height)). The original
+    file is kept when it already has the target format and size.
+    """
+    with Image.open(path) as image:
+        source_format = image.format
+        size = target_size(*image.size, max_short_side=max_short_side, max_long_side=max_long_side)
+        if format is None or (source_format == format.upper() and size == image.size):
+            with open(path, 'rb') as f:
+                return f.read(), MIME_TYPES.get(source_format, 'image/png'), image.size
+        format = format.upper()
+        image = image if format == 'PNG' else _flatten(image)
+        if size != image.size:
+            image = image.resize(size, Image.LANCZOS)
+        buffer = io.BytesIO()
+        if format == 'PNG':
+            image.save(buffer, format='PNG', optimize=True)
+        elif format == 'WEBP':
+            image.save(buffer, format='WEBP', quality=quality, method=4)
+        else:
+            image.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue(), MIME_TYPES[format], size
+
+
+def image_data_url(path, **settings):
+    """(data: URL of the prepared image, (width, height))"""
+    data, mime_type, size = prepare_image(path, **settings)
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}", size
+
+
+class ImagePreprocessor:
+    """prepare_image() settings plus a lazily started process pool to run them in (workers=0: inline)"""
+
+    def __init__(self, workers=None, **settings):
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.settings.update(settings)
+        self.workers = workers
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def data_url(self, path):
+        """image_data_url(path) in the pool; blocks the calling thread"""
+        if self.workers == 0:
+            return image_data_url(path, **self.settings)
+        return self.pool.submit(image_data_url, str(path), **self.settings).result()
+
+    async def adata_url(self, path):
+        """image_data_url(path) in the pool, awaited"""
+        if self.workers == 0:
+            return await asyncio.to_thread(image_data_url, path, **self.settings)
+        return await asyncio.wrap_future(self.pool.submit(image_data_url, str(path), **self.settings))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
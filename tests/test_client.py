@@ -0,0 +1,33 @@
+import os
+import sys
+import asyncio
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flymy_client import FlyMyClient
+from flymy_client.mock_server import MockFlyMyServer
+
+
+class TruncatingServer(MockFlyMyServer):
+    """Serves a truncated PNG on the first download"""
+
+    async def file(self, request):
+        self.stats['downloads'] += 1
+        body = self.png[:40] if self.stats['downloads'] == 1 else self.png
+        return web.Response(body=body, content_type='image/png')
+
+
+async def generate_bytes_from_truncating_server():
+    async with TruncatingServer(latency=0.05, latency_sigma=0.0) as server:
+        async with FlyMyClient(api_key='mock', base_url=server.url, first_poll_delay=0.05, min_poll_interval=0.05,
+                               max_poll_interval=0.1, max_wait_time=10) as client:
+            data = await client.generate_bytes('generate', max_retries=2)
+        return data, server.png, server.stats['downloads']
+
+
+def test_generate_bytes_retries_a_corrupt_download():
+    data, png, downloads = asyncio.run(generate_bytes_from_truncating_server())
+
+    assert downloads == 2
+    assert data == png
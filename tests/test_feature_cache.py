@@ -0,0 +1,46 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'face_identity_evaluation'))
+from feature_cache import FeatureStore
+
+MODEL_KEY = {'model': 'test'}
+
+
+def test_rows_appended_without_flush_are_dropped_on_reopen(tmp_path):
+    store_dir = str(tmp_path / 'store')
+    store = FeatureStore(store_dir, MODEL_KEY, dtype='float32')
+    store.put({'image1': np.full(4, 1.0), 'image2': np.full(4, 2.0)})
+    store.flush()
+
+    # Crash: vectors.bin gets the row, meta.json is never saved
+    store.put({'image3': np.full(4, 3.0)})
+    del store
+
+    reopened = FeatureStore(store_dir, MODEL_KEY, dtype='float32')
+    assert reopened.num_rows == 2
+    assert os.path.getsize(reopened.vectors_path) == 2 * 4 * 4
+    assert set(reopened.get(['image1', 'image2', 'image3'])) == {'image1', 'image2'}
+
+    reopened.put({'image4': np.full(4, 4.0)})
+    features = reopened.get(['image1', 'image2', 'image4'])
+    np.testing.assert_array_equal(features['image1'], np.full(4, 1.0))
+    np.testing.assert_array_equal(features['image2'], np.full(4, 2.0))
+    np.testing.assert_array_equal(features['image4'], np.full(4, 4.0))
+
+
+def test_index_is_saved_every_flush_every_puts(tmp_path):
+    store_dir = str(tmp_path / 'store')
+    store = FeatureStore(store_dir, MODEL_KEY, dtype='float32', flush_every=2)
+    store.put({'image1': np.full(4, 1.0)})
+    store.put({'image2': np.full(4, 2.0)})
+    store.put({'image3': np.full(4, 3.0)})
+    del store
+
+    reopened = FeatureStore(store_dir, MODEL_KEY, dtype='float32')
+    assert reopened.num_rows == 2
+    features = reopened.get(['image1', 'image2', 'image3'])
+    assert set(features) == {'image1', 'image2'}
+    np.testing.assert_array_equal(features['image2'], np.full(4, 2.0))
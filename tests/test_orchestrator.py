@@ -0,0 +1,39 @@
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flymy_client import FlyMyBackend, FlyMyClient, JobQueue, queue_jobs, run_jobs
+from flymy_client.jobqueue import DOWNLOADED, FAILED
+from flymy_client.mock_server import MockFlyMyServer
+
+
+async def run_mock_jobs(tmp_path, jobs):
+    output_dir = str(tmp_path / 'out')
+    os.makedirs(output_dir, exist_ok=True)
+    for job in jobs:
+        job['output_path'] = os.path.join(output_dir, f"{job['job_id']}.png")
+    async with MockFlyMyServer(latency=0.05, latency_sigma=0.0) as server:
+        client = FlyMyClient(api_key='mock', base_url=server.url, first_poll_delay=0.05, min_poll_interval=0.05,
+                             max_poll_interval=0.1, max_wait_time=10)
+        with JobQueue(str(tmp_path / 'jobs.sqlite')) as queue:
+            pending = queue_jobs(queue, jobs, output_dir)
+            async with FlyMyBackend(client) as backend:
+                counts = await run_jobs(backend, queue, pending, concurrency=2, max_retries=3,
+                                        progress=False, verbose=False)
+            states = {job['job_id']: job['state'] for job in queue.jobs()}
+    return counts, states
+
+
+def test_missing_input_fails_only_its_job(tmp_path):
+    image_path = str(tmp_path / 'input.png')
+    with open(image_path, 'wb') as f:
+        f.write(MockFlyMyServer().png)
+    jobs = [{'job_id': 'missing', 'prompt': 'edit', 'input_path': str(tmp_path / 'does_not_exist.png')},
+            {'job_id': 'present', 'prompt': 'edit', 'input_path': image_path},
+            {'job_id': 'text_only', 'prompt': 'generate', 'input_path': None}]
+
+    (completed, failed), states = asyncio.run(run_mock_jobs(tmp_path, jobs))
+
+    assert (completed, failed) == (2, 1)
+    assert states == {'missing': FAILED, 'present': DOWNLOADED, 'text_only': DOWNLOADED}
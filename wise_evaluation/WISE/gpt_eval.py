@@ -1,13 +1,22 @@
 import json
 import os
-import base64
 import re
 import argparse
-import openai
+import sys
 import concurrent.futures
 from pathlib import Path
 from typing import Dict, Any, List
-import time
+
+# wise_evaluation for the judge modules, the repository root for the shared image_prep package
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from judge_service import JudgeService, estimate_image_tokens
+from judge_cache import JudgeCache
+from image_prep import ImagePreprocessor
+
+# Bump when scoring changes in a way the prompt text does not show (e.g. extract_scores),
+# so judgments cached under the old protocol are not reused
+JUDGE_PROTOCOL = "1"
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Image Quality Assessment Tool')
@@ -28,6 +37,24 @@ def parse_arguments():
                         help='Filename for the scores results (JSONL format)')
     parser.add_argument('--max_workers', type=int, default=10,
                         help='Maximum number of worker threads')
+    parser.add_argument('--rpm', type=int, default=500,
+                        help='OpenAI requests per minute shared by all workers')
+    parser.add_argument('--tpm', type=int, default=30000,
+                        help='OpenAI tokens per minute shared by all workers')
+    parser.add_argument('--max_retries', type=int, default=10,
+                        help='Attempts per image on rate limits and transient API errors')
+    parser.add_argument('--cache_db', default=None,
+                        help='Judgment cache (default: judge_cache.sqlite in the output directory)')
+    parser.add_argument('--no_cache', action='store_true',
+                        help='Judge every image again instead of reusing cached judgments')
+    parser.add_argument('--image_format', choices=['jpeg', 'webp', 'png', 'original'], default='jpeg',
+                        help='Re-encode images to this format before sending them ("original" sends the file as is)')
+    parser.add_argument('--image_quality', type=int, default=90,
+                        help='JPEG/WebP quality of re-encoded images')
+    parser.add_argument('--image_max_side', type=int, default=768,
+                        help='Downscale images so their shortest side is at most this (768 is what GPT-4o sees)')
+    parser.add_argument('--image_workers', type=int, default=None,
+                        help='Processes that downscale and re-encode images (default: one per CPU, 0: in the worker threads)')
 
     return parser.parse_args()
 
@@ -43,7 +70,18 @@ def get_config(args):
             "full": args.result_full,
             "scores": args.result_scores
         },
-        "max_workers": args.max_workers
+        "max_workers": args.max_workers,
+        "rpm": args.rpm,
+        "tpm": args.tpm,
+        "max_retries": args.max_retries,
+        "cache_db": None if args.no_cache else (args.cache_db or os.path.join(args.output_dir, "judge_cache.sqlite")),
+        "image_settings": {
+            "format": None if args.image_format == 'original' else args.image_format.upper(),
+            "quality": args.image_quality,
+            "max_short_side": args.image_max_side,
+            "max_long_side": 2048
+        },
+        "image_workers": args.image_workers
     }
 
 
@@ -65,9 +103,9 @@ def extract_scores(evaluation_text: str) -> Dict[str, float]:
     return scores
 
 
-def encode_image(image_path: str) -> str:
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+def encode_image(image_path: str, config: Dict) -> tuple:
+    # Downscaled and re-encoded in the preprocessing pool; returns (data URL, (width, height))
+    return config["images"].data_url(image_path)
 
 
 def load_prompts(json_path: str) -> Dict[int, Dict[str, Any]]:
@@ -76,7 +114,7 @@ def load_prompts(json_path: str) -> Dict[int, Dict[str, Any]]:
     return {item["prompt_id"]: item for item in data}
 
 
-def build_evaluation_messages(prompt_data: Dict, image_base64: str) -> list:
+def build_evaluation_messages(prompt_data: Dict, image_url: str) -> list:
     return [
 
         {
@@ -154,7 +192,7 @@ Please strictly adhere to the scoring criteria and follow the template format wh
                 {
                     "type": "image_url",
                     "image_url": {
-                        "url": f"data:image/png;base64,{image_base64}"
+                        "url": image_url
                     }
                 }
             ]
@@ -164,73 +202,79 @@ Please strictly adhere to the scoring criteria and follow the template format wh
 
 
 
-def evaluate_image(prompt_id: int, prompt_data: Dict, image_path: str, config: Dict, retries: int = 10, delay: int = 5) -> tuple:
-    attempt = 0
-    while attempt < retries:
-        try:
-            print(f"Evaluating prompt_id: {prompt_id}, Attempt {attempt + 1}...")
-            base64_image = encode_image(image_path)
-            messages = build_evaluation_messages(prompt_data, base64_image)
+def evaluate_image(prompt_id: int, prompt_data: Dict, image_path: str, config: Dict) -> tuple:
+    # Retries, backoff and RPM/TPM throttling are shared by all threads through config["judge"]
+    try:
+        print(f"Evaluating prompt_id: {prompt_id}...")
+        cache = config["cache"]
+        cached = None
+        if cache is not None:
+            key = cache.key(image_path, prompt_id, config["model"], build_evaluation_messages(prompt_data, ""), 0.0,
+                            extra=config["image_settings"])
+            cached = cache.get(key)
 
-            response = openai.ChatCompletion.create(
-                model=config["model"],
-                messages=messages,
+        if cached is not None:
+            evaluation_text = cached["evaluation"]
+            scores = cached["scores"]
+        else:
+            image_url, image_size = encode_image(image_path, config)
+            messages = build_evaluation_messages(prompt_data, image_url)
+
+            evaluation_text = config["judge"].complete(
+                messages,
                 temperature=0.0,
-                max_tokens=2000
+                max_tokens=2000,
+                image_tokens=estimate_image_tokens(*image_size)
             )
-
-            evaluation_text = response['choices'][0]['message']['content']
             scores = extract_scores(evaluation_text)
+            # 999 marks a score that could not be parsed; judge such images again next run
+            if cache is not None and 999 not in scores.values():
+                cache.put(key, evaluation_text, scores)
+
+        # Print the evaluation text to the terminal in real-time
+        print(f"\n--- Evaluation for prompt_id: {prompt_id} ---")
+        print(evaluation_text)
+        print("----------------------------------------\n")
+
+        full_record = {
+            "prompt_id": prompt_id,
+            "prompt": prompt_data["Prompt"],
+            "key": prompt_data["Explanation"],
+            "image_path": image_path,
+            "evaluation": evaluation_text
+        }
 
-            # Print the evaluation text to the terminal in real-time
-            print(f"\n--- Evaluation for prompt_id: {prompt_id} ---")
-            print(evaluation_text)
-            print("----------------------------------------\n")
-
-            full_record = {
-                "prompt_id": prompt_id,
-                "prompt": prompt_data["Prompt"],
-                "key": prompt_data["Explanation"],
-                "image_path": image_path,
-                "evaluation": evaluation_text
-            }
-
-            score_record = {
-                "prompt_id": prompt_id,
-                "Subcategory": prompt_data["Subcategory"],
-                "consistency": scores["consistency"],
-                "realism": scores["realism"],
-                "aesthetic_quality": scores["aesthetic_quality"]
-            }
-
-            print(f"Completed prompt_id: {prompt_id}")
-            return full_record, score_record
-
-        except Exception as e:
-            print(f"Error evaluating prompt_id {prompt_id}: {str(e)}")
-            attempt += 1
-            if attempt < retries:
-                print(f"Retrying in {delay} seconds...")
-                time.sleep(delay)
-            else:
-                print(f"Max retry attempts reached for prompt_id {prompt_id}. Skipping...")
-                full_record = {
-                    "prompt_id": prompt_id,
-                    "prompt": prompt_data["Prompt"],
-                    "key": prompt_data["Explanation"],
-                    "image_path": image_path,
-                    "evaluation": f"Evaluation failed after {retries} attempts: {str(e)}"
-                }
+        score_record = {
+            "prompt_id": prompt_id,
+            "Subcategory": prompt_data["Subcategory"],
+            "consistency": scores["consistency"],
+            "realism": scores["realism"],
+            "aesthetic_quality": scores["aesthetic_quality"]
+        }
 
-                score_record = {
-                    "prompt_id": prompt_id,
-                    "Subcategory": prompt_data["Subcategory"],
-                    "consistency": 999,
-                    "realism": 999,
-                    "aesthetic_quality": 999
-                }
+        print(f"Completed prompt_id: {prompt_id}")
+        return full_record, score_record
+
+    except Exception as e:
+        print(f"Error evaluating prompt_id {prompt_id}: {str(e)}")
+        print(f"Giving up on prompt_id {prompt_id}. Skipping...")
+        full_record = {
+            "prompt_id": prompt_id,
+            "prompt": prompt_data["Prompt"],
+            "key": prompt_data["Explanation"],
+            "image_path": image_path,
+            "evaluation": f"Evaluation failed after {config['max_retries']} attempts: {str(e)}"
+        }
+
+        score_record = {
+            "prompt_id": prompt_id,
+            "Subcategory": prompt_data["Subcategory"],
+            "consistency": 999,
+            "realism": 999,
+            "aesthetic_quality": 999
+        }
 
-                return full_record, score_record
+        return full_record, score_record
 
 
 def save_results(data: List[Dict], filename: str, config: Dict):
@@ -252,7 +296,12 @@ def main():
     args = parse_arguments()
     config = get_config(args)
     Path(config["output_dir"]).mkdir(parents=True, exist_ok=True)
-    openai.api_key = config["api_key"]
+    # One pooled client and one rate budget for all worker threads
+    config["judge"] = JudgeService(api_key=config["api_key"], model=config["model"], rpm=config["rpm"],
+                                   tpm=config["tpm"], max_retries=config["max_retries"],
+                                   max_connections=config["max_workers"])
+    config["cache"] = JudgeCache(config["cache_db"], protocol=JUDGE_PROTOCOL) if config["cache_db"] else None
+    config["images"] = ImagePreprocessor(workers=config["image_workers"], **config["image_settings"])
     prompts = load_prompts(config["json_path"])
     full_results = []
     score_results = []
@@ -287,6 +336,11 @@ def main():
 
     save_results(full_results, config["result_files"]["full"], config)
     save_results(score_results, config["result_files"]["scores"], config)
+    config["judge"].close()
+    config["images"].close()
+    if config["cache"] is not None:
+        print(f"Judge cache: {config['cache'].hits} reused, {config['cache'].misses} judged")
+        config["cache"].close()
 
 
 if __name__ == "__main__":
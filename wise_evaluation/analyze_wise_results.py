@@ -2,16 +2,16 @@ import json
 import matplotlib.pyplot as plt
 import pandas as pd
 from pathlib import Path
+from results_log import load_evaluation_results, log_path_for
 
 def analyze_wise_results(results_file="wise_evaluation_results/evaluation_results.json"):
     """Analyze and visualize WISE evaluation results"""
     
-    if not Path(results_file).exists():
+    if not Path(results_file).exists() and not Path(log_path_for(results_file)).exists():
         print(f"Results file not found: {results_file}")
         return
     
-    with open(results_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = load_evaluation_results(results_file)
     
     summary = data['summary']
     results = data['individual_results']
@@ -5,66 +5,75 @@ Quick progress check for WISE evaluation
 
 import json
 import os
+import time
+import argparse
 from pathlib import Path
+from results_log import LogReader, log_path_for
+
+def print_progress(data):
+    """Print counts, running averages and the category breakdown of a results structure"""
+    successful = data.get('successful_evaluations', 0) 
+    failed = data.get('failed_evaluations', 0)
+    summary = data.get('summary') or {}
+    
+    print(f"📊 Current Results:")
+    print(f"   Total evaluated: {successful}")
+    print(f"   Failed: {failed}")
+    
+    if summary:
+        print(f"\n📈 Current Metrics:")
+        print(f"   Average WiScore: {summary['average_wiscore']:.3f}")
+        print(f"   Average Consistency: {summary['average_consistency']:.3f}")
+        print(f"   Average Realism: {summary['average_realism']:.3f}")
+        print(f"   Average Aesthetic: {summary['average_aesthetic']:.3f}")
+        
+        # Category breakdown
+        category_counts = data.get('category_counts')
+        if category_counts is None:
+            category_counts = {}
+            for result in data.get('individual_results', []):
+                category_counts[result['category']] = category_counts.get(result['category'], 0) + 1
+        if summary.get('category_scores'):
+            print(f"\n🏷️  By Category:")
+            for cat, avg_score in summary['category_scores'].items():
+                print(f"   {cat}: {avg_score:.3f} ({category_counts.get(cat, 0)} samples)")
 
 def main():
-    print("🔍 WISE Evaluation Progress Check")
-    print("=" * 50)
+    parser = argparse.ArgumentParser(description='Quick progress check for WISE evaluation')
+    parser.add_argument('--watch', type=float, default=None, metavar='SECONDS',
+                        help='Keep printing progress every SECONDS, reading only newly logged records')
+    args = parser.parse_args()
     
-    # Check results file
     results_file = Path("wise_evaluation_results/evaluation_results.json")
-    if results_file.exists():
-        with open(results_file, 'r') as f:
-            data = json.load(f)
-        
-        total = data.get('total_samples', 0)
-        successful = data.get('successful_evaluations', 0) 
-        failed = data.get('failed_evaluations', 0)
-        results = data.get('individual_results', [])
+    log_path = Path(log_path_for(results_file))
+    reader = LogReader(log_path)
+    
+    while True:
+        print("🔍 WISE Evaluation Progress Check")
+        print("=" * 50)
         
-        print(f"📊 Current Results:")
-        print(f"   Total evaluated: {successful}")
-        print(f"   Failed: {failed}")
+        # The JSONL log is current; the results JSON is only rewritten at checkpoints
+        if log_path.exists():
+            reader.read()
+            state = reader.state
+            print_progress({'successful_evaluations': len(state.results), 'failed_evaluations': len(state.failed),
+                            'summary': state.summary.as_dict(), 'category_counts': state.summary.category_counts})
+        elif results_file.exists():
+            with open(results_file, 'r') as f:
+                print_progress(json.load(f))
+        else:
+            print("❌ No results file found yet")
         
-        if results:
-            # Calculate current metrics
-            total_wiscore = sum(r['wiscore'] for r in results)
-            avg_wiscore = total_wiscore / len(results)
-            
-            avg_consistency = sum(r['scores']['consistency'] for r in results) / len(results)
-            avg_realism = sum(r['scores']['realism'] for r in results) / len(results)
-            avg_aesthetic = sum(r['scores']['aesthetic_quality'] for r in results) / len(results)
-            
-            print(f"\n📈 Current Metrics:")
-            print(f"   Average WiScore: {avg_wiscore:.3f}")
-            print(f"   Average Consistency: {avg_consistency:.3f}")
-            print(f"   Average Realism: {avg_realism:.3f}")
-            print(f"   Average Aesthetic: {avg_aesthetic:.3f}")
-            
-            # Category breakdown
-            category_scores = {}
-            for result in results:
-                cat = result['category']
-                if cat not in category_scores:
-                    category_scores[cat] = []
-                category_scores[cat].append(result['wiscore'])
-            
-            if category_scores:
-                print(f"\n🏷️  By Category:")
-                for cat, scores in category_scores.items():
-                    avg_score = sum(scores) / len(scores)
-                    print(f"   {cat}: {avg_score:.3f} ({len(scores)} samples)")
+        # Check generated images
+        images_dir = Path("wise_evaluation_results/images")
+        if images_dir.exists():
+            image_count = sum(1 for _ in images_dir.glob("*.png"))
+            print(f"\n🖼️  Generated Images: {image_count}")
         
-    else:
-        print("❌ No results file found yet")
-    
-    # Check generated images
-    images_dir = Path("wise_evaluation_results/images")
-    if images_dir.exists():
-        image_count = len(list(images_dir.glob("*.png")))
-        print(f"\n🖼️  Generated Images: {image_count}")
-    
-    print("\n" + "=" * 50)
+        print("\n" + "=" * 50)
+        if args.watch is None:
+            break
+        time.sleep(args.watch)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
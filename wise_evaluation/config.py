@@ -51,11 +51,25 @@ DEFAULT_SAMPLES_COUNT = 100
 MAX_RETRIES = 3
 TIMEOUT_SECONDS = 60
 
+# GPT-4o judge limits shared by all judge workers (defaults: OpenAI usage tier 1 for gpt-4o)
+JUDGE_RPM = int(os.getenv('OPENAI_RPM', 500))
+JUDGE_TPM = int(os.getenv('OPENAI_TPM', 30000))
+
 # Output Directories
 RESULTS_DIR = "wise_evaluation_results"
 IMAGES_DIR = "images"
 REPORTS_DIR = "reports"
 
+# GPT-4o judgments are cached by image, prompt and judge settings (WISE_JUDGE_CACHE= disables it).
+# Bump the protocol version when scoring changes in a way the prompts do not show, e.g. the score parser.
+JUDGE_CACHE_FILE = os.getenv('WISE_JUDGE_CACHE', f"{RESULTS_DIR}/judge_cache.sqlite")
+JUDGE_PROTOCOL_VERSION = "1"
+
+# Images are downscaled to GPT-4o's effective resolution and re-encoded before judging
+# ("format": None sends the original file); JUDGE_IMAGE_WORKERS processes do it (None: one per CPU, 0: inline)
+JUDGE_IMAGE_SETTINGS = {"format": "JPEG", "quality": 90, "max_short_side": 768, "max_long_side": 2048}
+JUDGE_IMAGE_WORKERS = None
+
 # File Paths
 WISE_DATASET_FILES = [
     "WISE/data/cultural_common_sense.json",
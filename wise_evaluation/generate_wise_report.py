@@ -5,10 +5,18 @@ Generate comprehensive report for WISE evaluation results with benchmark compari
 
 import json
 import os
+import sys
 import argparse
 from datetime import datetime
 from collections import defaultdict
+import numpy as np
 from wise_utils import get_wise_benchmark_data, get_category_mapping
+from results_log import load_evaluation_results, log_path_for
+
+# Bootstrap statistics are shared with the face identity metrics through a package at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmark_stats import (DEFAULT_RESAMPLES, bootstrap_cell_means, sign_flip_cell_sums, percentile_ci,
+                             permutation_p_values)
 
 def load_results(result_type="standard"):
     """Load results based on type"""
@@ -22,11 +30,11 @@ def load_results(result_type="standard"):
         raise ValueError(f"Unknown result type: {result_type}")
     
     filepath = result_files[result_type]
-    if not os.path.exists(filepath):
+    if not os.path.exists(filepath) and not os.path.exists(log_path_for(filepath)):
         raise FileNotFoundError(f"Results file not found: {filepath}")
-        
-    with open(filepath, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    
+    # Streams the JSONL results log when the evaluation wrote one
+    return load_evaluation_results(filepath)
 
 def load_comparison_results():
     """Load all available results for comparison"""
@@ -41,8 +49,8 @@ def load_comparison_results():
     
     return results
 
-def calculate_category_stats(results):
-    """Calculate statistics by category"""
+def calculate_category_stats(results, n_resamples=DEFAULT_RESAMPLES, confidence=0.95, seed=0):
+    """Calculate statistics by category, with bootstrap CIs of the average WiScore ('ci_low'/'ci_high')"""
     category_stats = defaultdict(lambda: {
         'scores': [], 
         'modified_count': 0, 
@@ -81,8 +89,66 @@ def calculate_category_stats(results):
         stats['modification_rate'] = (stats['modified_count'] / stats['total_count'] * 100) if stats['total_count'] > 0 else 0
         stats['perfect_rate'] = (stats['perfect_scores'] / stats['total_count'] * 100) if stats['total_count'] > 0 else 0
     
+    # Bootstrap every category at once
+    if n_resamples and category_stats:
+        categories = sorted(category_stats)
+        scores = np.concatenate([category_stats[c]['scores'] for c in categories])
+        codes = np.repeat(np.arange(len(categories)), [len(category_stats[c]['scores']) for c in categories])
+        _, _, resampled = bootstrap_cell_means(scores, codes, n_resamples, seed)
+        ci_low, ci_high = percentile_ci(resampled, confidence)
+        for i, category in enumerate(categories):
+            category_stats[category]['ci_low'] = float(ci_low[i])
+            category_stats[category]['ci_high'] = float(ci_high[i])
+    
     return dict(category_stats)
 
+def compare_result_types(comparison_results, n_resamples=DEFAULT_RESAMPLES, seed=0):
+    """
+    Paired permutation tests of WiScore between evaluation modes.
+    
+    Samples are matched on sample_id, so each pair of modes is compared on the same
+    prompts; tests are reported overall and per category.
+    """
+    by_type = {
+        result_type: {r['sample_id']: r for r in results['individual_results'] if 'sample_id' in r}
+        for result_type, results in comparison_results.items()
+    }
+    comparisons = []
+    result_types = list(by_type)
+    for i, type_a in enumerate(result_types):
+        for type_b in result_types[i+1:]:
+            shared_ids = sorted(set(by_type[type_a]) & set(by_type[type_b]))
+            if not shared_ids:
+                continue
+            categories = sorted({by_type[type_a][sample_id]['category'] for sample_id in shared_ids})
+            category_index = {category: k for k, category in enumerate(categories)}
+            differences = np.array([by_type[type_a][sample_id]['wiscore'] - by_type[type_b][sample_id]['wiscore']
+                                    for sample_id in shared_ids])
+            codes = np.array([category_index[by_type[type_a][sample_id]['category']] for sample_id in shared_ids])
+            _, sizes, observed, null = sign_flip_cell_sums(differences, codes, n_resamples, seed)
+            
+            # Overall test is the sum over categories of the same sign flips
+            overall_p = permutation_p_values(observed.sum(keepdims=True), null.sum(axis=1, keepdims=True))[0]
+            category_p = permutation_p_values(observed, null)
+            comparisons.append({
+                'type_a': type_a,
+                'type_b': type_b,
+                'category': 'Overall',
+                'samples': len(shared_ids),
+                'mean_diff': float(differences.mean()),
+                'p_value': float(overall_p)
+            })
+            for k, category in enumerate(categories):
+                comparisons.append({
+                    'type_a': type_a,
+                    'type_b': type_b,
+                    'category': category,
+                    'samples': int(sizes[k]),
+                    'mean_diff': float(observed[k] / sizes[k]),
+                    'p_value': float(category_p[k])
+                })
+    return comparisons
+
 def get_benchmark_comparison(category_stats):
     """Compare with WISE benchmark data"""
     benchmarks = get_wise_benchmark_data()
@@ -210,13 +276,14 @@ def generate_markdown_report(results, result_type="standard"):
     report += f"""
 ## Detailed Results by Category
 
-| Category | WiScore | Consistency | Realism | Aesthetic | Perfect Scores | Samples |
-|---|---|---|---|---|---|---|
+| Category | WiScore | 95% CI | Consistency | Realism | Aesthetic | Perfect Scores | Samples |
+|---|---|---|---|---|---|---|---|
 """
     
     for category, stats in sorted_categories:
         category_clean = category.replace('Physical Knowledge', 'Physics').replace('Cultural knowledge', 'Cultural')
-        report += f"| **{category_clean}** | {stats['average']:.3f} | {stats['consistency_avg']:.2f} | {stats['realism_avg']:.2f} | {stats['aesthetic_avg']:.2f} | {stats['perfect_scores']}/{stats['total_count']} | {stats['total_count']} |\n"
+        ci = f"{stats['ci_low']:.3f}-{stats['ci_high']:.3f}" if 'ci_low' in stats else "n/a"
+        report += f"| **{category_clean}** | {stats['average']:.3f} | {ci} | {stats['consistency_avg']:.2f} | {stats['realism_avg']:.2f} | {stats['aesthetic_avg']:.2f} | {stats['perfect_scores']}/{stats['total_count']} | {stats['total_count']} |\n"
     
     # Top performers analysis
     report += f"""
@@ -551,6 +618,16 @@ def main():
             
             print(f"    {result_type} reports saved")
         
+        if len(comparison_results) > 1:
+            comparisons = compare_result_types(comparison_results)
+            with open('wise_evaluation_results/wise_mode_comparison.json', 'w', encoding='utf-8') as f:
+                json.dump(comparisons, f, indent=2)
+            print(f"\nPaired mode comparison (sign-flip permutation test, {DEFAULT_RESAMPLES} resamples):")
+            for comparison in comparisons:
+                if comparison['category'] == 'Overall':
+                    print(f"  {comparison['type_a']} - {comparison['type_b']}: {comparison['mean_diff']:+.3f} "
+                          f"(p={comparison['p_value']:.4f}, {comparison['samples']} shared samples)")
+        
         print(f"\nAll reports generated successfully!")
         print(f"Location: wise_evaluation_results/")
         
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Persistent SQLite cache of GPT-4o judgments.
+
+A judgment is stored under (image content hash, prompt id, judge model, hash of
+the judge's instructions and image preprocessing, temperature, protocol
+version) with the raw evaluation text and the parsed scores, and is looked up
+before any API call, so resuming after a crash or rebuilding reports does not
+pay to re-judge images already scored the same way. The instructions hash
+covers the text of the request (system prompt, protocol and prompt), so editing
+any of it misses the cache. Bump the protocol version when judging changes in a
+way the text does not show (e.g. the score parser), and purge what the old
+protocol left behind:
+
+    python judge_cache.py stats --db wise_evaluation_results/judge_cache.sqlite
+    python judge_cache.py purge --protocol 2 --db ...   # drop judgments of other protocol versions
+    python judge_cache.py clear --db ...
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from benchmark_utils import file_sha256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS judgments (
+    image_sha256 TEXT NOT NULL,
+    prompt_id TEXT NOT NULL,
+    model TEXT NOT NULL,
+    instructions_sha256 TEXT NOT NULL,
+    temperature REAL NOT NULL,
+    protocol TEXT NOT NULL,
+    evaluation TEXT NOT NULL,
+    scores TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (image_sha256, prompt_id, model, instructions_sha256, temperature, protocol)
+);
+"""
+
+KEY_COLUMNS = ('image_sha256', 'prompt_id', 'model', 'instructions_sha256', 'temperature', 'protocol')
+
+
+def instructions_sha256(messages, extra=None):
+    """Hash of the roles and text of chat messages plus `extra` settings; image parts are left out"""
+    parts = []
+    for message in messages:
+        content = message['content']
+        if isinstance(content, str):
+            parts.append([message['role'], content])
+        else:
+            parts.append([message['role']] + [part['text'] for part in content if part.get('type') == 'text'])
+    if extra:
+        parts.append(extra)
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class JudgeCache:
+    """Judgments keyed by image content and judge configuration, shared by threads"""
+
+    def __init__(self, path, protocol='1'):
+        self.path = str(path)
+        self.protocol = str(protocol)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self._lock = threading.Lock()
+        self._hashes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _image_hash(self, image_path):
+        stat = os.stat(image_path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        cached = self._hashes.get(image_path)
+        if cached is None or cached[0] != signature:
+            cached = self._hashes[image_path] = (signature, file_sha256(image_path))
+        return cached[1]
+
+    def key(self, image_path, prompt_id, model, messages, temperature, extra=None):
+        """
+        Cache key of judging image_path with `messages` (only their text is
+        hashed); `extra` holds other settings that change the request, such as
+        image preprocessing.
+        """
+        return (self._image_hash(str(image_path)), '' if prompt_id is None else str(prompt_id), model,
+                instructions_sha256(messages, extra), float(temperature), self.protocol)
+
+    def get(self, key):
+        """{'evaluation': text, 'scores': dict} cached under key, or None"""
+        where = ' AND '.join(f"{column} = ?" for column in KEY_COLUMNS)
+        with self._lock:
+            row = self.conn.execute(f"SELECT evaluation, scores FROM judgments WHERE {where}", key).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return {'evaluation': row[0], 'scores': json.loads(row[1])}
+
+    def put(self, key, evaluation, scores):
+        with self._lock, self.conn:
+            self.conn.execute(f"INSERT OR REPLACE INTO judgments ({', '.join(KEY_COLUMNS)}, evaluation, scores, "
+                              f"created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                              key + (evaluation, json.dumps(scores), time.time()))
+
+    def purge(self, protocol=None):
+        """Delete judgments of every protocol but `protocol` (default: this cache's); returns how many"""
+        with self._lock, self.conn:
+            return self.conn.execute("DELETE FROM judgments WHERE protocol != ?",
+                                     (str(protocol or self.protocol),)).rowcount
+
+    def clear(self):
+        """Delete every judgment; returns how many"""
+        with self._lock, self.conn:
+            return self.conn.execute("DELETE FROM judgments").rowcount
+
+    def stats(self):
+        """Judgment counts per (model, protocol)"""
+        with self._lock:
+            rows = self.conn.execute("SELECT model, protocol, COUNT(*) FROM judgments "
+                                     "GROUP BY model, protocol ORDER BY model, protocol").fetchall()
+        return {(model, protocol): count for model, protocol, count in rows}
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def judge_cache(path, protocol='1'):
+    """The process-wide JudgeCache at `path`, opened on first use"""
+    with _caches_lock:
+        cache = _caches.get(str(path))
+        if cache is None:
+            cache = _caches[str(path)] = JudgeCache(path, protocol=protocol)
+        return cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or invalidate the GPT-4o judgment cache')
+    parser.add_argument('command', choices=('stats', 'purge', 'clear'))
+    parser.add_argument('--db', default='wise_evaluation_results/judge_cache.sqlite', help='Cache database')
+    parser.add_argument('--protocol', default=None, help='purge: protocol version to keep')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"No judge cache at {args.db}")
+        return
+    with JudgeCache(args.db) as cache:
+        if args.command == 'stats':
+            stats = cache.stats()
+            for (model, protocol), count in stats.items():
+                print(f"{model} (protocol {protocol}): {count} judgments")
+            print(f"Total: {sum(stats.values())} judgments")
+        elif args.command == 'purge':
+            if args.protocol is None:
+                parser.error('purge needs --protocol, the version to keep')
+            print(f"Deleted {cache.purge(args.protocol)} judgments from other protocol versions")
+        else:
+            print(f"Deleted {cache.clear()} judgments")
+
+
+if __name__ == '__main__':
+    main()
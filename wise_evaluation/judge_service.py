@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Shared GPT-4o judge service for WISE scoring.
+
+One JudgeService per process holds a single pooled OpenAI client (and an
+AsyncOpenAI one for asyncio callers), one retry/backoff policy and one
+requests-per-minute / tokens-per-minute budget, so every judge worker or
+thread draws from the same limits instead of each hammering the API on its own:
+
+    judge = get_judge(api_key=OPENAI_API_KEY, model="gpt-4o", rpm=500, tpm=30000)
+    text = judge.complete(messages, max_tokens=500)              # threads
+    text = await judge.acomplete(messages, max_tokens=500)       # asyncio
+
+Each request reserves its estimated tokens (text at ~4 characters per token,
+images by OpenAI's 512px tile rule, plus max_tokens) before it is sent; the
+estimate is settled against the reported usage afterwards. A 429 pauses the
+whole budget for its Retry-After instead of letting every worker retry at once.
+"""
+
+import sys
+import math
+import time
+import random
+import asyncio
+import threading
+from pathlib import Path
+
+import openai
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from flymy_client import parse_retry_after
+
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+IMAGE_BASE_TOKENS = 85
+IMAGE_TILE_TOKENS = 170
+
+
+def estimate_image_tokens(width, height, detail='high'):
+    """Prompt tokens of one image: 85 plus 170 per 512px tile after OpenAI's resizing"""
+    if detail == 'low':
+        return IMAGE_BASE_TOKENS
+    # Fit inside 2048x2048, then scale the shortest side down to 768
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return IMAGE_BASE_TOKENS + IMAGE_TILE_TOKENS * tiles
+
+
+def estimate_text_tokens(messages):
+    """Rough prompt tokens of the text parts of chat messages"""
+    chars = 0
+    for message in messages:
+        content = message['content']
+        if isinstance(content, str):
+            chars += len(content)
+        else:
+            chars += sum(len(part.get('text', '')) for part in content if part.get('type') == 'text')
+    return chars // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS * len(messages)
+
+
+class UsageBudget:
+    """
+    Requests-per-minute and tokens-per-minute token buckets shared by threads
+    and event loops. reserve() takes from the budget up front (going into debt
+    if need be) and returns how long the caller must wait before sending.
+    """
+
+    def __init__(self, rpm=None, tpm=None, burst_seconds=10.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        # Hold at most burst_seconds of budget so a cold start does not fire a whole minute at once
+        self.request_capacity = max(1.0, rpm * burst_seconds / 60) if rpm else None
+        self.token_capacity = max(1.0, tpm * burst_seconds / 60) if tpm else None
+        self.requests = self.request_capacity
+        self.tokens = self.token_capacity
+        self.paused_until = 0.0
+        self.throttles = 0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self.requests = min(self.request_capacity, self.requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self.tokens = min(self.token_capacity, self.tokens + elapsed * self.tpm / 60)
+
+    def reserve(self, tokens):
+        """Take one request and `tokens` tokens; returns seconds to wait before sending"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            delay = max(0.0, self.paused_until - now)
+            if self.rpm:
+                self.requests -= 1
+                if self.requests < 0:
+                    delay = max(delay, -self.requests * 60 / self.rpm)
+            if self.tpm:
+                # A request bigger than the burst would otherwise never fit
+                self.tokens -= min(tokens, self.token_capacity)
+                if self.tokens < 0:
+                    delay = max(delay, -self.tokens * 60 / self.tpm)
+            return delay
+
+    def settle(self, reserved, used):
+        """Return the difference between a reservation and the tokens actually used"""
+        if not self.tpm or used is None:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.token_capacity, self.tokens + min(reserved, self.token_capacity) - used)
+
+    def pause(self, seconds):
+        """Hold every request for `seconds`, e.g. after a 429"""
+        with self._lock:
+            self.throttles += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def retry_after(error):
+    """Retry-After of an OpenAI API error in seconds, or None"""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    milliseconds = response.headers.get('retry-after-ms')
+    if milliseconds:
+        try:
+            return float(milliseconds) / 1000
+        except ValueError:
+            pass
+    return parse_retry_after(response.headers.get('retry-after'))
+
+
+def retry_delay(error, attempt):
+    """Seconds to wait after `attempt` failures, or None if the error will not go away on retry"""
+    if isinstance(error, openai.APIStatusError) and not isinstance(error, (openai.RateLimitError,
+                                                                           openai.InternalServerError)):
+        if error.status_code not in (408, 409):
+            return None  # bad request, auth, content policy: retrying gets the same answer
+    if isinstance(error, openai.RateLimitError) and getattr(error, 'code', None) == 'insufficient_quota':
+        return None
+    delay = retry_after(error)
+    if delay is None:
+        delay = min(2 ** attempt, 60)
+    return delay + random.uniform(0, 1)
+
+
+class JudgeService:
+    """Pooled OpenAI chat client with shared retries and RPM/TPM throttling"""
+
+    errors = (openai.APIError,)
+
+    def __init__(self, api_key=None, model='gpt-4o', rpm=None, tpm=None, max_retries=5, timeout=60,
+                 max_connections=64, max_delay=600):
+        self.api_key = api_key
+        self.model = model
+        self.budget = UsageBudget(rpm, tpm)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_delay = max_delay
+        self._client = None
+        self._async_client = None
+        self._async_loop = None
+        self._lock = threading.Lock()
+
+    def _limits(self):
+        import httpx
+        return httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+
+    @property
+    def client(self):
+        """The process-wide synchronous client (thread-safe; retries are ours, not the SDK's)"""
+        with self._lock:
+            if self._client is None:
+                self._client = openai.OpenAI(api_key=self.api_key, max_retries=0, timeout=self.timeout,
+                                             http_client=openai.DefaultHttpxClient(limits=self._limits()))
+            return self._client
+
+    @property
+    def async_client(self):
+        """The AsyncOpenAI client of the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = openai.AsyncOpenAI(api_key=self.api_key, max_retries=0, timeout=self.timeout,
+                                                    http_client=openai.DefaultAsyncHttpxClient(limits=self._limits()))
+            self._async_loop = loop
+        return self._async_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+            self._async_loop = None
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def _request(self, messages, max_tokens, temperature):
+        return dict(model=self.model, messages=messages, max_tokens=max_tokens, temperature=temperature)
+
+    def _failed(self, error, attempt):
+        """Delay before the next attempt, or None to give up; a 429 holds back every caller"""
+        delay = retry_delay(error, attempt) if attempt < self.max_retries else None
+        if delay is not None:
+            delay = min(delay, self.max_delay)
+            if isinstance(error, openai.RateLimitError):
+                self.budget.pause(delay)
+        return delay
+
+    @staticmethod
+    def _used_tokens(response):
+        usage = getattr(response, 'usage', None)
+        return usage.total_tokens if usage is not None else None
+
+    def complete(self, messages, max_tokens=500, temperature=0.0, image_tokens=0):
+        """Send one chat completion and return the reply text, retrying transient errors"""
+        reserved = estimate_text_tokens(messages) + image_tokens + max_tokens
+        attempt = 0
+        while True:
+            time.sleep(self.budget.reserve(reserved))
+            try:
+                response = self.client.chat.completions.create(**self._request(messages, max_tokens, temperature))
+            except self.errors as e:
+                attempt += 1
+                delay = self._failed(e, attempt)
+                if delay is None:
+                    raise
+                print(f"GPT-4o request failed ({e}); retrying in {delay:.1f}s ({attempt}/{self.max_retries})")
+                time.sleep(delay)
+                continue
+            self.budget.settle(reserved, self._used_tokens(response))
+            return response.choices[0].message.content
+
+    async def acomplete(self, messages, max_tokens=500, temperature=0.0, image_tokens=0):
+        """Async complete(), on the pooled AsyncOpenAI client"""
+        reserved = estimate_text_tokens(messages) + image_tokens + max_tokens
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.budget.reserve(reserved))
+            try:
+                response = await self.async_client.chat.completions.create(
+                    **self._request(messages, max_tokens, temperature))
+            except self.errors as e:
+                attempt += 1
+                delay = self._failed(e, attempt)
+                if delay is None:
+                    raise
+                print(f"GPT-4o request failed ({e}); retrying in {delay:.1f}s ({attempt}/{self.max_retries})")
+                await asyncio.sleep(delay)
+                continue
+            self.budget.settle(reserved, self._used_tokens(response))
+            return response.choices[0].message.content
+
+
+_judges = {}
+_judges_lock = threading.Lock()
+
+
+def get_judge(name='gpt-4o', **settings):
+    """The process-wide JudgeService called `name`, created with `settings` on first use"""
+    with _judges_lock:
+        judge = _judges.get(name)
+        if judge is None:
+            judge = _judges[name] = JudgeService(**settings)
+        return judge
+
+
+async def close_judges():
+    """Close the async clients of every judge, before their event loop ends"""
+    for judge in list(_judges.values()):
+        await judge.aclose()
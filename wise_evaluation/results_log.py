@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Append-only JSONL log of WISE evaluation records.
+
+Each line is one record with a "type":
+
+    {"type": "run", "evaluation_date": ..., "model_info": ..., "diverse_sampling": ...}
+    {"type": "result", "sample_id": ..., "category": ..., "scores": {...}, "wiscore": ..., ...}
+    {"type": "failure", "sample_id": ..., "stage": "generation" | "judge", "timestamp": ...}
+
+Records are written in batches and fsynced, so a crash loses at most the last
+batch. Summary statistics are kept as running aggregates (RunningSummary) and
+the legacy evaluation_results.json is only materialized at checkpoints. Readers
+stream the log line by line; LogReader remembers its offset so repeated reads
+only parse what was appended since. A later result for a sample replaces an
+earlier one.
+"""
+
+import os
+import json
+import time
+from datetime import datetime
+
+MODEL_INFO = "FlyMy AI Bot (api.chat.flymy.ai)"
+
+
+def log_path_for(results_file):
+    """The JSONL log that sits next to a results JSON (evaluation_results.json -> .jsonl)"""
+    root, _ = os.path.splitext(str(results_file))
+    return root + '.jsonl'
+
+
+class EvaluationLog:
+    """Buffered, fsync-batched writer of JSONL evaluation records"""
+
+    def __init__(self, path, batch_size=16, flush_interval=5.0, truncate=False):
+        self.path = str(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'w' if truncate else 'a', encoding='utf-8')
+        # A crash mid-write leaves a partial last line; start the next append on a fresh line
+        if self._file.tell() > 0:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self._buffer.append('')
+
+    def append(self, record):
+        self._buffer.append(json.dumps(record))
+        if len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write buffered records and fsync them"""
+        if self._buffer:
+            self._file.write('\n'.join(self._buffer) + '\n')
+            self._buffer = []
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class RunningSummary:
+    """Running sums behind the WISE summary block, updated one result at a time"""
+
+    FIELDS = ('wiscore', 'consistency', 'realism', 'aesthetic_quality')
+
+    def __init__(self):
+        self.count = 0
+        self.sums = dict.fromkeys(self.FIELDS, 0.0)
+        self.category_sums = {}
+        self.category_counts = {}
+
+    @staticmethod
+    def _values(result):
+        scores = result['scores']
+        return {'wiscore': result['wiscore'], 'consistency': scores['consistency'],
+                'realism': scores['realism'], 'aesthetic_quality': scores['aesthetic_quality']}
+
+    def _update(self, result, sign):
+        for field, value in self._values(result).items():
+            self.sums[field] += sign * value
+        cat = result['category']
+        self.category_sums[cat] = self.category_sums.get(cat, 0.0) + sign * result['wiscore']
+        self.category_counts[cat] = self.category_counts.get(cat, 0) + sign
+        if self.category_counts[cat] == 0:
+            del self.category_sums[cat], self.category_counts[cat]
+        self.count += sign
+
+    def add(self, result, previous=None):
+        """Count a result, replacing `previous` (an earlier result for the same sample) if given"""
+        if previous is not None:
+            self._update(previous, -1)
+        self._update(result, 1)
+
+    def as_dict(self):
+        """The summary block of evaluation_results.json"""
+        if not self.count:
+            return {}
+        return {
+            "average_wiscore": self.sums['wiscore'] / self.count,
+            "average_consistency": self.sums['consistency'] / self.count,
+            "average_realism": self.sums['realism'] / self.count,
+            "average_aesthetic": self.sums['aesthetic_quality'] / self.count,
+            "category_scores": {cat: total / self.category_counts[cat] for cat, total in self.category_sums.items()}
+        }
+
+
+class EvaluationState:
+    """Results (last one per sample), failures and running summary folded from log records"""
+
+    def __init__(self):
+        self.results = {}
+        self.failed = set()
+        self.summary = RunningSummary()
+        self.run_info = {}
+
+    def apply(self, record):
+        kind = record.get('type')
+        if kind == 'result':
+            result = {k: v for k, v in record.items() if k != 'type'}
+            sample_id = result.get('sample_id')
+            self.summary.add(result, previous=self.results.get(sample_id))
+            self.results[sample_id] = result
+            self.failed.discard(sample_id)
+        elif kind == 'failure':
+            if record.get('sample_id') not in self.results:
+                self.failed.add(record.get('sample_id'))
+        elif kind == 'run':
+            self.run_info = {k: v for k, v in record.items() if k != 'type'}
+
+    def as_results_data(self):
+        """The evaluation_results.json structure the report scripts read"""
+        results = list(self.results.values())
+        return {
+            "evaluation_date": self.run_info.get('evaluation_date', datetime.now().isoformat()),
+            "model_info": self.run_info.get('model_info', MODEL_INFO),
+            "diverse_sampling": self.run_info.get('diverse_sampling', True),
+            "total_samples": len(results),
+            "successful_evaluations": len(results),
+            "failed_evaluations": len(self.failed),
+            "individual_results": results,
+            "summary": self.summary.as_dict()
+        }
+
+
+class LogReader:
+    """Incremental reader: each read() parses only lines appended since the previous call"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.offset = 0
+        self.state = EvaluationState()
+
+    def read(self):
+        """Fold new complete lines into self.state; returns how many records were read"""
+        if not os.path.exists(self.path):
+            return 0
+        count = 0
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # still being written; read it next time
+                self.offset += len(line)
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self.state.apply(record)
+                count += 1
+        return count
+
+
+def read_log(path):
+    """EvaluationState of a whole log"""
+    reader = LogReader(path)
+    reader.read()
+    return reader.state
+
+
+def write_results_json(results_file, results_data):
+    """Materialize the legacy results JSON atomically"""
+    tmp_path = f"{results_file}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(results_data, f, indent=2)
+    os.replace(tmp_path, results_file)
+
+
+def load_evaluation_results(results_file):
+    """
+    Results in the evaluation_results.json structure, read from the JSONL log
+    next to results_file when there is one and from results_file otherwise.
+    """
+    log_path = log_path_for(results_file)
+    if os.path.exists(log_path):
+        return read_log(log_path).as_results_data()
+    with open(results_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
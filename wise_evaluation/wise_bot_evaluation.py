@@ -7,11 +7,14 @@ import json
 import os
 import argparse
 import random
+import asyncio
 from datetime import datetime
 from pathlib import Path
 import pandas as pd
-from wise_utils import load_wise_dataset, evaluate_image_with_gpt4, find_processed_samples
+from wise_utils import load_wise_dataset, evaluate_image_with_gpt4_async, find_processed_samples
 from bot_api import FlyMyAIBot
+from judge_service import close_judges
+from results_log import MODEL_INFO, EvaluationLog, EvaluationState, log_path_for, read_log, write_results_json
 
 def select_diverse_samples(wise_data, total_samples=100):
     """Select diverse samples from different categories."""
@@ -64,55 +67,138 @@ def select_diverse_samples(wise_data, total_samples=100):
     
     return selected_samples
 
-def save_intermediate_results(results_file, all_results, failed_count, diverse_sampling):
-    """Save intermediate results after each successful evaluation."""
-    if all_results:
-        total_wiscore = sum(r['wiscore'] for r in all_results)
-        avg_wiscore = total_wiscore / len(all_results)
-        
-        avg_consistency = sum(r['scores']['consistency'] for r in all_results) / len(all_results)
-        avg_realism = sum(r['scores']['realism'] for r in all_results) / len(all_results)
-        avg_aesthetic = sum(r['scores']['aesthetic_quality'] for r in all_results) / len(all_results)
-        
-        # Calculate category breakdown
-        category_scores = {}
-        for result in all_results:
-            cat = result['category']
-            if cat not in category_scores:
-                category_scores[cat] = []
-            category_scores[cat].append(result['wiscore'])
-        
-        category_averages = {}
-        for cat, scores in category_scores.items():
-            category_averages[cat] = sum(scores) / len(scores)
-        
-        summary = {
-            "average_wiscore": avg_wiscore,
-            "average_consistency": avg_consistency,
-            "average_realism": avg_realism,
-            "average_aesthetic": avg_aesthetic,
-            "category_scores": category_averages
-        }
-    else:
-        summary = {}
-    
-    # Save results
-    output_data = {
-        "evaluation_date": datetime.now().isoformat(),
-        "model_info": "FlyMy AI Bot (api.chat.flymy.ai)",
-        "diverse_sampling": diverse_sampling,
-        "total_samples": len(all_results),
-        "successful_evaluations": len(all_results),
-        "failed_evaluations": failed_count,
-        "individual_results": all_results,
-        "summary": summary
+def save_checkpoint(results_file, state):
+    """Materialize evaluation_results.json from the running state of the results log."""
+    write_results_json(results_file, state.as_results_data())
+
+def wiscore_from_scores(scores):
+    """WiScore: weighted consistency, realism and aesthetics, scaled to 0-1"""
+    return (0.7 * scores['consistency'] + 0.2 * scores['realism'] + 0.1 * scores['aesthetic_quality']) / 2.0
+
+async def generate_sample(bot, client, sample, images_dir, position, total):
+    """Generate one sample's image; returns its path, or None on failure"""
+    sample_id = sample['id']
+    prompt = sample['prompt']
+    
+    print(f"--- Sample {position}/{total} (ID: {sample_id}) ---")
+    print(f"Category: {sample['category']} / {sample['subcategory']}")
+    print(f"Generating image for prompt: {prompt[:50]}...")
+    
+    # Generate unique filename
+    timestamp = int(datetime.now().timestamp())
+    image_filename = f"sample_{sample_id}_{timestamp}.png"
+    image_path = images_dir / image_filename
+    
+    # Generate image
+    success, original_prompt, final_prompt = await bot.agenerate_image(client, prompt, str(image_path))
+    
+    if not success:
+        print(f"Failed to generate image for sample {sample_id}")
+        return None
+    
+    print(f"Image saved to: {image_path}")
+    return image_path
+
+async def judge_sample(sample, image_path):
+    """Score a generated image with GPT-4o; returns the result record, or None on failure"""
+    sample_id = sample['id']
+    prompt = sample['prompt']
+    
+    # Evaluate with GPT-4o
+    print(f"Evaluating image for sample {sample_id} with GPT-4o...")
+    try:
+        # All judge workers share one pooled client and one RPM/TPM budget
+        scores = await evaluate_image_with_gpt4_async(str(image_path), prompt, prompt_id=sample_id)
+    except Exception as e:
+        print(f"Error evaluating sample {sample_id}: {e}")
+        return None
+    
+    if not scores:
+        print(f"Failed to evaluate sample {sample_id}")
+        return None
+    
+    # Calculate WiScore
+    wiscore = wiscore_from_scores(scores)
+    
+    # Show progress
+    print(f"Prompt: {prompt[:50]}...")
+    print(f"WiScore: {wiscore:.3f}")
+    print(f"Scores - Consistency: {scores['consistency']}, Realism: {scores['realism']}, Aesthetic: {scores['aesthetic_quality']}")
+    
+    return {
+        "sample_id": sample_id,
+        "category": sample['category'],
+        "subcategory": sample['subcategory'],
+        "prompt": prompt,
+        "image_path": str(image_path),
+        "model_used": "FlyMy AI Bot",
+        "scores": scores,
+        "wiscore": wiscore,
+        "timestamp": datetime.now().isoformat()
     }
+
+async def run_pipeline(bot, samples, images_dir, on_result, on_failure, gen_workers=4, judge_workers=4, queue_size=None):
+    """
+    Generate and judge samples in a two-stage pipeline.
+    
+    gen_workers generation workers feed judge_workers judge workers through a
+    queue of at most queue_size generated images (default: 2 per judge worker).
+    When judging falls behind, generation waits for room in the queue instead of
+    piling up unjudged images. on_result(result) and on_failure(sample, stage)
+    are called as samples finish, from the event loop thread.
+    """
+    queue_size = queue_size or 2 * judge_workers
+    pending = asyncio.Queue()
+    for position, sample in enumerate(samples, 1):
+        pending.put_nowait((position, sample))
+    generated = asyncio.Queue(maxsize=queue_size)
+    total = len(samples)
     
-    with open(results_file, 'w') as f:
-        json.dump(output_data, f, indent=2)
+    async def generation_worker(client):
+        while not pending.empty():
+            position, sample = pending.get_nowait()
+            image_path = await generate_sample(bot, client, sample, images_dir, position, total)
+            if image_path is None:
+                on_failure(sample, 'generation')
+            else:
+                await generated.put((sample, image_path))
+    
+    async def judge_worker():
+        while True:
+            item = await generated.get()
+            if item is None:
+                return
+            result = await judge_sample(*item)
+            if result is None:
+                on_failure(item[0], 'judge')
+            else:
+                on_result(result)
+    
+    async def generate_all():
+        async with bot.create_client(max_connections=max(1, gen_workers)) as client:
+            await asyncio.gather(*(generation_worker(client) for _ in range(max(1, min(gen_workers, total)))))
+        # Generation is done; let each judge finish the queue and stop
+        for _ in judges:
+            await generated.put(None)
+    
+    judges = [asyncio.create_task(judge_worker()) for _ in range(max(1, judge_workers))]
+    tasks = [asyncio.create_task(generate_all())] + judges
+    try:
+        # If a stage fails (e.g. on_result cannot write the log), stop the other instead of
+        # leaving generation blocked on a queue no judge will drain
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await close_judges()
 
-def run_wise_evaluation(continue_evaluation=False, samples_limit=None, diverse_sampling=True):
-    """Run WISE evaluation on FlyMy AI Bot."""
+def run_wise_evaluation(continue_evaluation=False, samples_limit=None, diverse_sampling=True,
+                        gen_workers=4, judge_workers=4, queue_size=None, checkpoint_every=50):
+    """Run WISE evaluation on FlyMy AI Bot, generating and judging samples concurrently."""
     
     print("=" * 80)
     print("WISE EVALUATION - FlyMy AI Bot")
@@ -131,14 +217,27 @@ def run_wise_evaluation(continue_evaluation=False, samples_limit=None, diverse_s
     
     images_dir.mkdir(exist_ok=True)
     
+    # Results are appended to a JSONL log; evaluation_results.json is rebuilt from it at checkpoints
+    log_path = log_path_for(results_file)
+    state = EvaluationState()
+    
     # Check for existing results if continuing
     existing_results = []
     processed_samples = set()
     
-    if continue_evaluation and results_file.exists():
-        with open(results_file, 'r') as f:
-            data = json.load(f)
-        existing_results = data.get('individual_results', [])
+    if continue_evaluation and (os.path.exists(log_path) or results_file.exists()):
+        if os.path.exists(log_path):
+            state = read_log(log_path)
+        else:
+            # Results from before the log existed: carry them over into a new log
+            with open(results_file, 'r') as f:
+                data = json.load(f)
+            with EvaluationLog(log_path) as log:
+                for result in data.get('individual_results', []):
+                    record = dict(result, type='result')
+                    log.append(record)
+                    state.apply(record)
+        existing_results = list(state.results.values())
         processed_samples = find_processed_samples(existing_results)
         print(f"Found {len(processed_samples)} already processed samples")
         
@@ -162,108 +261,71 @@ def run_wise_evaluation(continue_evaluation=False, samples_limit=None, diverse_s
             wise_data = select_diverse_samples(wise_data, total_samples)
         else:
             wise_data = wise_data[:total_samples]
+        # A fresh evaluation replaces earlier results, as the results JSON always did
+        with open(log_path, 'w'):
+            pass
     
-    # Initialize bot
-    bot = FlyMyAIBot()
+    # Generation (FlyMy) and judging (GPT-4o) overlap in a two-stage pipeline
+    log = EvaluationLog(log_path)
+    run_record = {"type": "run", "evaluation_date": datetime.now().isoformat(), "model_info": MODEL_INFO,
+                  "diverse_sampling": diverse_sampling}
+    log.append(run_record)
+    state.apply(run_record)
+    new_results = 0
     
-    # Process samples
-    results = []
-    failed_count = 0
+    def record_failure(sample, stage):
+        record = {"type": "failure", "sample_id": sample['id'], "stage": stage,
+                  "timestamp": datetime.now().isoformat()}
+        log.append(record)
+        state.apply(record)
     
-    for i, sample in enumerate(wise_data, 1):
-        sample_id = sample['id']
-        prompt = sample['prompt']
-        category = sample['category']
-        subcategory = sample['subcategory']
-        
-        print(f"--- Sample {i}/{len(wise_data)} (ID: {sample_id}) ---")
-        print(f"Category: {category} / {subcategory}")
-        print(f"Generating image for prompt: {prompt[:50]}...")
-        
-        # Generate unique filename
-        timestamp = int(datetime.now().timestamp())
-        image_filename = f"sample_{sample_id}_{timestamp}.png"
-        image_path = images_dir / image_filename
-        
-        # Generate image
-        success, original_prompt, final_prompt = bot.generate_image(prompt, str(image_path))
-        
-        if not success:
-            print(f"Failed to generate image for sample {sample_id}")
-            failed_count += 1
-            # Save intermediate results even on failure
-            all_results = existing_results + results
-            save_intermediate_results(results_file, all_results, failed_count, diverse_sampling)
-            continue
-        
-        print(f"Image saved to: {image_path}")
-        
-        # Evaluate with GPT-4o
-        print("Evaluating image with GPT-4o...")
-        try:
-            scores = evaluate_image_with_gpt4(str(image_path), prompt)
-            
-            if not scores:
-                print(f"Failed to evaluate sample {sample_id}")
-                failed_count += 1
-                continue
-            
-            # Calculate WiScore
-            wiscore = (0.7 * scores['consistency'] + 0.2 * scores['realism'] + 0.1 * scores['aesthetic_quality']) / 2.0
-            
-            # Store result
-            result = {
-                "sample_id": sample_id,
-                "category": category,
-                "subcategory": subcategory,
-                "prompt": prompt,
-                "image_path": str(image_path),
-                "model_used": "FlyMy AI Bot",
-                "scores": scores,
-                "wiscore": wiscore,
-                "timestamp": datetime.now().isoformat()
-            }
-            
-            results.append(result)
-            
-            # Show progress
-            print(f"Prompt: {prompt[:50]}...")
-            print(f"WiScore: {wiscore:.3f}")
-            print(f"Scores - Consistency: {scores['consistency']}, Realism: {scores['realism']}, Aesthetic: {scores['aesthetic_quality']}")
-            
-            # SAVE INTERMEDIATE RESULTS after each successful evaluation
-            all_results = existing_results + results
-            save_intermediate_results(results_file, all_results, failed_count, diverse_sampling)
-            print(f"✅ Progress saved ({len(all_results)} total samples)")
-            
-        except Exception as e:
-            print(f"Error evaluating sample {sample_id}: {e}")
-            failed_count += 1
-            continue
-    
-    # Final save (already done incrementally, but for completeness)
-    all_results = existing_results + results
-    save_intermediate_results(results_file, all_results, failed_count, diverse_sampling)
+    def record_result(result):
+        nonlocal new_results
+        record = dict(result, type='result')
+        log.append(record)
+        state.apply(record)
+        new_results += 1
+        print(f"✅ Progress logged ({len(state.results)} total samples)")
+        if checkpoint_every and new_results % checkpoint_every == 0:
+            log.flush()
+            save_checkpoint(results_file, state)
+    
+    try:
+        asyncio.run(run_pipeline(FlyMyAIBot(), wise_data, images_dir, record_result, record_failure,
+                                 gen_workers=gen_workers, judge_workers=judge_workers, queue_size=queue_size))
+    finally:
+        log.close()
+        # Final checkpoint
+        save_checkpoint(results_file, state)
     
     print(f"\nEvaluation complete!")
-    print(f"Results saved to: {results_file}")
+    print(f"Results saved to: {results_file} (log: {log_path})")
     print(f"Images saved to: {images_dir}")
-    if all_results:
-        avg_wiscore = sum(r['wiscore'] for r in all_results) / len(all_results)
-        print(f"Average WiScore: {avg_wiscore:.3f}")
+    if state.results:
+        print(f"Average WiScore: {state.summary.as_dict()['average_wiscore']:.3f}")
 
 def main():
     parser = argparse.ArgumentParser(description='Run WISE evaluation on FlyMy AI Bot')
     parser.add_argument('--continue', action='store_true', help='Continue from existing results')
     parser.add_argument('--samples', type=int, help='Limit number of samples to evaluate')
     parser.add_argument('--no-diverse', action='store_true', help='Disable diverse sampling')
+    parser.add_argument('--gen-workers', type=int, default=4, help='Images generated concurrently')
+    parser.add_argument('--judge-workers', type=int, default=4, help='Images judged by GPT-4o concurrently')
+    parser.add_argument('--queue-size', type=int, default=None,
+                        help='Generated images allowed to wait for a judge (default: 2 per judge worker)')
+    parser.add_argument('--checkpoint-every', type=int, default=50,
+                        help='Rewrite evaluation_results.json from the log every N results (0: only at the end)')
     
     args = parser.parse_args()
     
     run_wise_evaluation(
         continue_evaluation=getattr(args, 'continue'), 
         samples_limit=args.samples,
-        diverse_sampling=not args.no_diverse
+        diverse_sampling=not args.no_diverse,
+        gen_workers=args.gen_workers,
+        judge_workers=args.judge_workers,
+        queue_size=args.queue_size,
+        checkpoint_every=args.checkpoint_every
     )
 
 if __name__ == "__main__":
@@ -3,14 +3,13 @@
 Detailed WISE metrics table with subcategory breakdown
 """
 
-import json
 import pandas as pd
 from collections import defaultdict
+from results_log import load_evaluation_results
 
 def load_results():
     """Load evaluation results"""
-    with open('wise_evaluation_results/evaluation_results.json', 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return load_evaluation_results('wise_evaluation_results/evaluation_results.json')
 
 def create_detailed_metrics_table():
     """Create detailed metrics table"""
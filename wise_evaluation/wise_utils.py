@@ -6,11 +6,18 @@ Avoids code duplication between different scripts
 
 import json
 import os
-import base64
 import re
+import sys
+import asyncio
 from pathlib import Path
-from openai import OpenAI
-from config import WISE_EVALUATION_CONFIG, OPENAI_API_KEY
+from config import (WISE_EVALUATION_CONFIG, OPENAI_API_KEY, MAX_RETRIES, TIMEOUT_SECONDS, JUDGE_RPM, JUDGE_TPM,
+                    JUDGE_CACHE_FILE, JUDGE_PROTOCOL_VERSION, JUDGE_IMAGE_SETTINGS, JUDGE_IMAGE_WORKERS)
+from judge_service import get_judge, estimate_image_tokens
+from judge_cache import judge_cache
+from results_log import load_evaluation_results as load_results_file
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from image_prep import ImagePreprocessor
 
 def load_wise_dataset():
     """Load WISE dataset from JSON files"""
@@ -40,58 +47,128 @@ def load_wise_dataset():
     
     return wise_data
 
-def evaluate_image_with_gpt4(image_path, prompt):
-    """Evaluate image using GPT-4o with WISE criteria"""
+def get_wise_judge():
+    """The shared GPT-4o judge: one pooled client and one RPM/TPM budget for all judge workers"""
     if not OPENAI_API_KEY:
         raise ValueError("OpenAI API key not found. Add OPENAI_API_KEY to your .env file")
-    
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    
-    # Encode image
-    with open(image_path, "rb") as image_file:
-        base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-    
-    try:
-        response = client.chat.completions.create(
-            model=WISE_EVALUATION_CONFIG["model"],
-            messages=[
+    return get_judge(api_key=OPENAI_API_KEY, model=WISE_EVALUATION_CONFIG["model"], rpm=JUDGE_RPM, tpm=JUDGE_TPM,
+                     max_retries=MAX_RETRIES, timeout=TIMEOUT_SECONDS)
+
+_judge_images = None
+
+def get_judge_images():
+    """The process pool that downscales and re-encodes images for the judge"""
+    global _judge_images
+    if _judge_images is None:
+        _judge_images = ImagePreprocessor(workers=JUDGE_IMAGE_WORKERS, **JUDGE_IMAGE_SETTINGS)
+    return _judge_images
+
+def get_wise_judge_cache():
+    """The judgment cache at JUDGE_CACHE_FILE, or None when caching is disabled"""
+    if not JUDGE_CACHE_FILE:
+        return None
+    return judge_cache(JUDGE_CACHE_FILE, protocol=JUDGE_PROTOCOL_VERSION)
+
+def build_evaluation_messages(prompt, image_url):
+    """GPT-4o messages for judging one image with WISE criteria"""
+    return [
+        {
+            "role": "system",
+            "content": WISE_EVALUATION_CONFIG["system_prompt"]
+        },
+        {
+            "role": "user",
+            "content": [
                 {
-                    "role": "system",
-                    "content": WISE_EVALUATION_CONFIG["system_prompt"]
+                    "type": "text",
+                    "text": f"PROMPT: {prompt}"
                 },
                 {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"PROMPT: {prompt}"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64_image}"
-                            }
-                        }
-                    ]
+                    "type": "image_url",
+                    "image_url": {
+                        "url": image_url
+                    }
                 }
-            ],
+            ]
+        }
+    ]
+
+def prepare_evaluation(image_path, prompt, prompt_id=None):
+    """
+    Look the judgment up in the cache and, on a miss, downscale and encode the
+    image. Returns (cache key, cached judgment or None, messages, estimated image tokens).
+    """
+    key = None
+    cache = get_wise_judge_cache()
+    if cache is not None:
+        key = cache.key(image_path, prompt_id, WISE_EVALUATION_CONFIG["model"], build_evaluation_messages(prompt, ""),
+                        WISE_EVALUATION_CONFIG["temperature"], extra=JUDGE_IMAGE_SETTINGS)
+        cached = cache.get(key)
+        if cached is not None:
+            return key, cached, None, 0
+    
+    # Resized and re-encoded in the preprocessing pool, with the MIME type of what is actually sent
+    image_url, size = get_judge_images().data_url(image_path)
+    return key, None, build_evaluation_messages(prompt, image_url), estimate_image_tokens(*size)
+
+def finish_evaluation(key, evaluation_text):
+    """Parse the scores of a fresh judgment and cache both, unless a score could not be parsed"""
+    scores = extract_scores_from_evaluation(evaluation_text)
+    # A refusal or off-format reply scores 0 by default; judge the image again next time
+    if key is not None and all_scores_parsed(evaluation_text):
+        get_wise_judge_cache().put(key, evaluation_text, scores)
+    return scores
+
+def evaluate_image_with_gpt4(image_path, prompt, prompt_id=None):
+    """Evaluate image using GPT-4o with WISE criteria (cached judgments are reused)"""
+    key, cached, messages, image_tokens = prepare_evaluation(image_path, prompt, prompt_id)
+    if cached is not None:
+        return cached["scores"]
+    judge = get_wise_judge()
+    
+    try:
+        evaluation_text = judge.complete(
+            messages,
             max_tokens=WISE_EVALUATION_CONFIG["max_tokens"],
-            temperature=WISE_EVALUATION_CONFIG["temperature"]
+            temperature=WISE_EVALUATION_CONFIG["temperature"],
+            image_tokens=image_tokens
         )
+        return finish_evaluation(key, evaluation_text)
         
-        evaluation_text = response.choices[0].message.content
-        scores = extract_scores_from_evaluation(evaluation_text)
-        
-        return scores
+    except Exception as e:
+        print(f"Error in GPT-4o evaluation: {e}")
+        raise
+
+async def evaluate_image_with_gpt4_async(image_path, prompt, prompt_id=None):
+    """evaluate_image_with_gpt4 on the shared async client, for asyncio judge workers"""
+    key, cached, messages, image_tokens = await asyncio.to_thread(prepare_evaluation, image_path, prompt, prompt_id)
+    if cached is not None:
+        return cached["scores"]
+    judge = get_wise_judge()
+    
+    try:
+        evaluation_text = await judge.acomplete(
+            messages,
+            max_tokens=WISE_EVALUATION_CONFIG["max_tokens"],
+            temperature=WISE_EVALUATION_CONFIG["temperature"],
+            image_tokens=image_tokens
+        )
+        return await asyncio.to_thread(finish_evaluation, key, evaluation_text)
         
     except Exception as e:
         print(f"Error in GPT-4o evaluation: {e}")
         raise
 
+SCORE_PATTERN = r"(Consistency|Realism|Aesthetic Quality)\s*:\s*(\d)"
+
+def all_scores_parsed(evaluation_text):
+    """Whether GPT evaluation text gives a score for all three criteria"""
+    matches = re.findall(SCORE_PATTERN, evaluation_text, re.IGNORECASE)
+    return {criterion.lower() for criterion, _ in matches} == {"consistency", "realism", "aesthetic quality"}
+
 def extract_scores_from_evaluation(evaluation_text):
     """Extract numerical scores from GPT evaluation text"""
-    score_pattern = r"(Consistency|Realism|Aesthetic Quality)\s*:\s*(\d)"
-    matches = re.findall(score_pattern, evaluation_text, re.IGNORECASE)
+    matches = re.findall(SCORE_PATTERN, evaluation_text, re.IGNORECASE)
     
     scores = {
         "consistency": 0,
@@ -111,8 +188,7 @@ def extract_scores_from_evaluation(evaluation_text):
 
 def load_evaluation_results():
     """Load the bot evaluation results"""
-    with open('wise_evaluation_results/evaluation_results.json', 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return load_results_file('wise_evaluation_results/evaluation_results.json')
 
 def calculate_category_scores(results_data):
     """Calculate detailed category-wise scores from individual results"""